@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+import numpy as np
+from statistics import NormalDist
+from engine import IMMEDIATE, DELAYED, SERVICE_MEANS, TRAVEL_SCALE, TRAVEL_MU, TRAVEL_SIGMA, sll_surv_probs, load_params
+
+"""
+Analytic approximations
+Erlang C (M/M/c) waits per hospital and class, an instant survival estimate for a
+scenario and a control variate that uses it to cut the variance of replications
+
+The estimate treats the incident as a pickup phase: the ambulances make round trips
+at rate n_ambs/(mean round trip), the selection sets the share of patients of each
+class sent to each hospital and (first/last) which class goes first. A hospital class
+queue gets patients at its share of that rate, waits are Erlang C when it keeps up
+and a growing fluid backlog when it can't, and survival is the sll curve at the
+treatment start averaged over the pickup window, with the patients picked up in
+waves of n_ambs. Patients sent where there are no servers never start treatment
+and add nothing, as in the engine. Arrivals over time (arrival_log, arrival_rate)
+are not modelled, the scene starts with every patient.
+
+random: class in proportion to the scene, any hospital, both classes throughout
+first/last: immediate (last: delayed) patients first, any hospital
+myopic: its loop over the hospitals nearly always ends on the delayed class and the
+hospital is random, approximated as last
+"""
+
+GRID = 64               # points of the pickup window survival is averaged over
+
+"""
+erlang_c
+probability an arrival waits in an M/M/c queue with c servers and offered load
+a = arrival rate*mean service, numpy arrays broadcast, 1 when a >= c (and with no servers)
+"""
+def erlang_c(servers, load):
+    servers = np.asarray(servers, dtype=float)
+    load = np.asarray(load, dtype=float)
+    shape = np.broadcast(servers, load).shape
+    servers, load = np.broadcast_to(servers, shape), np.broadcast_to(load, shape)
+    # Erlang B by its recursion, stable for any number of servers
+    b = np.ones(shape)
+    for k in range(1, int(servers.max()) + 1 if servers.size else 1):
+        step = k <= servers
+        b = np.where(step, load*b/(k + load*b), b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c = servers*b/(servers - load*(1 - b))
+    return np.where(load < servers, c, 1.0)
+
+# expected wait in queue of an M/M/c queue, inf when it doesn't keep up
+def mmc_wait(servers, arrival_rate, mean_service):
+    servers = np.asarray(servers, dtype=float)
+    arrival_rate = np.asarray(arrival_rate, dtype=float)
+    load = arrival_rate*mean_service
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wait = erlang_c(servers, load)*mean_service/(servers - load)
+    return np.where(load < servers, wait, np.inf)
+
+"""
+mean_times
+mean travel time to each hospital (n_hos,) and mean treatment time per class at
+each hospital (2, n_hos) of a scenario, from the fitted parameters where there are
+any (see engine.load_params) and the engine defaults otherwise
+"""
+def mean_times(scenario, params=None):
+    params = load_params(scenario.get("params") if params is None else params)
+    distances = np.array(scenario["hos_dists"], dtype=float)
+    fitted = params.get("hospitals", [])
+    fitted = [fitted[h] if h < len(fitted) else {} for h in range(len(distances))]
+    mu = np.array([h.get("travel_mu", params.get("travel_mu", TRAVEL_MU)) for h in fitted])
+    sigma = np.array([h.get("travel_sigma", params.get("travel_sigma", TRAVEL_SIGMA)) for h in fitted])
+    scale = params.get("travel_scale", TRAVEL_SCALE)
+    # mean of the lognormal travel time
+    travel = scale*np.exp(mu*distances + (sigma*distances)**2/2)
+    means = params.get("service_means", SERVICE_MEANS)
+    service_means = np.array([h.get("service_means", means) for h in fitted], dtype=float).T.reshape(2, len(distances))
+    return travel, service_means
+
+"""
+mandalay_mixes
+every patient mix the mandalay bay draw (batch.mandalay_bay) can give with its probability:
+total uniform on 200..250 and immediate round(uniform(.1, .4)*total)
+returns n_imm, n_del and weight arrays
+"""
+def mandalay_mixes():
+    total = np.arange(200, 251)[:, None]
+    k = np.arange(0, 251)[None, :]
+    # uniform(.1, .4)*total rounds to k on [k - .5, k + .5)
+    low = np.clip(k - .5, .1*total, .4*total)
+    high = np.clip(k + .5, .1*total, .4*total)
+    weight = (high - low)/(.3*total)/total.size
+    keep = weight > 0
+    n_imm = np.broadcast_to(k, keep.shape)[keep]
+    return n_imm, np.broadcast_to(total, keep.shape)[keep] - n_imm, weight[keep]
+
+"""
+Approximation Object
+Input:
+Scenario, in Simulation.true_init parameter names = scenario
+Patient selection = selection
+Fitted parameters = params (see engine.load_params)
+
+survival(n_imm, n_del) is the approximate expected total survival, arrays work
+table(n_imm, n_del) has the per hospital and class rates, loads, Erlang C and waits
+"""
+class Approximation(object):
+    def __init__(self, scenario, selection="random", params=None):
+        # myopic picks like last (see above)
+        self.selection = "last" if selection == "myopic" else selection
+        self.n_ambs = scenario["n_ambs"]
+        self.n_hos = len(scenario["hos_dists"])
+        self.servers = np.array([scenario["imm_servers"], scenario["del_servers"]], dtype=float)
+        self.travel, self.service_means = mean_times(scenario, params)
+
+        # share of each class's patients sent to each hospital
+        if self.selection in ("random", "first", "last"):
+            self.split = np.full((2, self.n_hos), 1.0/self.n_hos)
+        else:
+            raise ValueError("no approximation for selection %r" % selection)
+
+    # patients per minute the fleet delivers, each class travelling to its split of hospitals
+    def _pickup_rate(self, shares):
+        round_trip = 2*(shares[..., :, None]*self.split*self.travel).sum(axis=(-1, -2))
+        return self.n_ambs/round_trip
+
+    def _phases(self, n_imm, n_del):
+        n = np.stack([n_imm, n_del], axis=-1).astype(float)
+        total = n.sum(axis=-1, keepdims=True)
+        if self.selection in ("first", "last"):
+            first = IMMEDIATE if self.selection == "first" else DELAYED
+            # one class after the other, each at the rate of its own round trips
+            rates = np.stack([self._pickup_rate(np.eye(2)[c]*np.ones_like(n)) for c in (IMMEDIATE, DELAYED)], axis=-1)
+            durations = n/rates
+            starts = np.zeros_like(n)
+            starts[..., 1 - first] = durations[..., first]
+        else:
+            shares = n/np.maximum(total, 1)
+            rate = self._pickup_rate(shares)[..., None]
+            durations = np.broadcast_to(total/rate, n.shape)
+            starts = np.zeros_like(n)
+        return n, starts, durations
+
+    def table(self, n_imm, n_del):
+        n, starts, durations = self._phases(np.asarray(n_imm), np.asarray(n_del))
+        arrival_rate = (n/np.maximum(durations, 1e-12))[..., :, None]*self.split
+        load = arrival_rate*self.service_means
+        return {"arrival_rate": arrival_rate, "load": load, "utilization": load/np.maximum(self.servers, 1),
+                "erlang_c": erlang_c(self.servers, load), "wait": mmc_wait(self.servers, arrival_rate, self.service_means),
+                "pickup_start": starts, "pickup_end": starts + durations}
+
+    def survival(self, n_imm, n_del):
+        n_imm, n_del = np.asarray(n_imm), np.asarray(n_del)
+        n, starts, durations = self._phases(n_imm, n_del)
+        arrival_rate = (n/np.maximum(durations, 1e-12))[..., :, None]*self.split
+        capacity = self.servers/self.service_means
+        wait = mmc_wait(self.servers, arrival_rate, self.service_means)
+        # pickup times across the window, (..., 2, n_hos, GRID), the fleet leaves in waves
+        # of n_ambs patients a round trip apart, the first at the start of the window
+        u = (np.arange(GRID) + .5)/GRID
+        phase = n if self.selection in ("first", "last") else n.sum(axis=-1, keepdims=True)
+        phase = np.maximum(phase, 1)[..., :, None, None]
+        elapsed = np.floor(u*phase/self.n_ambs)*self.n_ambs/phase*durations[..., :, None, None]
+        pickup = starts[..., :, None, None] + elapsed
+        overloaded = (arrival_rate >= capacity)[..., None]
+        # a queue that can't keep up has a backlog growing at arrival_rate - capacity
+        backlog_wait = elapsed*(arrival_rate/np.maximum(capacity, 1e-12) - 1)[..., None]
+        wait = np.where(overloaded, backlog_wait, np.where(np.isfinite(wait), wait, 0.0)[..., None])
+        treatment = pickup + self.travel[:, None] + wait
+        probs = sll_surv_probs(np.moveaxis(treatment, -1, 0))
+        served = (self.servers > 0)
+        patients = n[..., :, None]*self.split*served
+        return (patients*np.moveaxis(probs, 0, -1).mean(axis=-1)).sum(axis=(-1, -2))
+
+"""
+control_variate
+Y the replication survivals, n_imm and n_del their patient mixes, mix_mean the exact
+expected approximation under the scenario's patient mix draw
+X = approximation.survival(n_imm, n_del) is correlated with Y and E[X] = mix_mean, so
+Y - beta*(X - mix_mean) has the same mean and, with beta = cov(X, Y)/var(X), less variance
+returns the plain and controlled (mean, 95% half width), beta and the variance ratio
+"""
+def control_variate(survival, n_imm, n_del, approximation, mix_mean, confidence=.95):
+    y = np.asarray(survival, dtype=float)
+    x = approximation.survival(np.asarray(n_imm), np.asarray(n_del))
+    n = len(y)
+    z = NormalDist().inv_cdf(.5 + confidence/2)
+    plain = (y.mean(), z*y.std(ddof=1)/np.sqrt(n))
+    if n < 3 or x.var() == 0:
+        return {"plain": plain, "controlled": plain, "beta": 0.0, "ratio": 1.0}
+    beta = np.cov(x, y)[0, 1]/x.var(ddof=1)
+    controlled = y - beta*(x - mix_mean)
+    # one degree of freedom goes to beta
+    half = z*controlled.std(ddof=2)/np.sqrt(n)
+    return {"plain": plain, "controlled": (controlled.mean(), half), "beta": beta,
+            "ratio": controlled.var(ddof=2)/y.var(ddof=1)}
+
+"""
+mix_mean
+exact expected approximate survival over the mandalay bay patient mix, every
+possible mix weighted by its probability
+n_imm or n_del fixes that class as batch.setup does (the scenario's n_imm, n_del),
+the other still comes from the draw
+"""
+def mix_mean(approximation, n_imm=None, n_del=None):
+    mix_imm, mix_del, weight = mandalay_mixes()
+    mix_imm = mix_imm if n_imm is None else np.full(mix_imm.shape, n_imm)
+    mix_del = mix_del if n_del is None else np.full(mix_del.shape, n_del)
+    return float((weight*approximation.survival(mix_imm, mix_del)).sum())
+
+# table() of one patient mix as printable lines, one per class and hospital
+def format_table(table):
+    lines = ["class      hospital  patients/min  load  utilization  erlang c  wait (min)"]
+    for c, name in enumerate(["IMMEDIATE", "DELAYED"]):
+        for h in range(table["load"].shape[-1]):
+            lines.append("%-10s %8d  %12.3f  %4.1f  %11.3f  %8.3f  %10.1f" % (
+                name, h, table["arrival_rate"][c, h], table["load"][c, h], table["utilization"][c, h],
+                table["erlang_c"][c, h], table["wait"][c, h]))
+    return "\n".join(lines)
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+import numpy as np
+import csv
+from engine import IMMEDIATE, DELAYED, BIG
+
+"""
+Scene arrival processes
+Casualties found over time instead of all being at the scene at t=0
+
+Every process is a generator of (time, patient type) in time order, the engine
+(Simulation(arrivals=...)) only ever holds the next arrival so a log of any size
+is replayed in constant memory
+
+poisson_arrivals: Poisson process with a constant or time-varying rate
+csv_arrivals: rows of time,type streamed from a csv incident log
+binary_arrivals: records streamed from a binary incident log (ARRIVAL_DTYPE)
+"""
+
+# binary incident log record: minutes since the incident, IMMEDIATE or DELAYED
+ARRIVAL_DTYPE = np.dtype([('time', '<f8'), ('patient_type', '<i1')])
+CHUNK = 65536           # records read from a binary log at a time
+
+TYPE_NAMES = {"0": IMMEDIATE, "1": DELAYED, "immediate": IMMEDIATE, "delayed": DELAYED,
+              "imm": IMMEDIATE, "del": DELAYED}
+
+"""
+poisson_arrivals
+rate: patients per minute, a number or a function of time
+rate_max: upper bound of rate(t), needed when rate is a function (thinning)
+p_imm: probability an arrival is IMMEDIATE
+horizon: no arrivals after this time
+limit: stop after this many arrivals
+rng: numpy Generator or seed the times and types are drawn from
+"""
+def poisson_arrivals(rate, p_imm=0.25, horizon=BIG, limit=None, rate_max=None, rng=None):
+    rng = np.random.default_rng(rng)
+    if callable(rate):
+        if rate_max is None:
+            raise ValueError("rate_max is needed to thin a time-varying rate")
+    else:
+        rate_max = rate
+        rate = None
+    if rate_max <= 0:
+        return
+    time = 0.0
+    count = 0
+    while limit is None or count < limit:
+        time += rng.exponential(1.0/rate_max)
+        if time > horizon:
+            return
+        # thinning: keep the candidate with probability rate(t)/rate_max
+        if rate is not None and rng.random()*rate_max > rate(time):
+            continue
+        count += 1
+        yield time, IMMEDIATE if rng.random() < p_imm else DELAYED
+
+"""
+piecewise_rate
+rate function for poisson_arrivals from [(start time, rate), ...] sorted by start time,
+the rate is 0 before the first start time
+returns (rate function, largest rate)
+"""
+def piecewise_rate(points):
+    points = sorted(points)
+    starts = [start for start, rate in points]
+    rates = [rate for start, rate in points]
+    def rate(time):
+        i = np.searchsorted(starts, time, side='right') - 1
+        return rates[i] if i >= 0 else 0.0
+    return rate, max(rates)
+
+"""
+rate_end
+the last start time of [(start time, rate), ...] when the rate there is 0, after it
+nobody else arrives, BIG when the rate stays positive for ever
+"""
+def rate_end(points):
+    start, rate = sorted(points)[-1]
+    return start if rate == 0 else BIG
+
+def parse_type(text):
+    key = text.strip().lower()
+    if key not in TYPE_NAMES:
+        raise ValueError("unknown patient type %r in incident log" % text)
+    return TYPE_NAMES[key]
+
+"""
+csv_arrivals
+streams time,type rows from a csv file one row at a time, a header row is skipped
+type is 0/1 or immediate/delayed (imm/del)
+"""
+def csv_arrivals(path):
+    with open(path, newline='') as infile:
+        for row in csv.reader(infile):
+            if len(row) < 2:
+                continue
+            try:
+                time = float(row[0])
+            except ValueError:
+                # header
+                continue
+            yield time, parse_type(row[1])
+
+"""
+binary_arrivals
+streams ARRIVAL_DTYPE records from a binary file CHUNK records at a time
+"""
+def binary_arrivals(path, chunk=CHUNK):
+    with open(path, 'rb') as infile:
+        while True:
+            records = np.fromfile(infile, dtype=ARRIVAL_DTYPE, count=chunk)
+            if len(records) == 0:
+                return
+            for time, patient_type in zip(records['time'].tolist(), records['patient_type'].tolist()):
+                yield time, patient_type
+
+# writes any (time, type) iterable as a binary incident log, chunk by chunk
+def write_binary_arrivals(path, arrivals, chunk=CHUNK):
+    buffer = np.empty(chunk, dtype=ARRIVAL_DTYPE)
+    n = 0
+    with open(path, 'wb') as outfile:
+        for time, patient_type in arrivals:
+            buffer[n] = (time, patient_type)
+            n += 1
+            if n == chunk:
+                buffer.tofile(outfile)
+                n = 0
+        buffer[:n].tofile(outfile)
+
+# picks the reader from the file extension, .bin/.dat are binary, anything else csv
+def log_arrivals(path):
+    if path.endswith('.bin') or path.endswith('.dat'):
+        return binary_arrivals(path)
+    return csv_arrivals(path)
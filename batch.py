@@ -0,0 +1,474 @@
+#!/usr/bin/python3
+import numpy as np
+import csv
+import itertools
+import os
+import time
+import queue
+import threading
+from collections import namedtuple
+from interactive import Simulation
+
+REPLICATIONS = 100      # how many replications the Test button runs
+ARRIVAL_STREAM = 1      # scene arrivals of replication seed come from default_rng([seed, ARRIVAL_STREAM])
+CHUNK = 4               # seeds per pool task in replications()
+IN_FLIGHT = 4           # chunks per worker replications() keeps submitted
+
+# mandalay bay test
+# immediate patients: uniform(10-40)% of uniform(200-250) total patients
+# hospital distances: 5.59, 4.24, 6.95
+# hospital imm servers: 6, 5, 0
+# hospital del servers: 15, 12, 8
+# 30 ambulances
+# scenarios use the parameter names of Simulation.true_init, leaving out
+# n_imm and n_del draws them from the mandalay bay patient mix
+# casualties found over time are given by
+#   "arrival_log": path of a csv or binary incident log (see arrivals.py), or
+#   "arrival_rate": [[start time, patients per minute], ...] a piecewise constant Poisson rate
+#   with "arrival_imm" (share of immediate patients, default .25) and "arrival_horizon" (minutes),
+#   needed unless the rate ends at 0
+# and then n_imm and n_del (patients there at time 0) default to 0
+# "params": fitted travel and treatment parameters (see calibration.py)
+MANDALAY_BAY = {"n_ambs": 30, "hos_dists": [5.59, 4.24, 6.95], "imm_servers": [6, 5, 0], "del_servers": [15, 12, 8]}
+
+"""
+mandalay_bay
+draws the number of immediate and delayed patients for replication number seed,
+or from a numpy Generator
+"""
+def mandalay_bay(seed):
+    rng = np.random.default_rng(seed)
+    total_patients = int(rng.integers(200, 251))
+    perc_imm = rng.uniform(.1, .4)
+    num_imm = int(round(perc_imm*total_patients))
+    num_del = total_patients - num_imm
+    return num_imm, num_del
+
+"""
+arrival_horizon
+the time the scenario's Poisson arrivals (arrival_rate) stop: its arrival_horizon or,
+sooner, the start of a final rate of 0
+ValueError when the rate list is empty or negative, or nothing stops the arrivals
+"""
+def arrival_horizon(scenario):
+    import arrivals
+    points = scenario["arrival_rate"]
+    if not points or any(rate < 0 for start, rate in points):
+        raise ValueError("arrival_rate needs [start time, rate] pairs with rates of 0 or more")
+    horizon = min(scenario.get("arrival_horizon", arrivals.BIG), arrivals.rate_end(points))
+    if not 0 <= horizon < arrivals.BIG:
+        raise ValueError("arrival_rate ends at a positive rate, give an arrival_horizon (minutes) or end the rate at 0")
+    return horizon
+
+"""
+scenario_arrivals
+the scene arrival process of the scenario for replication number seed, None if everyone is there at time 0
+"""
+def scenario_arrivals(scenario, seed):
+    import arrivals
+    if "arrival_log" in scenario:
+        return arrivals.log_arrivals(scenario["arrival_log"])
+    if "arrival_rate" in scenario:
+        rate, rate_max = arrivals.piecewise_rate(scenario["arrival_rate"])
+        return arrivals.poisson_arrivals(rate, scenario.get("arrival_imm", .25), arrival_horizon(scenario),
+                                         rate_max=rate_max, rng=np.random.default_rng([seed, ARRIVAL_STREAM]))
+    return None
+
+"""
+setup
+the Simulation of one replication of the scenario (mandalay bay by default) with
+the given selection, set up and not yet run, and its # immediate and # delayed
+patients at time 0 (see simulate for trace, sketches and log)
+"""
+def setup(seed, selection="random", scenario=MANDALAY_BAY, trace=None, sketches=None, log=None):
+    # the engine goes on drawing from the generator the patient mix came from,
+    # so a seed gives the same mix and the same random numbers under every selection
+    rng = np.random.default_rng(seed)
+    num_imm, num_del = mandalay_bay(rng)
+    found = scenario_arrivals(scenario, seed)
+    if found is not None:
+        num_imm, num_del = 0, 0
+    num_imm = scenario.get("n_imm", num_imm)
+    num_del = scenario.get("n_del", num_del)
+    hos_dists = scenario["hos_dists"]
+    s = Simulation()
+    s.true_init(num_imm, num_del, scenario["n_ambs"], len(hos_dists), hos_dists,
+                scenario["imm_servers"], scenario["del_servers"], selection, seed=rng, verbose=False, arrivals=found, trace=trace,
+                params=scenario.get("params"), sketches=sketches, log=log)
+    return s, num_imm, num_del
+
+"""
+simulate
+runs one replication of the scenario (mandalay bay by default) with the given selection
+trace records or replays the travel and treatment times (see traces.py)
+sketches collects the quantile sketches of the patients (see stats.py)
+log records every event (see eventlog.py)
+returns the finished Simulation and its [total survival probability, served, # immediate, # delayed]
+"""
+def simulate(seed, selection="random", scenario=MANDALAY_BAY, trace=None, sketches=None, log=None):
+    s, num_imm, num_del = setup(seed, selection, scenario, trace, sketches, log)
+    s.run()
+    # count everyone who turned up, not just the patients there at time 0
+    num_imm = num_imm + s.patients_found[0]
+    num_del = num_del + s.patients_found[1]
+    return s, [s.total_survival_probability, s.served, num_imm, num_del]
+
+"""
+replicate
+the observation [total survival probability, served, # immediate, # delayed] of simulate()
+lives at module level so the worker processes can unpickle it
+"""
+def replicate(seed, selection="random", scenario=MANDALAY_BAY, trace=None):
+    return simulate(seed, selection, scenario, trace)[1]
+
+def _replicate_task(task):
+    return replicate(*task)
+
+"""
+make_pool
+a spawn context worker pool for run_many, None (serial) when workers == 1
+"""
+def make_pool(workers=None):
+    if workers == 1:
+        return None
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+"""
+run_many
+runs replicate(seed, selection, scenario) for every (seed, selection, scenario) task,
+in the pool from make_pool or serially when pool is None
+returns the observations in task order
+"""
+def run_many(tasks, pool=None):
+    if pool is None:
+        return [replicate(*task) for task in tasks]
+    tasks = list(tasks)
+    # a few chunks per cpu keeps the pool busy without pickling every task on its own
+    chunksize = max(1, len(tasks)//(4*(os.cpu_count() or 1)))
+    return list(pool.map(_replicate_task, tasks, chunksize=chunksize))
+
+"""
+Record
+one replication of replications(): seed, total survival probability, served,
+# immediate and # delayed, observation() is the [survival, served, # immediate,
+# delayed] list the rest of the code (and the csv files) use
+"""
+class Record(namedtuple('Record', ['seed', 'survival', 'served', 'immediate', 'delayed'])):
+    __slots__ = ()
+
+    def observation(self):
+        return [self.survival, self.served, self.immediate, self.delayed]
+
+def _record(seed, selection, scenario):
+    survival, served, n_imm, n_del = replicate(seed, selection, scenario)
+    return Record(seed, float(survival), int(served), int(n_imm), int(n_del))
+
+def _record_chunk(task):
+    seeds, selection, scenario = task
+    return [_record(seed, selection, scenario) for seed in seeds]
+
+"""
+replications
+yields a Record for every seed as its replication finishes, order "completion"
+(as they come in) or "seed" (in the order of seeds)
+workers == 1 runs them one by one in this process, otherwise they run in chunks of
+chunk seeds in pool, or in a pool of its own (make_pool(workers)) when none is given
+Only IN_FLIGHT chunks per worker are submitted or held back for seed order at a
+time, so memory doesn't grow with the number of seeds, which can be any iterable,
+even an endless one. Closing the generator (a break, an exception, ^C in the
+consumer) cancels the chunks that haven't started
+"""
+def replications(seeds, selection="random", scenario=MANDALAY_BAY, workers=None, order="completion", chunk=CHUNK, pool=None):
+    if order not in ("completion", "seed"):
+        raise ValueError("order must be completion or seed, not %r" % order)
+    seeds = iter(seeds)
+    if pool is None and workers == 1:
+        for seed in seeds:
+            yield _record(seed, selection, scenario)
+        return
+
+    from concurrent.futures import wait, FIRST_COMPLETED
+    chunks = iter(lambda: list(itertools.islice(seeds, chunk)), [])
+    own = pool is None
+    if own:
+        pool = make_pool(workers)
+    window = IN_FLIGHT*(workers or os.cpu_count() or 1)
+    pending = {}        # future: chunk number
+    held = {}           # chunk number: records waiting for the chunks before them
+    submitted = 0
+    following = 0       # the next chunk to yield in seed order
+    try:
+        while True:
+            while len(pending) + len(held) < window:
+                part = next(chunks, None)
+                if part is None:
+                    break
+                pending[pool.submit(_record_chunk, (part, selection, scenario))] = submitted
+                submitted += 1
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                number = pending.pop(future)
+                if order == "completion":
+                    yield from future.result()
+                else:
+                    held[number] = future.result()
+            while following in held:
+                yield from held.pop(following)
+                following += 1
+    finally:
+        for future in pending:
+            future.cancel()
+        if own:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+"""
+SharedRows Object
+fixed width result rows, one per replication, in a multiprocessing.shared_memory
+block that the worker processes write straight into, each into its own slice, so
+no results are pickled on the way back
+
+rows is a numpy structured array (ROW_DTYPE) over the block, done marks the rows
+written so far; summary() reduces them in place and observations() gives them as
+[survival, served, # immediate, # delayed] lists
+The creator unlinks the block in close() (or at the end of a with block), nothing
+read from rows is valid after that
+"""
+ROW_DTYPE = np.dtype([('seed', np.int64), ('survival', np.float64), ('served', np.int32),
+                      ('immediate', np.int32), ('delayed', np.int32), ('done', np.bool_)])
+
+class SharedRows(object):
+    def __init__(self, n, name=None):
+        from multiprocessing import shared_memory
+        self.n = n
+        self.owner = name is None
+        # a block can't be empty
+        self.block = shared_memory.SharedMemory(name=name, create=self.owner, size=max(1, n*ROW_DTYPE.itemsize))
+        self.rows = np.ndarray((n,), dtype=ROW_DTYPE, buffer=self.block.buf)
+
+    @property
+    def name(self):
+        return self.block.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.rows is None:
+            return
+        # the block won't unmap while a numpy view of it is alive
+        self.rows = None
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+    # the rows written so far, the whole array (no copy) once every row is in
+    def finished(self):
+        done = self.rows['done']
+        return self.rows if done.all() else self.rows[done]
+
+    def summary(self):
+        rows = self.finished()
+        n = len(rows)
+        survival = rows['survival']
+        half = 1.96*survival.std(ddof=1)/np.sqrt(n) if n > 1 else None
+        return {"replications": n, "mean_survival": float(survival.mean()) if n else None,
+                "half_width": None if half is None else float(half),
+                "mean_served": float(rows['served'].mean()) if n else None,
+                "mean_immediate": float(rows['immediate'].mean()) if n else None,
+                "mean_delayed": float(rows['delayed'].mean()) if n else None}
+
+    def observations(self):
+        rows = self.finished()
+        return [list(row) for row in zip(rows['survival'].tolist(), rows['served'].tolist(),
+                                         rows['immediate'].tolist(), rows['delayed'].tolist())]
+
+# a pool task of shared_replications, writes its seeds' rows and returns how many
+def _fill_rows(task):
+    name, n, start, seeds, selection, scenario = task
+    shared = SharedRows(n, name)
+    rows = shared.rows[start:start + len(seeds)]
+    try:
+        for i, seed in enumerate(seeds):
+            survival, served, n_imm, n_del = replicate(seed, selection, scenario)
+            rows[i] = (seed, survival, served, n_imm, n_del, True)
+    finally:
+        del rows
+        shared.close()
+    return len(seeds)
+
+"""
+shared_replications
+runs the seeds in chunks, each pool task writing its rows into one SharedRows: only
+the block's name and the task's slice go to the workers and a count comes back
+In pool, one of its own (make_pool(workers)), or in this process when workers == 1
+chunk defaults to IN_FLIGHT tasks per worker, callback(done, total) after every task
+returns the SharedRows, rows in seed order, for the caller to close
+"""
+def shared_replications(seeds, selection="random", scenario=MANDALAY_BAY, workers=None, pool=None, chunk=None, callback=None):
+    seeds = seeds if isinstance(seeds, range) else list(seeds)
+    n = len(seeds)
+    shared = SharedRows(n)
+    own = pool is None and workers != 1
+    if own:
+        pool = make_pool(workers)
+    futures = []
+    try:
+        if chunk is None:
+            chunk = max(1, -(-n//(IN_FLIGHT*(workers or os.cpu_count() or 1))))
+        tasks = [(shared.name, n, i, seeds[i:i + chunk], selection, scenario) for i in range(0, n, chunk)]
+        if pool is None:
+            finished = map(_fill_rows, tasks)
+        else:
+            from concurrent.futures import as_completed
+            futures = [pool.submit(_fill_rows, task) for task in tasks]
+            finished = (future.result() for future in as_completed(futures))
+        done = 0
+        for count in finished:
+            done += count
+            if callback is not None:
+                callback(done, n)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        shared.close()
+        raise
+    finally:
+        if own:
+            pool.shutdown(wait=False, cancel_futures=True)
+    return shared
+
+def _sketch_task(task):
+    seeds, selection, scenario = task
+    from stats import QuantileSketches
+    sketches = QuantileSketches(len(scenario["hos_dists"]))
+    for seed in seeds:
+        simulate(seed, selection, scenario, sketches=sketches)
+    return sketches
+
+"""
+sketch_quantiles
+runs the seeds in chunks, each worker collects one QuantileSketches for its chunk
+and the parent merges them, so only the sketches ever leave the workers
+returns the merged QuantileSketches
+"""
+def sketch_quantiles(seeds, selection="random", scenario=MANDALAY_BAY, pool=None, chunk=50):
+    from stats import QuantileSketches
+    seeds = list(seeds)
+    tasks = [(seeds[i:i + chunk], selection, scenario) for i in range(0, len(seeds), chunk)]
+    total = QuantileSketches(len(scenario["hos_dists"]))
+    parts = map(_sketch_task, tasks) if pool is None else pool.map(_sketch_task, tasks)
+    for sketches in parts:
+        total.merge(sketches)
+    return total
+
+"""
+write_results
+writes the observations to <selection>.csv the same way test() always has, row by
+row as obs (any iterable) gives them, so the rows before an interruption are kept
+returns the number of rows written
+"""
+def write_results(obs, selection):
+    rows = 0
+    with open(selection + '.csv', 'w') as writeFile:
+        writer = csv.writer(writeFile)
+        for tup in obs:
+            writer.writerow(tup)
+            writeFile.flush()
+            rows += 1
+    return rows
+
+"""
+BatchRun Object
+Runs replications() in a background thread for the gui
+
+Input:
+List of seeds, one per replication = seeds
+Patient selection = selection
+Scenario, in Simulation.true_init parameter names = scenario
+Number of worker processes = workers (defaults to the number of cpus)
+
+Keep track of:
+Replications done and their total survival, for the running mean
+Queue of Records in seed order filled in by the thread as replications finish
+Start time, for the replications per second and ETA
+
+start() starts the thread, poll() drains the queue without blocking so a Tk
+after() loop can call it, cancel() drops the replications that have not started
+yet and ignores the ones that are still running
+"""
+class BatchRun(object):
+    def __init__(self, seeds, selection="random", scenario=MANDALAY_BAY, workers=None):
+        self.seeds = list(seeds)
+        self.selection = selection
+        self.scenario = scenario
+        self.workers = workers
+        self.results = queue.Queue()
+        self.done = 0
+        self.total_survival = 0.0
+        self.cancelled = False
+        self.start_time = None
+        self.thread = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # the thread, only touches the thread safe queue
+    def _run(self):
+        # spawned workers, so they don't inherit the Tk interpreter of the gui
+        records = replications(self.seeds, self.selection, self.scenario, self.workers, order="seed")
+        try:
+            for record in records:
+                if self.cancelled:
+                    break
+                self.results.put(record)
+        except Exception as error:
+            self.results.put(error)
+        finally:
+            records.close()
+
+    def poll(self):
+        new = []
+        while True:
+            try:
+                record = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.cancelled:
+                continue
+            if isinstance(record, Exception):
+                self.cancel()
+                raise record
+            self.done += 1
+            self.total_survival += record.survival
+            new.append(record)
+        return new
+
+    def cancel(self):
+        self.cancelled = True
+
+    def finished(self):
+        return self.done == len(self.seeds)
+
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return time.time() - self.start_time
+
+    def rate(self):
+        if self.elapsed() == 0.0:
+            return 0.0
+        return self.done/self.elapsed()
+
+    def eta(self):
+        if self.rate() == 0.0:
+            return None
+        return (len(self.seeds) - self.done)/self.rate()
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+import numpy as np
+import json
+from engine import TRAVEL_SCALE, TRAVEL_MU, TRAVEL_SIGMA, SERVICE_MEANS
+
+"""
+Calibration
+Maximum likelihood fits of the travel and treatment models from historical records,
+written as the parameter file every Simulation loads (see engine.load_params)
+
+Travel: minutes = travel_scale*lognormal(travel_mu*distance, travel_sigma*distance)
+so z = log(minutes/travel_scale)/distance is normal(travel_mu, travel_sigma) and the
+MLE is the mean and (ddof 0) standard deviation of z
+Treatment: minutes = exponential(mean), the MLE is the sample mean
+
+Every fit is a handful of bincounts over the record arrays, pooled and per hospital
+(travel) or per hospital and class (treatment), so millions of rows take well under
+a second. A hospital with too few records keeps the pooled value.
+
+Record files are csv with a header row:
+transport: hospital,distance,minutes
+treatment: hospital,class,minutes (class 0 IMMEDIATE, 1 DELAYED)
+"""
+
+MIN_RECORDS = 2         # fewest records a hospital needs for its own fit
+
+# numeric csv into a (rows, columns) float array, a header row is skipped
+def load_records(path, columns=3):
+    with open(path) as infile:
+        first = infile.readline().split(',')
+    try:
+        float(first[0])
+        skip = 0
+    except ValueError:
+        skip = 1
+    return np.loadtxt(path, delimiter=',', skiprows=skip, usecols=range(columns), ndmin=2)
+
+# the hospital numbers and n_hos (one more than the largest if not given), ValueError unless every number is one of n_hos
+def _hospitals(hospital, n_hos):
+    hospital = np.asarray(hospital, dtype=np.intp)
+    n_hos = n_hos if n_hos is not None else int(hospital.max(initial=-1)) + 1
+    if len(hospital) and not (hospital.min() >= 0 and hospital.max() < n_hos):
+        raise ValueError("hospital numbers must be 0 to %d, not %d to %d" % (n_hos - 1, hospital.min(), hospital.max()))
+    return hospital, n_hos
+
+"""
+fit_travel
+hospital, distance, minutes: one entry per recorded trip
+returns (pooled (mu, sigma), per hospital mu array, sigma array, record counts)
+ValueError for a hospital number outside 0 to n_hos - 1
+"""
+def fit_travel(hospital, distance, minutes, n_hos=None, travel_scale=TRAVEL_SCALE):
+    hospital, n_hos = _hospitals(hospital, n_hos)
+    distance = np.asarray(distance, dtype=float)
+    minutes = np.asarray(minutes, dtype=float)
+    keep = (distance > 0) & (minutes > 0)
+    hospital, z = hospital[keep], np.log(minutes[keep]/travel_scale)/distance[keep]
+    if len(z) < MIN_RECORDS:
+        raise ValueError("need at least %d transport records with a positive distance and time" % MIN_RECORDS)
+    mu, sigma = z.mean(), z.std()
+    counts = np.bincount(hospital, minlength=n_hos)
+    sums = np.bincount(hospital, z, minlength=n_hos)
+    squares = np.bincount(hospital, z*z, minlength=n_hos)
+    enough = counts >= MIN_RECORDS
+    n = np.maximum(counts, 1)
+    mus = np.where(enough, sums/n, mu)
+    sigmas = np.where(enough, np.sqrt(np.maximum(squares/n - (sums/n)**2, 0.0)), sigma)
+    return (mu, sigma), mus, sigmas, counts
+
+"""
+fit_service
+hospital, patient_type, minutes: one entry per recorded treatment
+returns (pooled [imm, del] means, (n_hos, 2) means, (n_hos, 2) record counts)
+a class with no records keeps SERVICE_MEANS
+ValueError for a hospital number outside 0 to n_hos - 1 or a class other than 0 or 1
+"""
+def fit_service(hospital, patient_type, minutes, n_hos=None):
+    hospital, n_hos = _hospitals(hospital, n_hos)
+    patient_type = np.asarray(patient_type, dtype=np.intp)
+    minutes = np.asarray(minutes, dtype=float)
+    if not np.isin(patient_type, (0, 1)).all():
+        raise ValueError("classes must be 0 (IMMEDIATE) or 1 (DELAYED), not %s" % sorted(set(patient_type.tolist()) - {0, 1}))
+    class_counts = np.bincount(patient_type, minlength=2)
+    pooled = np.where(class_counts > 0, np.bincount(patient_type, minutes, minlength=2)/np.maximum(class_counts, 1), SERVICE_MEANS)
+    group = 2*hospital + patient_type
+    counts = np.bincount(group, minlength=2*n_hos).reshape(n_hos, 2)
+    sums = np.bincount(group, minutes, minlength=2*n_hos).reshape(n_hos, 2)
+    means = np.where(counts >= MIN_RECORDS, sums/np.maximum(counts, 1), pooled)
+    return pooled, means, counts
+
+"""
+calibrate
+fits whichever record sets are given (arrays of rows as load_records returns) and
+returns the parameter dict, per_hospital adds the "hospitals" list
+"""
+def calibrate(transport=None, treatment=None, n_hos=None, per_hospital=True, travel_scale=TRAVEL_SCALE):
+    if n_hos is None:
+        n_hos = 1 + int(max([records[:, 0].max() for records in (transport, treatment) if records is not None and len(records)] or [0]))
+    params = {"travel_scale": travel_scale, "travel_mu": TRAVEL_MU, "travel_sigma": TRAVEL_SIGMA,
+              "service_means": list(SERVICE_MEANS), "records": {}}
+    hospitals = [{} for i in range(n_hos)]
+    if transport is not None:
+        (mu, sigma), mus, sigmas, counts = fit_travel(transport[:, 0], transport[:, 1], transport[:, 2], n_hos, travel_scale)
+        params["travel_mu"], params["travel_sigma"] = float(mu), float(sigma)
+        params["records"]["transport"] = counts.tolist()
+        for h in range(n_hos):
+            hospitals[h]["travel_mu"], hospitals[h]["travel_sigma"] = float(mus[h]), float(sigmas[h])
+    if treatment is not None:
+        pooled, means, counts = fit_service(treatment[:, 0], treatment[:, 1], treatment[:, 2], n_hos)
+        params["service_means"] = pooled.tolist()
+        params["records"]["treatment"] = counts.tolist()
+        for h in range(n_hos):
+            hospitals[h]["service_means"] = means[h].tolist()
+    if per_hospital:
+        params["hospitals"] = hospitals
+    return params
+
+def write_params(params, path):
+    with open(path, 'w') as outfile:
+        json.dump(params, outfile, indent=2)
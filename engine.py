@@ -0,0 +1,909 @@
+#!/usr/bin/python3
+import numpy as np
+import asyncio
+import heapq
+import inspect
+import json
+import math
+import os
+from collections import deque
+from stats import TimeAverages
+from pqueue import IndexedHeap
+
+# bump when a change to the engine changes results, stored replications (registry.py) are keyed on it
+ENGINE_VERSION = "4"
+
+EMPTY = -1
+IMMEDIATE = 0           # magic number 0
+DELAYED = 1             # magic number 1
+BIG = 1.0e30            # magic number to set the initial delay so that it happens way after the first arrival
+
+# event kinds returned by next_event() and advance_time()
+PICKUP = 0
+DROPOFF = 1
+DEPARTURE = 2
+ARRIVAL = 3
+EVENT_NAMES = ["pickup event", "dropoff event", "patient departure", "scene arrival"]
+
+YIELD_EVERY = 256       # events decisions() handles before letting other coroutines run, without a pacer
+
+# survival probability betas for shifted log logistic
+sll_pen_imm = [0.3510, 35.838, 1.9886]          # shifted log logistic for penetrative wounds, immediate class
+sll_pen_del = [0.9124, 213.5976, 2.3445]        # shifted log logistic for penetrative wounds, delayed class
+immalpha = -0.0207
+delalpha = -0.0038
+SLL_BETAS = np.array([sll_pen_imm, sll_pen_del])        # row per class, for scoring every class at once
+ALPHAS = np.array([immalpha, delalpha])
+
+# travel time = TRAVEL_SCALE*lognormal(TRAVEL_MU*distance, TRAVEL_SIGMA*distance) minutes
+TRAVEL_SCALE = 60
+TRAVEL_MU = 0.025
+TRAVEL_SIGMA = 0.01
+LINEAR_TRAVEL = 1.5     # minutes per unit of distance for travel="linear"
+SERVICE_MEANS = [90, 180]       # mean minutes of treatment for IMMEDIATE, DELAYED
+PARAMS_ENV = "HOSPITAL_QUEUE_PARAMS"    # parameter file every Simulation loads when none is given
+
+"""
+load_params
+fitted travel and treatment parameters (see calibration.py), params is a dict, the path
+of a json parameter file, or None for the file named by $HOSPITAL_QUEUE_PARAMS
+returns {} when there is nothing to load, the built in constants are used then
+
+{"travel_scale": 60, "travel_mu": 0.025, "travel_sigma": 0.01, "service_means": [90, 180],
+ "hospitals": [{"travel_mu": ..., "travel_sigma": ..., "service_means": [imm, del]}, ...]}
+every key is optional, a hospital without its own value uses the pooled one
+"""
+_params_cache = {}
+def load_params(params=None):
+    if params is None:
+        params = os.environ.get(PARAMS_ENV)
+        if not params:
+            return {}
+    if isinstance(params, dict):
+        return params
+    # a file edited since it was loaded is read again
+    stat = os.stat(params)
+    key = (params, stat.st_size, stat.st_mtime_ns)
+    if key not in _params_cache:
+        with open(params) as infile:
+            _params_cache[key] = json.load(infile)
+    return _params_cache[key]
+
+# shifted log likelihood survival probability
+# works on floats and on numpy arrays of times
+def sll_surv_prob(time, t_class):
+    if (t_class == IMMEDIATE):
+        beta = sll_pen_imm
+    else:
+        beta = sll_pen_del
+    prob = beta[0]/(1 + (time/beta[1])**beta[2])
+    return prob
+
+# survival probability for both classes at once, times has shape (..., 2, n_hos)
+def sll_surv_probs(times):
+    beta = SLL_BETAS.T[:, :, None]
+    return beta[0]/(1 + (times/beta[1])**beta[2])
+
+"""
+Ambulance Object
+Keeps Track of:
+Patient on board (None when empty)
+Next Pickup (BIG while carrying a patient)
+Next Hospital Arrival (BIG while empty)
+"""
+class Ambulance(object):
+    __slots__ = ('number', 'patient', 'pickup_time', 'dropoff_time')
+
+    def __init__(self, number):
+        self.number = number
+        self.patient = None
+        self.pickup_time = 0.0
+        self.dropoff_time = BIG
+
+"""
+Hospital Object
+Keeps track of:
+Distance from Scene
+Servers per class = servers [imm, del]
+Busy servers per class = busy [imm, del]
+Waiting patients per class = queues [deque, deque] in order of arrival
+Patients in treatment = in_service, a heap of (departure time, patient number, patient)
+"""
+class Hospital(object):
+    __slots__ = ('number', 'distance', 'servers', 'busy', 'queues', 'in_service')
+
+    def __init__(self, number, distance, servers_imm, servers_del):
+        self.number = number
+        self.distance = distance
+        self.servers = [servers_imm, servers_del]
+        self.busy = [0, 0]
+        self.queues = [deque(), deque()]
+        self.in_service = []
+
+    @property
+    def servers_imm(self):
+        return self.servers[IMMEDIATE]
+
+    @property
+    def servers_del(self):
+        return self.servers[DELAYED]
+
+    # patients at the hospital, in treatment or waiting
+    @property
+    def patients_imm(self):
+        return self.busy[IMMEDIATE] + len(self.queues[IMMEDIATE])
+
+    @property
+    def patients_del(self):
+        return self.busy[DELAYED] + len(self.queues[DELAYED])
+
+    @property
+    def next_departure(self):
+        if self.in_service:
+            return self.in_service[0][0]
+        return BIG
+
+"""
+Patient Object
+Keeps track of:
+Patient Number (order of pickup)
+Patient Type
+Hospital Number
+Time picked up at the scene
+Time arrived at the hospital
+Time treatment started
+Time departing Service
+Survival probability (at the start of treatment)
+Location: 0 for not moved, 1 for ambulance, 2 for hospital, 3 for done
+"""
+class Patient(object):
+    __slots__ = ('number', 'patient_type', 'hospital_number', 'pickup_time', 'arrival_time',
+                 'treatment_time', 'departure_time', 'survival_probability', 'location')
+
+    def __init__(self, number, patient_type, hospital_number=-1, pickup_time=0.0):
+        self.number = number
+        self.patient_type = patient_type
+        self.hospital_number = hospital_number
+        self.pickup_time = pickup_time
+        self.arrival_time = BIG
+        self.treatment_time = BIG
+        self.departure_time = BIG
+        self.survival_probability = 0.0
+        self.location = 0
+
+"""
+StateView Object
+Read-only view of a Simulation handed to policies at every pickup
+Nothing is copied, every property reads the live state, and there are no setters
+so a policy can't change the simulation by accident
+
+scene: (# immediate, # delayed) patients waiting at the scene
+distances: distance to each hospital
+servers(h, c), busy(h, c), queue_length(h, c), patients(h, c): hospital h, class c
+travel_time(h), service_time(c, h): draws from the simulation's travel and treatment models
+rng: the random number source a policy should draw from
+"""
+class StateView(object):
+    __slots__ = ('_sim',)
+
+    def __init__(self, sim):
+        self._sim = sim
+
+    @property
+    def clock(self):
+        return self._sim.clock
+
+    @property
+    def scene(self):
+        return tuple(self._sim.scene)
+
+    @property
+    def n_hospitals(self):
+        return len(self._sim.hospitals)
+
+    @property
+    def distances(self):
+        return tuple(hospital.distance for hospital in self._sim.hospitals)
+
+    @property
+    def patients_picked_up(self):
+        return self._sim.patients_picked_up
+
+    @property
+    def served(self):
+        return self._sim.served
+
+    @property
+    def rng(self):
+        return self._sim.rng
+
+    def servers(self, hospital, patient_type):
+        return self._sim.hospitals[hospital].servers[patient_type]
+
+    def busy(self, hospital, patient_type):
+        return self._sim.hospitals[hospital].busy[patient_type]
+
+    def queue_length(self, hospital, patient_type):
+        return len(self._sim.hospitals[hospital].queues[patient_type])
+
+    def patients(self, hospital, patient_type):
+        h = self._sim.hospitals[hospital]
+        return h.busy[patient_type] + len(h.queues[patient_type])
+
+    def mean_service(self, patient_type, hospital=None):
+        if hospital is None:
+            return self._sim.service_means[patient_type]
+        return self._sim.hospital_service_means[hospital][patient_type]
+
+    # a random travel time to the hospital and treatment time there, drawn from rng
+    def travel_time(self, hospital):
+        return self._sim.draw_travel_time(self._sim.hospitals[hospital].distance, hospital)
+
+    def service_time(self, patient_type, hospital=None):
+        return self._sim.draw_service_time(patient_type, hospital)
+
+"""
+DecisionRequest Object
+a pickup waiting for a decision, yielded by Simulation.decisions(): the ambulance,
+the simulated time it has been waiting since, the patients at the scene then
+[imm, del] and the simulation's StateView, which stays up to date while it waits
+
+answer((patient type, hospital)) makes the decision, a ValueError (no such class,
+nobody of that class at the scene, no such hospital) leaves the pickup waiting
+Once the ambulance has left patient is the Patient picked up, await picked_up()
+waits for it
+"""
+class DecisionRequest(object):
+    def __init__(self, sim, time):
+        self.ambulance = sim.next_ambulance_to_pickup
+        self.since = time
+        self.scene = list(sim.scene)
+        self.view = sim.view
+        self.decision = None
+        self.error = None
+        self.patient = None
+        self._answered = None
+        self._picked_up = None
+
+    def __repr__(self):
+        return "DecisionRequest(ambulance=%d, since=%.1f, scene=%s)" % (self.ambulance, self.since, self.scene)
+
+    def answered(self):
+        return self.decision is not None
+
+    def answer(self, decision):
+        patient_type, hospital_number = decision
+        if self.decision is not None:
+            raise ValueError("the pickup already has a decision")
+        if patient_type not in (IMMEDIATE, DELAYED):
+            raise ValueError("patient type must be IMMEDIATE (0) or DELAYED (1)")
+        if self.view.scene[patient_type] <= 0:
+            raise ValueError("no %s patients left at the scene" % ("IMMEDIATE" if patient_type == IMMEDIATE else "DELAYED"))
+        if not 0 <= hospital_number < self.view.n_hospitals:
+            raise ValueError("there is no hospital number %s" % hospital_number)
+        self.decision = (int(patient_type), int(hospital_number))
+        self.error = None
+        if self._answered is not None and not self._answered.done():
+            self._answered.set_result(self.decision)
+
+    # the decision, waiting on asyncio for it to come in
+    async def wait(self):
+        if self.decision is None:
+            if self._answered is None:
+                self._answered = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._answered)
+        return self.decision
+
+    async def picked_up(self):
+        if self.patient is None:
+            if self._picked_up is None:
+                self._picked_up = asyncio.get_running_loop().create_future()
+            await asyncio.shield(self._picked_up)
+        return self.patient
+
+    def _done(self, patient):
+        self.patient = patient
+        if self._picked_up is not None and not self._picked_up.done():
+            self._picked_up.set_result(patient)
+
+# what Stepper's until() returns, decisions() stops at it until the next step
+class _Step(object):
+    def __await__(self):
+        return (yield self)
+
+"""
+Stepper Object
+drives Simulation.decisions() one event at a time without an event loop, for front
+ends that have their own (the Tk windows in interactive.py)
+step() handles the next event and returns the DecisionRequest when it is a pickup,
+which waits until answer(decision) does it (a ValueError leaves it waiting)
+on_event(kind) is called after every event, finished is True once the run is over
+"""
+class Stepper(object):
+    def __init__(self, sim, on_event=None):
+        self.sim = sim
+        self.on_event = on_event
+        self.request = None
+        self.finished = False
+        self._run = sim.decisions(self)
+        self._waiting = None
+        self._started = False
+
+    # the pacer decisions() asks, every event waits for a step
+    def until(self, time, request=None):
+        return _Step()
+
+    def now(self):
+        return self.sim.clock
+
+    def done(self, kind):
+        if self.on_event is not None:
+            self.on_event(kind)
+
+    def _resume(self, coroutine, value):
+        self._waiting = None
+        try:
+            coroutine.send(value)
+        except StopIteration as stop:
+            self.request = stop.value
+            return
+        except StopAsyncIteration:
+            self.finished = True
+            return
+        self._waiting = coroutine
+
+    def step(self):
+        if not self._started:
+            # up to the first event
+            self._started = True
+            self._resume(self._run.asend(None), None)
+        if self._waiting is not None and self.request is None:
+            self._resume(self._waiting, True)
+        return self.request
+
+    def answer(self, decision):
+        if self.request is None:
+            raise ValueError("no pickup is waiting for a decision")
+        request = self.request
+        request.answer(decision)
+        self.request = None
+        self._resume(self._run.asend(None), None)
+        return request.patient
+
+"""
+StateArrays Object
+The state as numpy arrays, handed to batch policies (policy.batch = True) whose
+score(state) returns a score for every (class, hospital) pair at once
+Rows are IMMEDIATE, DELAYED and columns are hospitals
+The engine updates the arrays in place as events happen, policies must not write to them
+
+scene: (2,) patients waiting at the scene
+patients: (2, n_hos) patients at each hospital, in treatment or waiting
+waiting: (2, n_hos) hospital queue lengths
+busy: (2, n_hos) busy servers
+servers: (2, n_hos) server counts
+distances: (n_hos,) distance to each hospital
+service_means: (2, n_hos) mean treatment time per class at each hospital
+travel: (n_hos,) mean travel time to each hospital, travel_scale*travel_mu*distance
+clock, rng: read from the simulation
+"""
+class StateArrays(object):
+    def __init__(self, sim):
+        self._sim = sim
+        n_hos = len(sim.hospitals)
+        self.scene = np.array(sim.scene, dtype=float)
+        self.patients = np.zeros((2, n_hos))
+        self.waiting = np.zeros((2, n_hos))
+        self.busy = np.zeros((2, n_hos))
+        self.servers = np.array([hospital.servers for hospital in sim.hospitals], dtype=float).T.reshape(2, n_hos)
+        self.distances = np.array([hospital.distance for hospital in sim.hospitals], dtype=float)
+        self.service_means = np.array(sim.hospital_service_means, dtype=float).T.reshape(2, n_hos)
+        self.travel = np.array([sim.travel_scale*mu*hospital.distance
+                                for (mu, sigma), hospital in zip(sim.hospital_travel, sim.hospitals)], dtype=float)
+
+    @property
+    def clock(self):
+        return self._sim.clock
+
+    @property
+    def rng(self):
+        return self._sim.rng
+
+"""
+Simulation Object
+The shared event engine, every front-end (interactive, second, draft,
+multi_hospital, gui2) is a configuration of this class
+
+Input:
+Number of IMMEDIATE patients = n_imm
+Number of DELAYED patients = n_del
+Number of Ambulances = n_ambs
+Number of Hospitals = n_hos
+List of Hospital Distances = hos_dists [n_hos distances]
+List of Number of Immediate Servers per Hospital = imm_servers [n_hos #imm servers]
+List of Number of Delayed Servers per Hospital = del_servers [n_hos #del servers]
+Patient selection = policy (see policies.py, defaults to random)
+Random numbers = seed, an int, a numpy SeedSequence or a Generator to draw from (None: fresh entropy),
+kept as the simulation's own Generator rng so simulations in one process don't interfere
+Travel model = travel, "lognormal" (travel_scale*lognormal) or "linear" (LINEAR_TRAVEL*distance)
+Treatment model = service, "exponential" or "fixed", with means service_means [imm, del]
+Fitted parameters = params, a dict or parameter file (see load_params), per hospital
+travel_mu/travel_sigma and treatment means, travel_scale and service_means given here win
+Casualties found later = arrivals, an iterable of (time, patient type) in time order
+(see arrivals.py), n_imm and n_del are the patients already at the scene at time 0
+Recorded travel and treatment times = trace, a TraceReplay replays them instead of sampling
+and a TraceRecorder records what is sampled (see traces.py)
+Quantiles of time to treatment and survival = sketches, a stats.QuantileSketches every
+patient is added to when treatment starts, it can be shared by many replications
+Event history = log, an eventlog.EventLog that gets a row per event
+
+Keep track of:
+Clock
+Patients waiting at the scene per class
+Array of Ambulances
+Array of Hospitals
+Next Pickup Time (minimum of Ambulances[i].pickup_time, kept in the pickups IndexedHeap)
+Next Hospital Arrival Time (minimum of Ambulances[i].dropoff_time, kept in the dropoffs IndexedHeap)
+Next Hospital Departure Time (minimum of Hospitals[i].next_departure, kept in the departures IndexedHeap)
+Next Scene Arrival (only the next one is read from arrivals)
+Patient Survival Probabilities (sum, added when treatment starts)
+Time averaged queue lengths, busy servers, waits and ambulance rides = stats (see stats.py)
+
+Events:
+Advance Time: go to the minimum time event
+Pickup Event: the next free ambulance picks up the (class, hospital) the policy decides
+Hospital Arrival Event: the ambulance hands its patient to the hospital and heads back
+Patient Departure Event: a patient finishes treatment, the next one in that queue starts
+Scene Arrival Event: a casualty is found at the scene
+
+Where the engine differs from second.py (the first random/first/last/myopic.csv came from it):
+a patient's survival probability is added once, when treatment starts (second.py added it
+again at the departure); a free server takes the next patient in its own queue at its own
+hospital (second.py restarted the first patient of the class at any hospital); a patient
+sent to a hospital with no server of their class waits there and is never treated or
+counted as served (second.py's restarts treated them elsewhere); a run goes on until every
+patient who can be treated has been (second.py stopped after 3*patients events)
+"""
+class Simulation(object):
+    def __init__(self, n_imm=20, n_del=50, n_ambs=5, n_hos=3, hos_dists=[5,10,20], imm_servers=[1,2,3], del_servers=[6,8,10],
+                 policy=None, travel="lognormal", service="exponential", travel_scale=None, service_means=None, seed=None,
+                 arrivals=None, trace=None, params=None, sketches=None, log=None):
+        if policy is None:
+            from policies import RandomPolicy
+            policy = RandomPolicy()
+        self.policy = policy
+        # this simulation's own random numbers, nothing is drawn from the global np.random
+        self.rng = np.random.default_rng(seed)
+        self.view = StateView(self)
+        self.travel = travel
+        self.service = service
+        params = load_params(params)
+        self.params = params
+        self.travel_scale = travel_scale if travel_scale is not None else params.get("travel_scale", TRAVEL_SCALE)
+        self.travel_mu = params.get("travel_mu", TRAVEL_MU)
+        self.travel_sigma = params.get("travel_sigma", TRAVEL_SIGMA)
+        self.service_means = list(service_means if service_means is not None else params.get("service_means", SERVICE_MEANS))
+        # per hospital (travel_mu, travel_sigma) and [imm, del] treatment means
+        fitted = params.get("hospitals", [])
+        fitted = [fitted[i] if i < len(fitted) else {} for i in range(n_hos)]
+        self.hospital_travel = [(h.get("travel_mu", self.travel_mu), h.get("travel_sigma", self.travel_sigma)) for h in fitted]
+        self.hospital_service_means = [list(self.service_means) if service_means is not None else list(h.get("service_means", self.service_means))
+                                       for h in fitted]
+        self.trace = trace
+
+        # keeps track of time and our reward probability
+        self.clock = 0.0
+        self.total_survival_probability = 0.0
+        self.served = 0
+        self.limit = n_imm + n_del
+        self.patients_picked_up = 0
+
+        # patients waiting at the scene, [imm, del]
+        self.scene = [n_imm, n_del]
+
+        # keeps track of ambulances and hospital
+        self.ambulances = [Ambulance(i) for i in range(n_ambs)]
+        # O(log n_ambs) per event instead of scanning every ambulance
+        self.pickups = IndexedHeap([ambulance.pickup_time for ambulance in self.ambulances])
+        self.dropoffs = IndexedHeap([ambulance.dropoff_time for ambulance in self.ambulances])
+        self.hospitals = [Hospital(i, hos_dists[i], imm_servers[i], del_servers[i]) for i in range(n_hos)]
+        self.departures = IndexedHeap([BIG]*n_hos)
+        self.state = StateArrays(self)
+        self.stats = TimeAverages(n_hos)
+        self.sketches = sketches
+        self.log = log
+
+        # used for determining events
+        self.next_ambulance_pickup_time = 0.0 if n_ambs > 0 else BIG
+        self.next_ambulance_dropoff_time = BIG
+        self.next_patient_departure_time = BIG
+        self.next_ambulance_to_pickup = 0 if n_ambs > 0 else None
+        self.next_ambulance_to_dropoff = None
+        self.next_hospital_to_depart = None
+
+        # casualties still to be found, pulled one at a time so a long incident log is never held in memory
+        self.arrivals = iter(arrivals) if arrivals is not None else iter(())
+        self.next_scene_arrival_time = BIG
+        self.next_scene_arrival_type = None
+        self.patients_found = [0, 0]
+        self._next_arrival()
+
+    """
+    Helper functions
+    """
+    # the random part of a travel or treatment time is a standard normal (travel) or
+    # standard exponential (treatment) variate, that is what a trace records and replays,
+    # so a replayed variate is scaled to whichever hospital and class it is used for
+    def generate_travel_time(self, distance, hospital_number=None):
+        if self.travel == "linear":
+            return LINEAR_TRAVEL*distance
+        if self.trace is not None and self.trace.replaying:
+            z = self.trace.next("travel")
+        else:
+            z = self.rng.standard_normal()
+            if self.trace is not None:
+                self.trace.record("travel", z)
+        return self.scale_travel(z, distance, hospital_number)
+
+    def generate_next_departure(self, patient_type, hospital_number=None):
+        if self.service == "fixed":
+            return self.scale_service(1.0, patient_type, hospital_number)
+        if self.trace is not None and self.trace.replaying:
+            e = self.trace.next("service")
+        else:
+            e = self.rng.standard_exponential()
+            if self.trace is not None:
+                self.trace.record("service", e)
+        return self.scale_service(e, patient_type, hospital_number)
+
+    # travel_scale*lognormal(mu*distance, sigma*distance) from its standard normal z,
+    # the same float Generator.lognormal gives for that draw
+    def scale_travel(self, z, distance, hospital_number=None):
+        mu, sigma = self.hospital_travel[hospital_number] if hospital_number is not None else (self.travel_mu, self.travel_sigma)
+        return self.travel_scale*math.exp(mu*distance + sigma*distance*z)
+
+    # exponential treatment time from its standard exponential e, the mean when service is fixed
+    def scale_service(self, e, patient_type, hospital_number=None):
+        means = self.hospital_service_means[hospital_number] if hospital_number is not None else self.service_means
+        if self.service == "fixed":
+            return means[patient_type]
+        return means[patient_type]*e
+
+    # a draw from the travel and treatment models, left out of any trace (policies use these)
+    def draw_travel_time(self, distance, hospital_number=None):
+        if self.travel == "linear":
+            return LINEAR_TRAVEL*distance
+        return self.scale_travel(self.rng.standard_normal(), distance, hospital_number)
+
+    def draw_service_time(self, patient_type, hospital_number=None):
+        if self.service == "fixed":
+            return self.scale_service(1.0, patient_type, hospital_number)
+        return self.scale_service(self.rng.standard_exponential(), patient_type, hospital_number)
+
+    def sll_surv_prob(self, time, t_class):
+        return sll_surv_prob(time, t_class)
+
+    # everyone found so far is served and nobody else is coming
+    def done(self):
+        return self.served == self.limit and self.next_scene_arrival_time >= BIG
+
+    def _next_arrival(self):
+        arrival = next(self.arrivals, None)
+        if arrival is None:
+            self.next_scene_arrival_time = BIG
+            self.next_scene_arrival_type = None
+            return
+        time, patient_type = arrival
+        if time < self.clock:
+            raise ValueError("scene arrivals are out of time order (%s after %s)" % (time, self.clock))
+        self.next_scene_arrival_time = time
+        self.next_scene_arrival_type = int(patient_type)
+
+    """
+    next_event
+    returns (time, kind) of the next event, kind is None when nothing is left to happen
+    ties go scene arrival, then pickup, then dropoff, then departure
+    so an ambulance waiting at the scene takes the casualty found at that moment
+    """
+    def next_event(self):
+        if self.scene[IMMEDIATE] + self.scene[DELAYED] > 0:
+            # an ambulance that came back to an empty scene leaves as soon as someone is there
+            pickup = max(self.next_ambulance_pickup_time, self.clock)
+        else:
+            pickup = BIG
+        time = min(self.next_scene_arrival_time, pickup, self.next_ambulance_dropoff_time, self.next_patient_departure_time)
+        if time >= BIG:
+            return BIG, None
+        if time == self.next_scene_arrival_time:
+            return time, ARRIVAL
+        if time == pickup:
+            return time, PICKUP
+        if time == self.next_ambulance_dropoff_time:
+            return time, DROPOFF
+        return time, DEPARTURE
+
+    """
+    advance_time
+    controls each step, returns the kind of event handled or None when the run is over
+    (everyone served, or the rest are stuck in queues with no servers)
+    """
+    def advance_time(self):
+        if self.done():
+            return None
+        time, kind = self.next_event()
+        if kind is None:
+            return None
+        self.clock = time
+        if kind == PICKUP:
+            self.pickup_event()
+        elif kind == DROPOFF:
+            self.hospital_arrival_event()
+        elif kind == DEPARTURE:
+            self.patient_departure_event()
+        else:
+            self.scene_arrival_event()
+        return kind
+
+    def run(self):
+        while self.advance_time() is not None:
+            pass
+        return self.total_survival_probability
+
+    # the event after a pending pickup, (BIG, None) when there is none
+    def _next_other(self):
+        time = min(self.next_scene_arrival_time, self.next_ambulance_dropoff_time, self.next_patient_departure_time)
+        if time >= BIG:
+            return BIG, None
+        if time == self.next_scene_arrival_time:
+            return time, ARRIVAL
+        if time == self.next_ambulance_dropoff_time:
+            return time, DROPOFF
+        return time, DEPARTURE
+
+    def _handle(self, kind):
+        if kind == DROPOFF:
+            self.hospital_arrival_event()
+        elif kind == DEPARTURE:
+            self.patient_departure_event()
+        else:
+            self.scene_arrival_event()
+
+    """
+    decisions
+    the run as an async generator, it yields a DecisionRequest at every pickup and
+    goes on once that is answered, by request.answer(decision) or by sending the
+    decision in with asend (which returns the next request, or the same one with
+    error set when the decision was refused)
+    The total survival probability is in total_survival_probability at the end
+
+    Without a pacer every event happens as soon as the one before is done, other
+    coroutines get to run every YIELD_EVERY events, and a pickup waits for its answer
+    with the clock stopped. A pacer says when events happen:
+    await pacer.until(time, request) is True once simulated time is due (never when
+    time is None) and False as soon as request, when there is one, is answered
+    pacer.now() is the simulated time now and pacer.done(kind) is called after every event
+    and a pickup waiting for its answer lets the other events go on meanwhile
+    (realtime.RealTimeRunner paces against the wall clock, Stepper steps by hand)
+
+    async for request in sim.decisions():
+        request.answer(await ask_someone(request))
+    """
+    async def decisions(self, pacer=None):
+        handled = 0
+        while not self.done():
+            time, kind = self.next_event()
+            if kind is None:
+                break
+            if pacer is not None:
+                if not await pacer.until(time):
+                    continue
+            else:
+                handled += 1
+                if handled % YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+            self.clock = time
+            if kind != PICKUP:
+                self._handle(kind)
+                if pacer is not None:
+                    pacer.done(kind)
+                continue
+
+            request = DecisionRequest(self, time)
+            decision = yield request
+            while decision is not None and not request.answered():
+                try:
+                    request.answer(decision)
+                except ValueError as error:
+                    request.error = error
+                    decision = yield request
+            waited = False
+            while not request.answered():
+                if pacer is None:
+                    await request.wait()
+                    break
+                other, other_kind = self._next_other()
+                waited = True
+                if await pacer.until(other if other_kind is not None else None, request):
+                    self.clock = other
+                    self._handle(other_kind)
+                    pacer.done(other_kind)
+            if waited:
+                # the ambulance leaves when the answer came in, but not before any event already handled
+                other, other_kind = self._next_other()
+                self.clock = max(self.clock, min(pacer.now(), other))
+            request._done(self.pickup_event(request.decision))
+            if pacer is not None:
+                pacer.done(PICKUP)
+
+    """
+    run_async
+    run() through decisions(), decide(request) answers every pickup, a plain or a
+    coroutine function returning (patient type, hospital) or None when it answers
+    the request some other way, the simulation's own policy by default
+    returns the total survival probability
+    """
+    async def run_async(self, decide=None, pacer=None):
+        async for request in self.decisions(pacer):
+            if decide is None:
+                request.answer(self.decide())
+                continue
+            decision = decide(request)
+            if inspect.isawaitable(decision):
+                decision = await decision
+            if decision is not None:
+                request.answer(decision)
+        return self.total_survival_probability
+
+    # ask the policy for (patient type, hospital number)
+    # batch policies score every pair and the best pair with someone at the scene wins
+    def decide(self):
+        if self.trace is not None and self.trace.replaying and self.trace.decisions:
+            return divmod(int(self.trace.next("decision")), len(self.hospitals))
+        if self.policy.batch:
+            scores = np.where(self.state.scene[:, None] > 0, self.policy.score(self.state), -np.inf)
+            patient_type, hospital_number = divmod(int(np.argmax(scores)), scores.shape[1])
+            return patient_type, hospital_number
+        return self.policy.decide(self.view)
+
+    """
+    pickup_event
+    the next free ambulance takes a patient of the decided class to the decided hospital
+    decision defaults to asking the policy
+    """
+    def pickup_event(self, decision=None):
+        if decision is None:
+            decision = self.decide()
+        patient_type, hospital_number = decision
+        if self.scene[patient_type] <= 0:
+            raise ValueError("no %s patients left at the scene" % ("IMMEDIATE" if patient_type == IMMEDIATE else "DELAYED"))
+        if not 0 <= hospital_number < len(self.hospitals):
+            raise ValueError("there is no hospital number %s" % hospital_number)
+        self.scene[patient_type] -= 1
+        self.state.scene[patient_type] -= 1
+        if self.trace is not None and not self.trace.replaying:
+            self.trace.record("decision", patient_type*len(self.hospitals) + hospital_number)
+
+        # update patient and ambulance
+        hospital = self.hospitals[hospital_number]
+        patient = Patient(self.patients_picked_up, patient_type, hospital_number, self.clock)
+        patient.location = 1
+        patient.arrival_time = self.clock + self.generate_travel_time(hospital.distance, hospital_number)
+        ambulance = self.ambulances[self.next_ambulance_to_pickup]
+        ambulance.patient = patient
+        ambulance.pickup_time = BIG
+        ambulance.dropoff_time = patient.arrival_time
+        self.patients_picked_up += 1
+
+        self._update_ambulance_times(ambulance)
+        if self.log is not None:
+            self._log_event(PICKUP, ambulance.number, patient.number, hospital_number)
+        return patient
+
+    """
+    hospital_arrival_event
+    the next ambulance to arrive drops its patient off, the patient starts treatment
+    if a server of its class is free and waits otherwise, the ambulance heads back
+    """
+    def hospital_arrival_event(self):
+        ambulance = self.ambulances[self.next_ambulance_to_dropoff]
+        patient = ambulance.patient
+        hospital = self.hospitals[patient.hospital_number]
+
+        # update ambulance
+        ambulance.patient = None
+        ambulance.dropoff_time = BIG
+        ambulance.pickup_time = self.clock + self.generate_travel_time(hospital.distance, hospital.number)
+        self._update_ambulance_times(ambulance)
+
+        # update hospital
+        patient.location = 2
+        patient_type = patient.patient_type
+        self.stats.ride(patient_type, hospital.number, self.clock - patient.pickup_time)
+        self.state.patients[patient_type, hospital.number] += 1
+        if hospital.busy[patient_type] < hospital.servers[patient_type]:
+            self._start_treatment(hospital, patient)
+            self._update_departure_time(hospital)
+        else:
+            self.stats.update(patient_type, hospital.number, self.clock, len(hospital.queues[patient_type]), hospital.busy[patient_type])
+            hospital.queues[patient_type].append(patient)
+            self.state.waiting[patient_type, hospital.number] += 1
+
+        if self.log is not None:
+            self._log_event(DROPOFF, ambulance.number, patient.number, hospital.number)
+        return patient
+
+    """
+    patient_departure_event
+    the next patient to finish treatment leaves, the first patient waiting
+    in that class at that hospital takes the free server
+    """
+    def patient_departure_event(self):
+        hospital = self.hospitals[self.next_hospital_to_depart]
+        patient = heapq.heappop(hospital.in_service)[2]
+        patient_type = patient.patient_type
+        self.stats.update(patient_type, hospital.number, self.clock, len(hospital.queues[patient_type]), hospital.busy[patient_type])
+        hospital.busy[patient_type] -= 1
+        self.state.busy[patient_type, hospital.number] -= 1
+        self.state.patients[patient_type, hospital.number] -= 1
+        patient.location = 3
+        self.served += 1
+        if hospital.queues[patient_type]:
+            self.state.waiting[patient_type, hospital.number] -= 1
+            self._start_treatment(hospital, hospital.queues[patient_type].popleft())
+        self._update_departure_time(hospital)
+        if self.log is not None:
+            self._log_event(DEPARTURE, -1, patient.number, hospital.number)
+        return patient
+
+    """
+    scene_arrival_event
+    the next casualty is found at the scene and waits for an ambulance,
+    the one after it is read from arrivals
+    """
+    def scene_arrival_event(self):
+        patient_type = self.next_scene_arrival_type
+        self.scene[patient_type] += 1
+        self.state.scene[patient_type] += 1
+        self.patients_found[patient_type] += 1
+        self.limit += 1
+        self._next_arrival()
+        if self.log is not None:
+            self._log_event(ARRIVAL, -1, -1, -1)
+        return patient_type
+
+    # one row in the event log, queue lengths of the hospital involved
+    def _log_event(self, kind, ambulance, patient, hospital_number):
+        if hospital_number >= 0:
+            queues = self.hospitals[hospital_number].queues
+            queue_imm, queue_del = len(queues[IMMEDIATE]), len(queues[DELAYED])
+        else:
+            queue_imm = queue_del = 0
+        self.log.record(self.clock, kind, ambulance, patient, hospital_number, queue_imm, queue_del,
+                        self.scene[IMMEDIATE], self.scene[DELAYED])
+
+    def _start_treatment(self, hospital, patient):
+        patient_type = patient.patient_type
+        # a no-op after a departure at the same clock, that already closed the interval
+        self.stats.update(patient_type, hospital.number, self.clock, len(hospital.queues[patient_type]), hospital.busy[patient_type])
+        self.stats.wait(patient_type, hospital.number, self.clock - patient.arrival_time)
+        hospital.busy[patient_type] += 1
+        self.state.busy[patient_type, hospital.number] += 1
+        patient.treatment_time = self.clock
+        patient.survival_probability = sll_surv_prob(self.clock, patient_type)
+        self.total_survival_probability += patient.survival_probability
+        if self.sketches is not None:
+            self.sketches.add(patient_type, hospital.number, self.clock, patient.survival_probability)
+        patient.departure_time = self.clock + self.generate_next_departure(patient_type, hospital.number)
+        heapq.heappush(hospital.in_service, (patient.departure_time, patient.number, patient))
+
+    # the ambulance's times changed, move it in both heaps and read off the next ones
+    def _update_ambulance_times(self, ambulance):
+        self.pickups.update(ambulance.number, ambulance.pickup_time)
+        self.dropoffs.update(ambulance.number, ambulance.dropoff_time)
+        self.next_ambulance_pickup_time, self.next_ambulance_to_pickup = self.pickups.top()
+        self.next_ambulance_dropoff_time, self.next_ambulance_to_dropoff = self.dropoffs.top()
+
+    # the hospital's first departure may have changed, O(log n_hos)
+    def _update_departure_time(self, hospital):
+        self.departures.update(hospital.number, hospital.next_departure)
+        self.next_patient_departure_time, self.next_hospital_to_depart = self.departures.top()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+import numpy as np
+import os
+from engine import EVENT_NAMES
+
+"""
+Event log
+Every event of a replication as a row, for debugging policies
+Simulation(log=EventLog(...)) records one row per event:
+
+time: clock of the event
+kind: PICKUP, DROPOFF, DEPARTURE or ARRIVAL (engine.EVENT_NAMES)
+ambulance, patient, hospital: numbers, -1 when the event has none
+queue_imm, queue_del: waiting patients at that hospital after the event
+scene_imm, scene_del: patients left at the scene after the event
+
+Rows go into preallocated numpy columns that double when full, up to memory_cap
+bytes, after that (and on close) the rows are appended to the file at path as
+EVENT_DTYPE records and the columns start over, so a long run never holds more
+than memory_cap of log. Without a path the columns just keep growing.
+load(path) reads a log file back as a structured array.
+"""
+
+EVENT_DTYPE = np.dtype([('time', '<f8'), ('kind', 'i1'), ('ambulance', '<i4'), ('patient', '<i4'), ('hospital', '<i4'),
+                        ('queue_imm', '<i4'), ('queue_del', '<i4'), ('scene_imm', '<i4'), ('scene_del', '<i4')])
+CAPACITY = 4096                 # rows preallocated at first
+MEMORY_CAP = 64*1024*1024       # bytes of columns kept before flushing to disk
+
+"""
+EventLog Object
+record(...) adds a row, events() is every row so far as a structured array
+(the file and the columns), close() flushes the rest to the file
+"""
+class EventLog(object):
+    def __init__(self, path=None, capacity=CAPACITY, memory_cap=MEMORY_CAP):
+        self.path = path
+        self.memory_cap = memory_cap
+        self.size = 0
+        self.flushed = 0
+        self._allocate(capacity)
+        if path is not None:
+            # a new log replaces an old file of the same name
+            open(path, 'wb').close()
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=EVENT_DTYPE[name]) for name in EVENT_DTYPE.names}
+        # the columns in record() order, so a row is one zip
+        self._order = [self.columns[name] for name in EVENT_DTYPE.names]
+
+    def record(self, time, kind, ambulance, patient, hospital, queue_imm, queue_del, scene_imm, scene_del):
+        if self.size == self.capacity:
+            self._make_room()
+        i = self.size
+        for column, value in zip(self._order, (time, kind, ambulance, patient, hospital, queue_imm, queue_del, scene_imm, scene_del)):
+            column[i] = value
+        self.size = i + 1
+
+    def _make_room(self):
+        if self.path is not None and 2*self.capacity*EVENT_DTYPE.itemsize > self.memory_cap:
+            self.flush()
+            return
+        old, size = self.columns, self.size
+        self._allocate(2*self.capacity)
+        for name in EVENT_DTYPE.names:
+            self.columns[name][:size] = old[name][:size]
+
+    # rows in memory as a structured array
+    def _rows(self):
+        rows = np.empty(self.size, dtype=EVENT_DTYPE)
+        for name in EVENT_DTYPE.names:
+            rows[name] = self.columns[name][:self.size]
+        return rows
+
+    def flush(self):
+        if self.path is None or self.size == 0:
+            return
+        with open(self.path, 'ab') as outfile:
+            self._rows().tofile(outfile)
+        self.flushed += self.size
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+    def __len__(self):
+        return self.flushed + self.size
+
+    def events(self):
+        if self.path is not None and self.flushed:
+            return np.concatenate([load(self.path), self._rows()])
+        return self._rows()
+
+"""
+load
+a log file as a structured array of EVENT_DTYPE, memory mapped when mmap is set
+"""
+def load(path, mmap=False):
+    if mmap:
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+        return np.memmap(path, dtype=EVENT_DTYPE, mode='r')
+    return np.fromfile(path, dtype=EVENT_DTYPE)
+
+# rows as printable lines
+def format_events(events):
+    lines = ["%10s  %-17s  %9s  %7s  %8s  %9s  %9s  %9s  %9s" % EVENT_DTYPE.names]
+    for row in events:
+        lines.append("%10.2f  %-17s  %9d  %7d  %8d  %9d  %9d  %9d  %9d" % ((row['time'], EVENT_NAMES[row['kind']]) + tuple(row[name] for name in EVENT_DTYPE.names[2:])))
+    return "\n".join(lines)
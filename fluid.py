@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+import numpy as np
+from engine import IMMEDIATE, DELAYED, ALPHAS, SLL_BETAS, TRAVEL_SCALE, TRAVEL_MU, load_params
+from analytic import mean_times
+
+"""
+Fluid approximation
+The incident as continuous flows instead of patients and ambulances, stepped
+forward dt minutes at a time with numpy, so thousands of casualties take about as
+long as a few hundred and a whole stack of patient mixes runs at once
+
+Every step:
+scene arrivals: arrival_rate patients per minute flow in (split by arrival_imm), or
+the arrival_log's casualties binned by step
+dropoffs: patients picked up one mean travel time ago reach their hospital queue,
+ambulances that dropped off one travel time ago are back at the scene
+departures: busy servers finish at rate busy/mean treatment (an Euler step)
+treatment: as much of each queue as there are free servers starts treatment and
+adds its count times the sll survival curve at the clock, as the engine does
+pickups: the free ambulances take min(free ambulances, scene) patients, split by the
+selection: random in proportion to the scene, first immediate first, last delayed
+first, myopic the class MyopicPolicy's loop ends on with mean travel and treatment
+times, all four to every hospital alike; batch policies (LinearPolicy)
+score a FluidState as they would the engine's StateArrays and the flow goes to the
+best pair, a piece at a time so a big wave spreads out like one decision per ambulance
+
+Travel times are the lognormal means, treatment is exponential, the same scenario
+keys as batch.simulate and the same fitted parameters (engine.load_params)
+expected_survival(scenario, selection) answers for a scenario as batch.simulate reads it
+"""
+
+DT = 2.0                # minutes per step
+PIECES = 16             # most decisions a batch policy makes in one step
+EPSILON = 1e-6          # patients counted as nobody
+BLOCK = 64              # steps of the survival curve worked out at once, and between checks for the end
+MAX_TIME = 1e6          # minutes, a scenario that can never finish stops here
+
+"""
+FluidState Object
+the fluid's state in the engine's StateArrays names (see engine.py), a leading
+dimension per patient mix, for the batch policies' score(state)
+rng gives the mean instead of a draw, the fluid has no noise
+"""
+class FluidState(object):
+    def __init__(self, scene, servers, distances, service_means, travel):
+        self.scene = scene
+        self.patients = np.zeros(scene.shape + (len(distances),))
+        self.waiting = np.zeros_like(self.patients)
+        self.busy = np.zeros_like(self.patients)
+        self.servers = servers
+        self.distances = distances
+        self.service_means = service_means
+        self.travel = travel
+        self.clock = 0.0
+        self.picked_up = np.zeros(scene.shape[:-1])
+        self.rng = _Means()
+
+class _Means(object):
+    def exponential(self, scale=1.0, size=None):
+        return np.broadcast_to(np.asarray(scale, dtype=float), np.shape(scale) if size is None else size)
+
+"""
+Fluid Object
+Input:
+Scenario, in Simulation.true_init parameter names plus the arrival keys of batch.py = scenario
+Patient selection = selection, a name or a batch Policy object
+Fitted parameters = params (see engine.load_params)
+Minutes per step = dt
+
+run(n_imm, n_del) integrates until every patient who can be treated has started
+treatment, n_imm and n_del are numbers or arrays of patient mixes
+returns the expected survival (the shape of n_imm) and, with curves=True, the step
+times and per step scene (steps, ..., 2), queues (steps, ..., 2, n_hos) and
+cumulative survival (steps, ...)
+"""
+class Fluid(object):
+    def __init__(self, scenario, selection="random", params=None, dt=DT):
+        self.n_ambs = float(scenario["n_ambs"])
+        self.distances = np.array(scenario["hos_dists"], dtype=float)
+        self.n_hos = len(self.distances)
+        self.servers = np.array([scenario["imm_servers"], scenario["del_servers"]], dtype=float)
+        params = load_params(scenario.get("params") if params is None else params)
+        self.travel, self.service_means = mean_times(scenario, params)
+        # what the engine's StateArrays give the policies as travel
+        fitted = params.get("hospitals", [])
+        mu = np.array([(fitted[h] if h < len(fitted) else {}).get("travel_mu", params.get("travel_mu", TRAVEL_MU))
+                       for h in range(self.n_hos)])
+        self.score_travel = params.get("travel_scale", TRAVEL_SCALE)*mu*self.distances
+        self.dt = dt
+        # steps to each hospital, at least one so a pickup never lands in its own step
+        self.delay = np.maximum(np.round(self.travel/dt).astype(int), 1)
+        if isinstance(selection, str):
+            if selection not in ("random", "first", "last", "myopic"):
+                raise ValueError("unknown selection %r" % selection)
+        elif not getattr(selection, "batch", False):
+            raise ValueError("the fluid needs a selection name or a batch policy")
+        self.selection = selection
+        self._inflow = self._scene_inflow(scenario)
+
+    # patients found per step as a function of the step number, None if everyone is there at time 0
+    def _scene_inflow(self, scenario):
+        import arrivals
+        if "arrival_log" in scenario:
+            counts = np.zeros((0, 2))
+            times, types = [], []
+            for time, patient_type in arrivals.log_arrivals(scenario["arrival_log"]):
+                times.append(time)
+                types.append(patient_type)
+                if len(times) == arrivals.CHUNK:
+                    counts = self._bin(counts, times, types)
+                    times, types = [], []
+            counts = self._bin(counts, times, types)
+            return lambda k: counts[k] if k < len(counts) else None
+        if "arrival_rate" in scenario:
+            from batch import arrival_horizon
+            rate, rate_max = arrivals.piecewise_rate(scenario["arrival_rate"])
+            share = scenario.get("arrival_imm", .25)
+            horizon = arrival_horizon(scenario)
+            def inflow(k):
+                t = k*self.dt
+                if t >= horizon:
+                    return None
+                return rate(t)*min(self.dt, horizon - t)*np.array([share, 1 - share])
+            return inflow
+        return None
+
+    # (steps, 2) casualties found per step and class, with times and types added
+    def _bin(self, counts, times, types):
+        if not times:
+            return counts
+        steps = (np.array(times)/self.dt).astype(int)
+        counts = np.pad(counts, ((0, max(0, steps.max() + 1 - len(counts))), (0, 0)))
+        np.add.at(counts, (steps, np.array(types, dtype=int)), 1)
+        return counts
+
+    # (..., 2, n_hos) patients picked up this step
+    def _dispatch(self, state, free):
+        scene = state.scene
+        total = scene.sum(axis=-1)
+        amount = np.minimum(free, total)
+        flow = np.zeros(state.patients.shape)
+        if not np.any(amount > EPSILON):
+            return flow
+        if self.selection == "random":
+            shares = scene/np.maximum(total, EPSILON)[..., None]
+            taken = shares*amount[..., None]
+        elif self.selection in ("first", "last", "myopic"):
+            if self.selection == "myopic":
+                first = self._myopic_class(state)
+            else:
+                first = np.full(total.shape, IMMEDIATE if self.selection == "first" else DELAYED)
+            ahead = np.minimum(amount, np.take_along_axis(scene, first[..., None], -1)[..., 0])
+            taken = np.where((first == IMMEDIATE)[..., None], np.stack([ahead, amount - ahead], axis=-1),
+                             np.stack([amount - ahead, ahead], axis=-1))
+        else:
+            return self._dispatch_scored(state, amount)
+        return taken[..., None]/self.n_hos*np.ones(self.n_hos)
+
+    # MyopicPolicy.reward with the mean travel and treatment times, hospital an array of hospital numbers
+    def _myopic_reward(self, state, patient_type, hospital):
+        tau = self.travel[hospital]
+        r = SLL_BETAS[patient_type, 0]/(1 + ((state.clock + tau)/SLL_BETAS[patient_type, 1])**SLL_BETAS[patient_type, 2])
+        b = self.servers[patient_type][hospital]
+        mu = state.clock + self.service_means[patient_type][hospital]
+        alpha = ALPHAS[patient_type]
+        return tau*r*(mu/(mu + alpha))*(b*mu/(b*mu + alpha))**(state.picked_up + 1 - b)
+
+    # (...) class MyopicPolicy.decide's loop over the hospitals ends on
+    def _myopic_class(self, state):
+        has_imm = state.scene[..., IMMEDIATE] > EPSILON
+        has_del = state.scene[..., DELAYED] > EPSILON
+        choice = np.where(has_imm, IMMEDIATE, DELAYED)
+        best = np.zeros(choice.shape, dtype=int)
+        for hospital in range(self.n_hos):
+            to_del = (self._myopic_reward(state, IMMEDIATE, best) < self._myopic_reward(state, DELAYED, hospital)) & has_del
+            to_imm = ~to_del & has_imm
+            choice = np.where(to_del, DELAYED, np.where(to_imm, IMMEDIATE, choice))
+            best = np.where(to_del | to_imm, hospital, best)
+        return choice
+
+    # a batch policy's best pair gets each piece, the state moving between pieces
+    def _dispatch_scored(self, state, amount):
+        flow = np.zeros(state.patients.shape)
+        pieces = int(min(PIECES, max(1, np.ceil(amount.max()))))
+        left = amount.copy()
+        scene = state.scene
+        for i in range(pieces):
+            scores = np.where(scene[..., :, None] > EPSILON, self.selection.score(state), -np.inf)
+            flat = scores.reshape(scores.shape[:-2] + (-1,))
+            best = np.argmax(flat, axis=-1)
+            patient_type, hospital = np.divmod(best, self.n_hos)
+            piece = np.take_along_axis(scene, patient_type[..., None], -1)[..., 0]
+            piece = np.minimum(left/(pieces - i), piece)
+            pick = np.zeros_like(flat)
+            np.put_along_axis(pick, best[..., None], piece[..., None], -1)
+            pick = pick.reshape(flow.shape)
+            flow += pick
+            left -= piece
+            scene -= pick.sum(axis=-1)
+            # the picked up patients count at their hospital for the next piece's score
+            state.patients += pick
+        # the caller moves them to the hospital when they get there
+        state.patients -= flow
+        scene += flow.sum(axis=-1)
+        return flow
+
+    def run(self, n_imm, n_del, curves=False):
+        n_imm, n_del = np.broadcast_arrays(np.asarray(n_imm, dtype=float), np.asarray(n_del, dtype=float))
+        shape = n_imm.shape
+        dt = self.dt
+        state = FluidState(np.stack([n_imm, n_del], axis=-1).astype(float), self.servers, self.distances,
+                           self.service_means, self.score_travel)
+        queue, busy, patients = state.waiting, state.busy, state.patients
+        free = np.full(shape, self.n_ambs)
+        survival = np.zeros(shape)
+        # ring buffers by step of the patients reaching each hospital (steps, n_hos, ..., 2)
+        # and of the ambulances back at the scene from each hospital (steps, n_hos, ...)
+        length = 2*self.delay.max() + 1
+        hospitals = np.arange(self.n_hos)
+        drops = np.zeros((length, self.n_hos) + shape + (2,))
+        returns = np.zeros((length, self.n_hos) + shape)
+        treatable = self.servers > 0
+        # patients on their way to a hospital that can treat them, for knowing when it is over
+        travelling = 0.0
+        # sll survival of each class at the step times, a block of steps at a time
+        betas = SLL_BETAS.T[:, None, :]
+        curve = None
+        pending = [False]*length
+        history = {"time": [], "scene": [], "queue": [], "survival": []}
+        k = 0
+        arriving = self._inflow is not None
+        while k*dt < MAX_TIME:
+            t = k*dt
+            state.clock = t
+            if arriving:
+                found = self._inflow(k)
+                if found is None:
+                    arriving = False
+                else:
+                    state.scene += found
+            slot = k % length
+            if pending[slot]:
+                dropped = np.moveaxis(drops[slot], 0, -1)
+                queue += dropped
+                patients += dropped
+                travelling -= (dropped*treatable).sum()
+                drops[slot] = 0
+                free += returns[slot].sum(axis=0)
+                returns[slot] = 0
+                pending[slot] = False
+            # departures, then the free servers take the queue
+            done = busy*dt/self.service_means
+            busy -= done
+            patients -= done
+            start = np.minimum(queue, np.maximum(self.servers - busy, 0))
+            queue -= start
+            busy += start
+            if k % BLOCK == 0:
+                times = (k + np.arange(BLOCK))[:, None]*dt
+                curve = betas[0]/(1 + (times/betas[1])**betas[2])
+            survival += (start*curve[k % BLOCK, :, None]).sum(axis=(-1, -2))
+            flow = self._dispatch(state, free)
+            picked = flow.sum(axis=-1)
+            if picked.any():
+                state.scene -= picked
+                state.picked_up += picked.sum(axis=-1)
+                free -= picked.sum(axis=-1)
+                travelling += (flow*treatable).sum()
+                hospital_flow = np.moveaxis(flow, -1, 0)
+                drops[(k + self.delay) % length, hospitals] += hospital_flow
+                returns[(k + 2*self.delay) % length, hospitals] += hospital_flow.sum(axis=-1)
+                for later in set(((k + self.delay) % length).tolist() + ((k + 2*self.delay) % length).tolist()):
+                    pending[later] = True
+            if curves:
+                history["time"].append(t)
+                history["scene"].append(state.scene.copy())
+                history["queue"].append(queue.copy())
+                history["survival"].append(survival.copy())
+            k += 1
+            # over once nobody is left who could still start treatment
+            if not arriving and k % BLOCK == 0:
+                left = state.scene.sum() + travelling + (queue*treatable).sum()
+                if left < EPSILON*max(1, n_imm.size) or self.n_ambs == 0:
+                    break
+        if curves:
+            return survival, {name: np.array(values) for name, values in history.items()}
+        return survival
+
+"""
+expected_survival
+fluid survival of a scenario as batch.simulate reads it: its n_imm and n_del, 0 for
+either left out with arrivals over time, and otherwise the mean over the mandalay bay
+patient mix, by the midpoint rule on a MIX_GRID x MIX_GRID grid of totals and
+immediate shares, with the scenario's n_imm or n_del in place of that class's draw
+"""
+MIX_GRID = 8
+
+def expected_survival(scenario, selection="random", params=None, dt=DT):
+    fluid = Fluid(scenario, selection, params, dt)
+    if "arrival_log" in scenario or "arrival_rate" in scenario:
+        return float(fluid.run(scenario.get("n_imm", 0), scenario.get("n_del", 0)))
+    if "n_imm" in scenario and "n_del" in scenario:
+        return float(fluid.run(scenario["n_imm"], scenario["n_del"]))
+    u = (np.arange(MIX_GRID) + .5)/MIX_GRID
+    # totals 200..250 as a continuous uniform, immediate share uniform(.1, .4)
+    total = (199.5 + 51*u)[:, None]
+    n_imm = (.1 + .3*u)[None, :]*total
+    n_del = total - n_imm
+    n_imm = np.full(n_imm.shape, float(scenario["n_imm"])) if "n_imm" in scenario else n_imm
+    n_del = np.full(n_del.shape, float(scenario["n_del"])) if "n_del" in scenario else n_del
+    return float(fluid.run(n_imm, n_del).mean())
@@ -0,0 +1,473 @@
+#!/usr/bin/python3
+"""
+Command line tool for running the hospital queue simulation without the gui
+
+python -m hospital_queue run      one replication of a scenario
+python -m hospital_queue sweep    many replications per selection, written to csv
+python -m hospital_queue bench    times replications and reports replications per second
+python -m hospital_queue calibrate fits the travel and treatment models to records
+python -m hospital_queue optimize  searches for the best spread of the servers over the hospitals
+python -m hospital_queue rank      picks the best selection policy with a given probability of correct selection
+python -m hospital_queue whatif    answers from a metamodel of recorded sweeps, simulating when it is unsure
+python -m hospital_queue quantiles p50/p90/p99 of time to treatment and survival per class and hospital
+python -m hospital_queue analytic  Erlang C waits and an instant survival estimate, optionally a control variate
+python -m hospital_queue fluid     survival from a fluid approximation, a quick screen for very large incidents
+python -m hospital_queue serve     local HTTP/JSON service that runs submitted scenarios in a worker pool
+python -m hospital_queue live      one replication paced against the wall clock, pickups by the policy or typed in
+
+Only argparse and the standard library are imported at start-up, numpy and the
+simulation are imported by the subcommand that needs them and tkinter/matplotlib
+are never imported, so short jobs launched from a scheduler start fast
+"""
+import argparse
+import csv
+import sys
+import time
+
+SELECTIONS = ["random", "first", "last", "myopic"]
+
+def int_list(text):
+    return [int(x.strip()) for x in text.split(',')]
+
+def float_list(text):
+    return [float(x.strip()) for x in text.split(',')]
+
+# "2" is a constant 2 patients per minute, "0:3,60:1,180:0.2" changes the rate at minutes 0, 60 and 180
+def rate_list(text):
+    points = []
+    for part in text.split(','):
+        if ':' in part:
+            start, rate = part.split(':')
+            points.append([float(start), float(rate)])
+        else:
+            points.append([0.0, float(part)])
+    return points
+
+"""
+scenario
+builds the scenario dict (Simulation.true_init parameter names) from the arguments,
+anything left out comes from the mandalay bay test
+"""
+def scenario(args):
+    from batch import MANDALAY_BAY
+    s = dict(MANDALAY_BAY)
+    if args.imm is not None:
+        s["n_imm"] = args.imm
+    if args.delayed is not None:
+        s["n_del"] = args.delayed
+    if args.ambulances is not None:
+        s["n_ambs"] = args.ambulances
+    if args.distances is not None:
+        s["hos_dists"] = args.distances
+    if args.imm_servers is not None:
+        s["imm_servers"] = args.imm_servers
+    if args.del_servers is not None:
+        s["del_servers"] = args.del_servers
+    if args.arrival_log is not None:
+        s["arrival_log"] = args.arrival_log
+    if args.arrival_rate is not None:
+        s["arrival_rate"] = args.arrival_rate
+    if args.arrival_imm is not None:
+        s["arrival_imm"] = args.arrival_imm
+    if args.arrival_horizon is not None:
+        s["arrival_horizon"] = args.arrival_horizon
+    if args.params is not None:
+        s["params"] = args.params
+    n_hos = len(s["hos_dists"])
+    if len(s["imm_servers"]) != n_hos or len(s["del_servers"]) != n_hos:
+        raise SystemExit("need one distance, immediate server and delayed server count per hospital")
+    if "arrival_rate" in s:
+        from batch import arrival_horizon
+        try:
+            arrival_horizon(s)
+        except ValueError as e:
+            raise SystemExit("--arrival-rate: %s" % e)
+    return s
+
+def add_scenario_arguments(parser):
+    parser.add_argument('--imm', type=int, help="number of immediate class patients (default: mandalay bay draw)")
+    parser.add_argument('--del', dest='delayed', type=int, help="number of delayed class patients (default: mandalay bay draw)")
+    parser.add_argument('--ambulances', type=int, help="number of ambulances (default: 30)")
+    parser.add_argument('--distances', type=float_list, help="comma separated distance to each hospital")
+    parser.add_argument('--imm-servers', type=int_list, help="comma separated immediate servers per hospital")
+    parser.add_argument('--del-servers', type=int_list, help="comma separated delayed servers per hospital")
+    parser.add_argument('--arrival-log', help="casualties found over time, csv of time,type or a binary .bin log")
+    parser.add_argument('--arrival-rate', type=rate_list, help="Poisson arrivals per minute, or start:rate,... for a changing rate")
+    parser.add_argument('--arrival-imm', type=float, help="share of immediate patients among Poisson arrivals (default: .25)")
+    parser.add_argument('--arrival-horizon', type=float, help="no Poisson arrivals after this many minutes, needed unless --arrival-rate ends at 0")
+    parser.add_argument('--params', help="fitted parameter file from calibrate (default: $HOSPITAL_QUEUE_PARAMS)")
+
+"""
+stream_replications
+yields the observations of the seeds in seed order as batch.replications runs
+them, serially or in a worker pool, reporting progress on stderr
+run_replications is the list of them
+"""
+def stream_replications(seeds, selection, s, workers, quiet=False):
+    import batch
+    total = len(seeds)
+    start = shown = time.time()
+    done = 0
+    for record in batch.replications(seeds, selection, s, workers, order="seed"):
+        done += 1
+        if not quiet and (time.time() - shown > 0.1 or done == total):
+            shown = time.time()
+            sys.stderr.write("\r%s: %d/%d replications, %.1f per second" % (selection, done, total, done/max(shown - start, 1e-9)))
+        yield record.observation()
+    if not quiet:
+        sys.stderr.write("\n")
+
+def run_replications(seeds, selection, s, workers, quiet=False):
+    return list(stream_replications(seeds, selection, s, workers, quiet))
+
+# the rows, appended to kept as they go by
+def keep(rows, kept):
+    for row in rows:
+        kept.append(row)
+        yield row
+
+def write_rows(rows, out):
+    if out == '-':
+        csv.writer(sys.stdout).writerows(rows)
+    else:
+        with open(out, 'w') as writeFile:
+            csv.writer(writeFile).writerows(rows)
+
+def cmd_run(args):
+    import batch
+    import traces
+    trace = None
+    if args.replay_trace is not None:
+        trace = traces.TraceReplay(args.replay_trace)
+    elif args.record_trace is not None:
+        trace = traces.TraceRecorder(args.record_trace)
+    log = None
+    if args.event_log is not None:
+        import eventlog
+        log = eventlog.EventLog(args.event_log)
+    sim, row = batch.simulate(args.seed, args.selection, scenario(args), trace, log=log)
+    if args.record_trace is not None and args.replay_trace is None:
+        trace.close()
+    if log is not None:
+        log.close()
+    write_rows([row], '-')
+    if args.stats:
+        import stats
+        print(stats.format_report(stats.report(sim)))
+
+def cmd_sweep(args):
+    s = scenario(args)
+    for selection in args.selection:
+        seeds = range(args.first_seed, args.first_seed + args.replications)
+        out = selection + '.csv' if args.out is None else args.out.replace('{selection}', selection)
+        if args.registry is not None:
+            import registry
+            def progress(done, total, selection=selection):
+                if not args.quiet:
+                    sys.stderr.write("\r%s: %d/%d replications" % (selection, done, total))
+            obs = registry.run_registered(args.registry, seeds, selection, s, args.workers, callback=progress)
+            if not args.quiet:
+                sys.stderr.write("\n")
+            write_rows(obs, out)
+        else:
+            # rows are written as they finish and only kept for the metamodel store
+            obs = [] if args.record is not None else None
+            rows = stream_replications(seeds, selection, s, args.workers, args.quiet)
+            write_rows(rows if obs is None else keep(rows, obs), out)
+        if args.record is not None:
+            import metamodel
+            metamodel.record(args.record, selection, s, obs)
+
+def cmd_bench(args):
+    import batch
+    s = scenario(args)
+    for selection in args.selection:
+        start = time.time()
+        if args.shared:
+            # the workers write into shared memory and the mean is reduced in place
+            with batch.shared_replications(range(args.replications), selection, s, args.workers) as rows:
+                summary = rows.summary()
+            elapsed = time.time() - start
+            print("%s: %d replications in %.2f s, %.1f replications per second, mean survival %.3f"
+                  % (selection, args.replications, elapsed, args.replications/elapsed, summary["mean_survival"]))
+            continue
+        run_replications(range(args.replications), selection, s, args.workers, quiet=True)
+        elapsed = time.time() - start
+        print("%s: %d replications in %.2f s, %.1f replications per second" % (selection, args.replications, elapsed, args.replications/elapsed))
+
+def cmd_calibrate(args):
+    import calibration
+    if args.transport is None and args.treatment is None:
+        raise SystemExit("give --transport and/or --treatment records")
+    start = time.time()
+    transport = calibration.load_records(args.transport) if args.transport is not None else None
+    treatment = calibration.load_records(args.treatment) if args.treatment is not None else None
+    params = calibration.calibrate(transport, treatment, args.hospitals, not args.pooled)
+    calibration.write_params(params, args.out)
+    rows = sum(len(records) for records in (transport, treatment) if records is not None)
+    print("fitted %d records in %.2f s: travel_mu %.5f, travel_sigma %.5f, service means %.1f, %.1f -> %s"
+          % (rows, time.time() - start, params["travel_mu"], params["travel_sigma"],
+             params["service_means"][0], params["service_means"][1], args.out))
+
+def cmd_optimize(args):
+    import optimize
+    search = optimize.AllocationSearch(scenario(args), args.selection, args.replications, args.first_seed,
+                                       args.minimum, args.workers)
+    def moved(allocation, mean):
+        if not args.quiet:
+            sys.stderr.write("moved to imm %s del %s: %.2f (%d allocations simulated)\n"
+                             % (list(allocation[0]), list(allocation[1]), mean, len(search.cache)))
+    result = search.run(max_moves=args.max_moves, confirm_replications=args.confirm, confidence=args.confidence, callback=moved)
+    print(result.statement())
+
+def cmd_rank(args):
+    import ranking
+    kn = ranking.KN(args.selection, scenario(args), args.pcs, args.delta, args.n0, args.step,
+                    args.max_replications, args.first_seed, args.workers)
+    def progress(kn):
+        if not args.quiet:
+            sys.stderr.write("%d replications, still in: %s\n" % (kn.replications(), ", ".join(kn.alive)))
+    kn.run(progress)
+    print(kn.statement())
+
+def cmd_whatif(args):
+    import metamodel
+    start = time.time()
+    model = metamodel.Metamodel(args.record, args.selection)
+    fitted = time.time()
+    s = scenario(args)
+    mean, std, source = model.answer(s, args.tolerance, args.replications, args.first_seed)
+    print("%s: mean survival %.2f +/- %.2f from the %s (%d stored replications, fit %.2f s, answer %.3f s)"
+          % (args.selection, mean, std, source, model.size, fitted - start, time.time() - fitted))
+
+def cmd_quantiles(args):
+    import batch
+    import stats
+    start = time.time()
+    pool = batch.make_pool(args.workers)
+    try:
+        sketches = batch.sketch_quantiles(range(args.first_seed, args.first_seed + args.replications),
+                                          args.selection, scenario(args), pool)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    print(stats.format_quantiles(sketches, [q/100.0 for q in args.q]))
+    print("%d replications in %.1f s" % (args.replications, time.time() - start))
+
+def cmd_analytic(args):
+    import numpy as np
+    import analytic
+    import batch
+    s = scenario(args)
+    start = time.time()
+    approx = analytic.Approximation(s, args.selection)
+    # a class left out is the mean of the mandalay bay draw
+    n_imm = args.imm if args.imm is not None else 225*.25
+    n_del = args.delayed if args.delayed is not None else 225*.75
+    print(analytic.format_table(approx.table(n_imm, n_del)))
+    if args.imm is not None and args.delayed is not None:
+        print("%s: approximate survival %.2f (%.1f ms)" % (args.selection, approx.survival(n_imm, n_del), 1000*(time.time() - start)))
+    else:
+        mean = analytic.mix_mean(approx, args.imm, args.delayed)
+        print("%s: approximate survival %.2f over the patient mix (%.1f ms)" % (args.selection, mean, 1000*(time.time() - start)))
+    if args.replications:
+        if args.imm is not None and args.delayed is not None:
+            raise SystemExit("the control variate needs the patient mix drawn, leave out --imm or --del")
+        if "arrival_log" in s or "arrival_rate" in s:
+            raise SystemExit("the control variate needs everyone at the scene at time 0, leave out the arrivals")
+        obs = np.array(run_replications(range(args.first_seed, args.first_seed + args.replications),
+                                        args.selection, s, args.workers, quiet=True))
+        cv = analytic.control_variate(obs[:, 0], obs[:, 2], obs[:, 3], approx, mean)
+        print("%d replications: mean survival %.2f +/- %.2f, with the control variate %.2f +/- %.2f (variance ratio %.2f)"
+              % (args.replications, cv["plain"][0], cv["plain"][1], cv["controlled"][0], cv["controlled"][1], cv["ratio"]))
+
+def cmd_fluid(args):
+    import fluid
+    s = scenario(args)
+    for selection in args.selection:
+        start = time.time()
+        mean = fluid.expected_survival(s, selection, dt=args.dt)
+        print("%s: fluid survival %.2f (%.1f ms)" % (selection, mean, 1000*(time.time() - start)))
+        if args.replications:
+            import numpy as np
+            from statistics import NormalDist
+            obs = np.array(run_replications(range(args.first_seed, args.first_seed + args.replications),
+                                            selection, s, args.workers, quiet=True))
+            half = NormalDist().inv_cdf(.975)*obs[:, 0].std(ddof=1)/np.sqrt(len(obs))
+            print("%s: simulated survival %.2f +/- %.2f over %d replications" % (selection, obs[:, 0].mean(), half, len(obs)))
+
+def cmd_serve(args):
+    import service
+    sys.stderr.write("serving on http://%s:%d with %s workers\n" % (args.host, args.port, args.workers or "cpu count"))
+    service.serve(args.workers, args.host, args.port)
+
+def cmd_live(args):
+    import asyncio
+    import batch
+    import realtime
+    from engine import EVENT_NAMES
+    # the same replication run gives for the seed
+    sim = batch.setup(args.seed, args.selection, scenario(args))[0]
+
+    def show(kind, sim):
+        print("%8.1f min  %-17s  scene %d immediate, %d delayed, survival %.2f"
+              % (sim.clock, EVENT_NAMES[kind], sim.scene[0], sim.scene[1], sim.total_survival_probability))
+        sys.stdout.flush()
+
+    async def operator(runner):
+        loop = asyncio.get_running_loop()
+        typing = True
+        while True:
+            request = await runner.next_request()
+            if request is None:
+                return
+            if not typing:
+                # no more input, the selection decides the rest
+                await runner.decide(*sim.decide())
+                continue
+            print("ambulance %d waiting since %.1f min, scene %d immediate, %d delayed; type 'class hospital' (0 = immediate):"
+                  % (request.ambulance, request.since, request.view.scene[0], request.view.scene[1]))
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                typing = False
+                continue
+            try:
+                patient_type, hospital = [int(x) for x in line.split()]
+                await runner.decide(patient_type, hospital)
+            except ValueError as error:
+                print(error or "type two numbers")
+
+    async def main():
+        runner = realtime.RealTimeRunner(sim, args.scale, args.max_drift, args.operator, on_event=show)
+        if args.operator:
+            asyncio.ensure_future(operator(runner))
+        survival = await runner.run()
+        print("total survival %.2f, %d served, schedule moved %d times" % (survival, sim.served, runner.rebased))
+
+    asyncio.run(main())
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="hospital_queue", description="Hospital queue simulation for mass casualty incidents")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help="run one replication and print [survival, served, # immediate, # delayed]")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, default="random")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--record-trace', metavar='DIR', help="record the travel and treatment variates and pickups to DIR")
+    p.add_argument('--replay-trace', metavar='DIR', help="replay the travel and treatment variates and pickups recorded in DIR")
+    p.add_argument('--stats', action='store_true', help="also print queue lengths, utilization, waits and ambulance times")
+    p.add_argument('--event-log', metavar='FILE', help="write every event to FILE (read it with eventlog.load)")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser('sweep', help="run replications for one or more selections and write them to csv")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, nargs='+', default=["random"])
+    p.add_argument('--replications', type=int, default=100)
+    p.add_argument('--first-seed', type=int, default=0)
+    p.add_argument('--workers', type=int, default=None, help="worker processes, 1 runs serially (default: number of cpus)")
+    p.add_argument('--out', help="output csv, {selection} is replaced by the selection, - for stdout (default: <selection>.csv)")
+    p.add_argument('--quiet', action='store_true', help="no progress on stderr")
+    p.add_argument('--record', metavar='FILE', help="also append the replications to a metamodel store")
+    p.add_argument('--registry', metavar='DB', help="sqlite registry, replications already in it are not run again")
+    p.set_defaults(func=cmd_sweep)
+
+    p = sub.add_parser('bench', help="time replications and report replications per second")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, nargs='+', default=SELECTIONS)
+    p.add_argument('--replications', type=int, default=20)
+    p.add_argument('--workers', type=int, default=1)
+    p.add_argument('--shared', action='store_true', help="workers write fixed width rows to shared memory instead of returning them")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser('calibrate', help="fit travel and treatment parameters to records and write a parameter file")
+    p.add_argument('--transport', help="csv of hospital,distance,minutes per trip")
+    p.add_argument('--treatment', help="csv of hospital,class,minutes per treatment")
+    p.add_argument('--hospitals', type=int, help="number of hospitals (default: largest hospital number + 1)")
+    p.add_argument('--pooled', action='store_true', help="only fit the pooled parameters, no per hospital values")
+    p.add_argument('--out', default="params.json")
+    p.set_defaults(func=cmd_calibrate)
+
+    p = sub.add_parser('optimize', help="local search over server allocations with the same total servers per class")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, default="random")
+    p.add_argument('--replications', type=int, default=30, help="replications per allocation during the search")
+    p.add_argument('--first-seed', type=int, default=0)
+    p.add_argument('--confirm', type=int, help="replications on fresh seeds for the confidence statement (default: --replications)")
+    p.add_argument('--confidence', type=float, default=.95)
+    p.add_argument('--minimum', type=int, default=0, help="fewest servers of a class a hospital keeps")
+    p.add_argument('--max-moves', type=int, default=100)
+    p.add_argument('--workers', type=int, default=None, help="worker processes, 1 runs serially (default: number of cpus)")
+    p.add_argument('--quiet', action='store_true', help="no progress on stderr")
+    p.set_defaults(func=cmd_optimize)
+
+    p = sub.add_parser('rank', help="ranking and selection (KN) of the best selection policy")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, nargs='+', default=SELECTIONS)
+    p.add_argument('--pcs', type=float, default=.95, help="probability of correct selection")
+    p.add_argument('--delta', type=float, default=.5, help="indifference zone in expected survivors")
+    p.add_argument('--n0', type=int, default=10, help="first stage replications")
+    p.add_argument('--step', type=int, help="replications per policy per round (default: number of workers)")
+    p.add_argument('--max-replications', type=int, default=1000)
+    p.add_argument('--first-seed', type=int, default=0)
+    p.add_argument('--workers', type=int, default=None, help="worker processes, 1 runs serially (default: number of cpus)")
+    p.add_argument('--quiet', action='store_true', help="no progress on stderr")
+    p.set_defaults(func=cmd_rank)
+
+    p = sub.add_parser('whatif', help="mean survival of a scenario from the metamodel, simulated if it is too unsure")
+    add_scenario_arguments(p)
+    p.add_argument('--record', metavar='FILE', required=True, help="metamodel store written by sweep --record")
+    p.add_argument('--selection', choices=SELECTIONS, default="random")
+    p.add_argument('--tolerance', type=float, default=1.0, help="largest standard deviation answered without simulating")
+    p.add_argument('--replications', type=int, default=20, help="replications when it has to simulate")
+    p.add_argument('--first-seed', type=int, default=0)
+    p.set_defaults(func=cmd_whatif)
+
+    p = sub.add_parser('quantiles', help="quantiles of time to treatment and survival from streaming sketches")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, default="random")
+    p.add_argument('--replications', type=int, default=100)
+    p.add_argument('--first-seed', type=int, default=0)
+    p.add_argument('--q', type=float, nargs='+', default=[50, 90, 99], help="percentiles to report")
+    p.add_argument('--workers', type=int, default=None, help="worker processes, 1 runs serially (default: number of cpus)")
+    p.set_defaults(func=cmd_quantiles)
+
+    p = sub.add_parser('analytic', help="Erlang C waits and approximate survival in milliseconds, no simulation")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, default="random")
+    p.add_argument('--replications', type=int, default=0, help="also run replications and use the approximation as a control variate")
+    p.add_argument('--first-seed', type=int, default=0)
+    p.add_argument('--workers', type=int, default=None, help="worker processes, 1 runs serially (default: number of cpus)")
+    p.set_defaults(func=cmd_analytic)
+
+    p = sub.add_parser('fluid', help="survival from the fluid approximation, optionally checked against replications")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, nargs='+', default=SELECTIONS)
+    p.add_argument('--dt', type=float, default=2.0, help="minutes per step")
+    p.add_argument('--replications', type=int, default=0, help="also simulate this many replications to compare")
+    p.add_argument('--first-seed', type=int, default=0)
+    p.add_argument('--workers', type=int, default=None, help="worker processes, 1 runs serially (default: number of cpus)")
+    p.set_defaults(func=cmd_fluid)
+
+    p = sub.add_parser('serve', help="HTTP/JSON service: POST /jobs, GET /jobs/<id>, GET /jobs/<id>/events")
+    p.add_argument('--host', default="127.0.0.1", help="address to listen on (default: this machine only)")
+    p.add_argument('--port', type=int, default=8080)
+    p.add_argument('--workers', type=int, default=None, help="worker processes (default: number of cpus)")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser('live', help="run one replication in real time, scaled, for exercises")
+    add_scenario_arguments(p)
+    p.add_argument('--selection', choices=SELECTIONS, default="random")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--scale', type=float, default=60.0, help="simulated minutes per real minute")
+    p.add_argument('--max-drift', type=float, default=1.0, help="seconds an event may run late before the schedule moves")
+    p.add_argument('--operator', action='store_true', help="type every pickup decision instead of the selection")
+    p.set_defaults(func=cmd_live)
+    return parser
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
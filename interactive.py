@@ -1,25 +1,18 @@
 #!/usr/bin/python3
-import numpy as np
-import random
-from tkinter import *
 import csv
+import engine
+from engine import EMPTY, IMMEDIATE, DELAYED, BIG, PICKUP, EVENT_NAMES, sll_pen_imm, sll_pen_del, immalpha, delalpha
+from policies import ManualPolicy, make_policy
+# tkinter is only imported by the gui code so batch runs and the command line
+# tool (hospital_queue.py) never load it
 fields = 'Number of \'immediate\' class patients', 'Number of \'delayed\' class patients','Number of Ambulances', \
 'Number of Hospitals', 'Distance to Hospitals', 'Immediate Servers per Hospital', 'Delayed Servers per Hospital'
 
-EMPTY = -1
-IMMEDIATE = 0           # magic number 0
-DELAYED = 1             # magic number 1
-BIG = 1.0e30            # magic number to set the initial delay so that it happens way after the first arrival
-
-# survival probability betas for shifted log logistic
-sll_pen_imm = [0.3510, 35.838, 1.9886]          # shifted log logistic for penetrative wounds, immediate class
-sll_pen_del = [0.9124, 213.5976, 2.3445]        # shifted log logistic for penetrative wounds, delayed class
-immalpha = -0.0207
-delalpha = -0.0038
-
 # global for button use
 SELECTED_PATIENT = 0
 SELECTED_HOSPITAL = 0
+POLL_MS = 100           # how often the Test window checks for finished replications
+SELECTIONS = ["random", "first", "last", "myopic"]
 
 
 # mandalay bay test
@@ -29,59 +22,11 @@ SELECTED_HOSPITAL = 0
 # hospital del servers: 15, 12, 8
 # 30 ambulances
 
-"""
-Ambulance Object
-Keeps Track of:
-Destination = Hospital # or Scene (-1)
-Patient Type = IMMEDIATE, DELAYED, or EMPTY
-Next Pickup
-Next Hospital Arrival
-"""
-
-class Ambulance(object):
-    def __init__(self):
-        self.patient = None
-        self.pickup_time = 0.0
-        self.dropoff_time = BIG
-
-"""
-Hospital Object
-Keeps track of:
-Distance from Scene
-# immediate servers
-# delayed servers
-# immediate patients
-# delayed patients
-"""
-class Hospital(object):
-    def __init__(self, distance, servers_imm, servers_del):
-        self.distance = distance
-        self.servers_imm = servers_imm
-        self.servers_del = servers_del
-        self.patients_imm = 0
-        self.patients_del = 0
-
-"""
-Patient Object
-Keeps track of:
-Hospital Number
-Patient Type
-Time arrived at Service
-Time departing Service
-"""
-class Patient(object):
-    def __init__(self, patient_type, hospital_number=-1, arrival_time=BIG, departure_time=BIG):
-        self.patient_type = patient_type
-        self.hospital_number = hospital_number
-        self.arrival_time = arrival_time
-        self.departure_time = departure_time
-        self.survival_probability = 0.0
-        self.location = 0               # 0 for not moved, 1 for ambulance, 2 for hospital, 3 for done
-
 """
 Simulation Object
+The shared engine (engine.py) with the interactive pickup selection on top
 
-Input:
+Input (true_init):
 Number of IMMEDIATE patients = n_imm
 Number of DELAYED patients = n_del
 Number of Ambulances = n_ambs
@@ -89,285 +34,129 @@ Number of Hospitals = n_hos
 List of Hospital Distances = hos_dists [n_hos distances]
 List of Number of Immediate Servers per Hospital = imm_servers [n_hos #imm servers]
 List of Number of Delayed Servers per Hospital = del_servers [n_hos #del servers]
+Patient selection = selection ("random", "first", "last", "myopic")
+Casualties found later = arrivals, (time, patient type) in time order (see arrivals.py)
 
-Keep track of:
-Clock
-Array of Ambulances
-Array of Hospitals
-Array of Patients
-Next Pickup Time (minimum of Ambulances[i].next_ambulance_pickup)
-Next Hospital Arrival Time (minimum of Ambulances[i].next_ambulance_dropoff)
-Next Hospital Departure Time (minimum of Patients[i].departure_time)
-Patient Survival Probabilities (sum)
-Next Patient to be picked up (number of)
-
-Helper Functions:
-Choose Hospital Number (naively random)
-Choose Ambulance Number (naively random)
-Argmin function
-
-Events:
-Advance Time: go to the minimum time event
-Pickup Event: Ambulance X picks up Patient Y
-Hospital Arrival Event: Ambulance X gives Patient Y to Hospital Z
-Patient Departure Event: Patient X departs Hospital Y
+After is_select() the run goes through an engine.Stepper, one event per
+advance_time(), and a pickup waits for the user: the information and selection
+windows open and the Select button answers the pickup's DecisionRequest
 """
 
 # n_imm=20, n_del=50, n_ambs=2, n_hos=3, hos_dists=[5,10,20], imm_servers=[1,2,3], del_servers=[6,8,10], selection="random", seed=12
 
-class Simulation:
+class Simulation(engine.Simulation):
     def __init__(self, *args):
         self.clock = 0.0
         
-    def true_init(self, n_imm=20, n_del=50, n_ambs=2, n_hos=3, hos_dists=[5,10,20], imm_servers=[1,2,3], del_servers=[6,8,10], selection="random", seed=12):
-        random.seed(seed)
-        
-        # controls selection of patients
-        self._select = False
-        self.imm_picked = 0
-        self.del_picked = 0
-        #self._selected_patient = 0
-        #self._selected_hospital = 0
-        
-        # keeps track of time and our reward probability
-        self.clock = 0.0
-        self.total_survival_probability = 0.0
-        self.served = 0
-        self.limit = n_imm + n_del
-        self.patients_picked_up = 0
+    def true_init(self, n_imm=20, n_del=50, n_ambs=2, n_hos=3, hos_dists=[5,10,20], imm_servers=[1,2,3], del_servers=[6,8,10], selection="random", seed=12, verbose=True, arrivals=None, trace=None, params=None, sketches=None, log=None):
+        engine.Simulation.__init__(self, n_imm, n_del, n_ambs, n_hos, hos_dists, imm_servers, del_servers,
+                                   policy=make_policy(selection), seed=seed, arrivals=arrivals, trace=trace, params=params,
+                                   sketches=sketches, log=log)
         self.selection = selection
         
-        # keeps track of patients by location
-        self.imm_patients = [Patient(IMMEDIATE) for i in range(n_imm)]
-        self.del_patients = [Patient(DELAYED) for i in range(n_del)]
-        self.scene_patients = self.imm_patients + self.del_patients
-        self.amb_patients = []
-        self.hos_patients = []
-        
-        # keeps track of ambulances and hospital
-        self.ambulances = [Ambulance() for i in range(n_ambs)]
-        self.hospitals = [Hospital(hos_dists[i], imm_servers[i], del_servers[i]) for i in range(n_hos)]
+        # print each event to the console, turned off for batch runs
+        self.verbose = verbose
         
-        # used for determining events
-        self.next_ambulance_pickup_time = 0.0                     # min of ambulances[i].next_ambulance_pickup_time
-        self.next_ambulance_dropoff_time = BIG           # min of ambulances[i].next_ambulance_dropoff
-        self.next_patient_departure_time = BIG          # min of patients[i].departure_time
-        self.next_time_step = 0.0
-        
-        # used for determining parameters of events
-        # self.next_patient_to_pickup = 0
-        self.next_patient_to_dropoff = None
-        self.next_ambulance_to_pickup = 0
-        self.next_ambulance_to_dropoff = None
-        self.next_patient_to_depart = None
-    
+        # controls selection of patients
+        self._select = False
+        self.manual = ManualPolicy()
+        self.stepper = None
     
     """
     pickup patient selection
     """
     def is_select(self):
         self._select = True
+        if self.stepper is None:
+            self.stepper = engine.Stepper(self, on_event=self._show_event)
         return
     
     def patient_select(self, patient_type):
-        if patient_type == DELAYED:
-            self._selected_patient = len(self.scene_patients)-1
-        elif patient_type == IMMEDIATE:
-            self._selected_patient = 0
+        self.manual.select(patient_type=patient_type)
     
     def hospital_select(self, hospital_number):
-        self._selected_hospital = hospital_number
-    
-    """
-    Helper functions
-    """
-    def _argmin(self, times):
-        argmin = 0
-        for i in range(len(times)):
-            if times[i] < times[argmin]:
-                argmin = i
-        return argmin
-    
-    def _argmax(self, times):
-        argmax = 0
-        for i in range(len(times)):
-            if times[i] > times[argmax]:
-                argmax = i
-        return argmax
-    
-    def _random_hospital(self, hospital=None):
-        if (hospital is None):
-            hospital = np.random.randint(len(self.hospitals))
-        return hospital
-    
-    def generate_travel_time(self, distance):
-        # return 1.5*distance
-        return 60*np.random.lognormal(0.025*distance, 0.01*distance)
-    
-    # define methods needed to run the simulation
-    def generate_next_departure(self, patient_type):
-        if patient_type == IMMEDIATE:
-            #return 90
-            return np.random.exponential(90)
-        else:
-            #return 180
-            return np.random.exponential(180)
-        
-    # shifted log likelihood survival probability
-    def sll_surv_prob(self, time, t_class):
-        if (t_class == IMMEDIATE):
-            beta = sll_pen_imm
-        else:
-            beta = sll_pen_del
-        prob = beta[0]/(1 + (time/beta[1])**beta[2])
-        return prob
+        self.manual.select(hospital=hospital_number)
     
-    def _random_patient(self):
-        return np.random.randint(len(self.scene_patients))
-    
-    """
-    patient selection
-    myopic approach
-    tau_j * r_j * (mu_j/(mu_j + alpha))(beta_j*mu_j/(beta_j*mu_j+alpha))^(x_j+1-beta_j)
-    Tau_ij = mean of exponential travel time from location i to location j
-    R_j = probability of survival
-    B_j = # of servers
-    Mu_j = mean service time
-    Alpha = expected discount rate? Beta_1 in exponential (-.0207 for IMM, -0.0038 for DEL)
-    """
-    def _myopic_reward(self, patient_type, hospital):
-        # separate by whether patient is immediate or delayed
-        tau = 60*0.025*self.hospitals[hospital].distance
-        if patient_type == IMMEDIATE:
-            x = self.hospitals[hospital].patients_imm
-            immr = self.sll_surv_prob(self.clock+tau, IMMEDIATE)
-            immb = self.hospitals[hospital].servers_imm
-            immmu = self.clock + self.generate_next_departure(IMMEDIATE)
-            return (tau * immr * (immmu/(immmu+immalpha)) * (immb*immmu/(immb*immmu+immalpha))**(x+1-immb))
-        else:
-            x = self.hospitals[hospital].patients_imm
-            delr = self.sll_surv_prob(self.clock+tau, DELAYED)
-            delb = self.hospitals[hospital].servers_del
-            delmu = self.clock + self.generate_next_departure(DELAYED)
-            return (tau * delr * (delmu/(delmu+delalpha)) * (delb*delmu/(delb*delmu+delalpha))**(x+1-delb))
-        
-    def _myopic(self):
-        # create pair patient_num, hospital by reward
-        _opt = [0,0]
-        _del = None
-        _imm = None
-        if DELAYED in [patient.patient_type for patient in self.scene_patients]:
-            _del = [patient.patient_type for patient in self.scene_patients].index(DELAYED)
-        if IMMEDIATE in [patient.patient_type for patient in self.scene_patients]:
-            _imm = [patient.patient_type for patient in self.scene_patients].index(IMMEDIATE)
-        if (_del is None):
-            assert _imm is not None
-        for hospital in range(len(self.hospitals)):
-            if self._myopic_reward(IMMEDIATE, _opt[1]) < self._myopic_reward(DELAYED, hospital) and _del is not None:
-                _opt[0] = _del
-                _opt[1] = hospital
-            elif _imm is not None:
-                _opt[0] = _imm
-                _opt[1] = hospital
-        self.scene_patients[_opt[0]].hospital_number = _opt[1]
-        return(_opt[0])
+    def decide(self):
+        if self._select:
+            return self.manual.decide(self.view)
+        return engine.Simulation.decide(self)
     
     """
     advance_time
-    controls each step
+    controls each step, a pickup waits for the selection windows when selecting by hand
     """
-    
     def advance_time(self):
-        # bookkeeping variables
-        if (self.served == self.limit):
-            return self.total_survival_probability
-        #if next_time_step == BIG:
-            #print(self.__dict__)
-            #return self.total_survival_probability
-        self.clock = self.next_time_step
-        #print(str(self.next_ambulance_pickup_time), str(self.next_ambulance_dropoff_time), str(self.next_patient_departure_time))
-        if self.next_time_step == self.next_ambulance_pickup_time:
-            if len(self.scene_patients) > 0:
-                if self._select:
-                    print("There are ",str(len(self.imm_patients)-self.imm_picked), " IMMEDIATE triage class patients left at the scene")
-                    immatscene = "There are "+ str(len(self.imm_patients)-self.imm_picked) + " IMMEDIATE triage class patients left at the scene"
-                    print("There are ",str(len(self.del_patients)-self.del_picked), " DELAYED triage class patients left at the scene")
-                    delatscene = "There are " + str(len(self.del_patients)-self.del_picked) + " DELAYED triage class patients left at the scene"
-                    info = Tk()
-                    info.winfo_toplevel().title("Relevant Information")
-                    l1 = Label(info, text=immatscene)
-                    l1.grid(row=0, column=0)
-                    l2 = Label(info, text=delatscene)
-                    l2.grid(row=1, column=0)
-                    for i in range(len(self.ambulances)):
-                        if self.ambulances[i].pickup_time == BIG:
-                            if self.ambulances[i].patient.patient_type == 0:
-                                _type = "an IMMEDIATE"
-                            else:
-                                _type = "a DELAYED"
-                            print("Ambulance ", str(i), " is taking ", _type, 
-                                  " type patient to Hospital number ", str(self.ambulances[i].patient.hospital_number))
-                            #_text = "Ambulance "+ str(i), " is taking ", _type + " type patient to Hospital number " + str(self.ambulances[i].patient.hospital_number)
-                    for i in range(len(self.hospitals)):
-                        hos = self.hospitals[i]
-                        if hos.patients_imm > hos.servers_imm:
-                            print("IMMEDIATE Queue Size in Hospital ", str(i), ": ", str(hos.patients_imm - hos.servers_imm))
-                        else:
-                            print("Free IMMEDIATE Servers in Hospital ", str(i),": ", str(hos.servers_imm - hos.patients_imm))
-                        
-                        if hos.patients_del > hos.servers_del:
-                            print("DELAYED Queue Size in Hospital ", str(i), ": ", str(hos.patients_del - hos.servers_del))
-                        else:
-                            print("Free DELAYED Servers in Hospital ", str(i), ": ", str(hos.servers_del - hos.patients_del))
-                    select = Tk()
-                    select.winfo_toplevel().title("Select Patient to pickup")
-                    l1 = Label(select, text="Choose Patient Type")
-                    l1.grid(row=0, column=0)
-                    b1 = Button(select, text='IMMEDIATE',command=(lambda e=IMMEDIATE: self.change_patient(e)))
-                    b1.grid(row=1, column=0)
-                    b2 = Button(select, text='DELAYED', command=(lambda e=DELAYED: self.change_patient(e)))
-                    b2.grid(row=1, column=1)
-                    e1 = Entry(select)
-                    e1.grid(row=2, column=1)
-                    b3 = Button(select, text="Select Hospital", command=(lambda e=e1: self.change_hospital(e)))
-                    b3.grid(row=2, column=0)
-                    b4 = Button(select, text="Select", command=(lambda select=select, info=info: self._close(select, info)))
-                    b4.grid(row=3, column=1)
+        if self._select:
+            if self.stepper.request is not None:
+                print("Waiting for the pickup selection")
+                return PICKUP
+            kind = self.next_event()[1] if not self.done() else None
+            if self.stepper.step() is not None:
+                self.show_pickup_windows()
+            return kind
+        kind = engine.Simulation.advance_time(self)
+        self._show_event(kind)
+        return kind
+    
+    def _show_event(self, kind):
+        if self.verbose and kind is not None:
+            print(EVENT_NAMES[kind])
+            if kind != PICKUP:
+                print(self.total_survival_probability)
+    
+    def show_pickup_windows(self):
+        import tkinter as tk
+        print("There are ",str(self.scene[IMMEDIATE]), " IMMEDIATE triage class patients left at the scene")
+        immatscene = "There are "+ str(self.scene[IMMEDIATE]) + " IMMEDIATE triage class patients left at the scene"
+        print("There are ",str(self.scene[DELAYED]), " DELAYED triage class patients left at the scene")
+        delatscene = "There are " + str(self.scene[DELAYED]) + " DELAYED triage class patients left at the scene"
+        info = tk.Tk()
+        info.winfo_toplevel().title("Relevant Information")
+        l1 = tk.Label(info, text=immatscene)
+        l1.grid(row=0, column=0)
+        l2 = tk.Label(info, text=delatscene)
+        l2.grid(row=1, column=0)
+        for i in range(len(self.ambulances)):
+            if self.ambulances[i].patient is not None:
+                if self.ambulances[i].patient.patient_type == IMMEDIATE:
+                    _type = "an IMMEDIATE"
                 else:
-                    self.pickup_event()
-                    self.next_time_step = min(self.next_ambulance_dropoff_time, self.next_ambulance_pickup_time, self.next_patient_departure_time)
-                #print([ambulance.pickup_time for ambulance in self.ambulances])
-                #print([patient.hospital_number for patient in self.amb_patients])
-                return
-            else:
-                self.next_time_step = min(self.next_ambulance_dropoff_time, self.next_patient_departure_time)
-        if self.next_time_step == self.next_ambulance_dropoff_time:
-            if len(self.amb_patients) > 0:
-                print("dropoff event")
-                #print([patient.arrival_time for patient in self.amb_patients])
-                #print(self.next_patient_to_dropoff)
-                self.hospital_arrival_event()
-                #print(self.next_patient_to_dropoff)
-                # print([patient.arrival_time for patient in self.hos_patients])
-                # print([ambulance.pickup_time for ambulance in self.ambulances])
-                self.next_time_step = min(self.next_ambulance_dropoff_time, self.next_ambulance_pickup_time, self.next_patient_departure_time)
-                return
+                    _type = "a DELAYED"
+                print("Ambulance ", str(i), " is taking ", _type, 
+                      " type patient to Hospital number ", str(self.ambulances[i].patient.hospital_number))
+        for i in range(len(self.hospitals)):
+            hos = self.hospitals[i]
+            if hos.patients_imm > hos.servers_imm:
+                print("IMMEDIATE Queue Size in Hospital ", str(i), ": ", str(hos.patients_imm - hos.servers_imm))
             else:
-                self.next_time_step = self.next_patient_departure_time
-        if self.next_time_step == self.next_patient_departure_time:
-            if len(self.hos_patients) > 0:
-                print("patient departure")
-                #print([patient.departure_time for patient in self.hos_patients])
-                #print(self.total_survival_probability, self.served)
-                self.patient_departure_event()
-                #self.next_time_step = min(self.next_ambulance_dropoff_time, self.next_ambulance_pickup_time, self.next_patient_departure_time)
-                return
+                print("Free IMMEDIATE Servers in Hospital ", str(i),": ", str(hos.servers_imm - hos.patients_imm))
+            
+            if hos.patients_del > hos.servers_del:
+                print("DELAYED Queue Size in Hospital ", str(i), ": ", str(hos.patients_del - hos.servers_del))
             else:
-                return
+                print("Free DELAYED Servers in Hospital ", str(i), ": ", str(hos.servers_del - hos.patients_del))
+        select = tk.Tk()
+        select.winfo_toplevel().title("Select Patient to pickup")
+        l1 = tk.Label(select, text="Choose Patient Type")
+        l1.grid(row=0, column=0)
+        b1 = tk.Button(select, text='IMMEDIATE',command=(lambda e=IMMEDIATE: self.change_patient(e)))
+        b1.grid(row=1, column=0)
+        b2 = tk.Button(select, text='DELAYED', command=(lambda e=DELAYED: self.change_patient(e)))
+        b2.grid(row=1, column=1)
+        e1 = tk.Entry(select)
+        e1.grid(row=2, column=1)
+        b3 = tk.Button(select, text="Select Hospital", command=(lambda e=e1: self.change_hospital(e)))
+        b3.grid(row=2, column=0)
+        b4 = tk.Button(select, text="Select", command=(lambda select=select, info=info: self._close(select, info)))
+        b4.grid(row=3, column=1)
     
     def _close(self, select, info):
-        #print(str(SELECTED_PATIENT), ' ', str(SELECTED_HOSPITAL))
-        self.pickup_event()
+        try:
+            self.stepper.answer(self.manual.decide(self.view))
+        except ValueError as error:
+            print(error)
+            return
         info.destroy()
         select.destroy()
     
@@ -382,208 +171,112 @@ class Simulation:
         hospital_number = int(e.get())
         self.hospital_select(hospital_number)
         print("Patient will be moved to Hospital ", str(hospital_number))
-    
-    """
-    pickup_event
-    sets the attributes of ambulance number (self.next_ambulance), patient_number (self.next_patient)
-    set the ambulance's next pickup time to BIG, and generate hospital arrival time
-    updates self.next_ambulance to the ambulance with the minimum pickup time
-    updates self.next_patient to the next patient
-    updates self.next_ambulance_dropoff_time to that of self.next_ambulance
-    """
-    def pickup_event(self):
-        # grab variables/update patient
-        print("pickup event")
-        if self._select:
-            pnum = self._selected_patient
-            self.scene_patients[pnum].hospital_number = self._selected_hospital
-        elif self.selection == "random":
-            pnum = self._random_patient()
-            self.scene_patients[pnum].hospital_number = self._random_hospital()
-        elif self.selection == "myopic":
-            pnum = self._myopic()
-        elif self.selection == "last":
-            pnum = len(self.scene_patients)-1
-            self.scene_patients[pnum].hospital_number = self._random_hospital()
-        elif self.selection == "first":
-            pnum = 0
-            self.scene_patients[pnum].hospital_number = self._random_hospital()
-        
-        # increment correct patient type picked up from scene
-        if self.scene_patients[pnum].patient_type == IMMEDIATE:
-            self.imm_picked += 1
-        else:
-            self.del_picked += 1
-        
-        #print(pnum)
-        self.scene_patients[pnum].location = 1
-        _hospital = self.hospitals[self.scene_patients[pnum].hospital_number]
-        print(self.scene_patients[pnum].hospital_number)
-        self.scene_patients[pnum].arrival_time = self.clock + self.generate_travel_time(_hospital.distance)
-        
-        # update ambulance
-        self.ambulances[self.next_ambulance_to_pickup].patient = self.scene_patients[pnum]
-        self.ambulances[self.next_ambulance_to_pickup].pickup_time = BIG
-        self.ambulances[self.next_ambulance_to_pickup].dropoff_time = self.scene_patients[pnum].arrival_time
-        
-        # update global variables
-        self.next_ambulance_to_dropoff = self._argmin([ambulance.dropoff_time for ambulance in self.ambulances])
-        self.next_ambulance_dropoff_time = self.ambulances[self.next_ambulance_to_dropoff].dropoff_time
-        
-        # update patient arrays
-        self.amb_patients.append(self.scene_patients[pnum])
-        self.scene_patients.remove(self.scene_patients[pnum])
-        
-        self.next_patient_to_dropoff = self._argmin([patient.arrival_time for patient in self.amb_patients])
-        
-        if len(self.scene_patients) > 0:
-            self.next_ambulance_to_pickup = self._argmin([ambulance.pickup_time for ambulance in self.ambulances])
-            self.next_ambulance_pickup_time = self.ambulances[self.next_ambulance_to_pickup].pickup_time
-        else:
-            self.next_ambulance_to_pickup = None
-            self.next_ambulance_pickup_time = BIG
-        
-        self.patients_picked_up += 1
-        self.next_time_step = min(self.next_ambulance_dropoff_time, self.next_ambulance_pickup_time, self.next_patient_departure_time)
-        
-    def hospital_arrival_event(self):
-        # grab patient/hospital/ambulance
-        #_patient = self.next_patient_to_dropoff
-        self.amb_patients[self.next_patient_to_dropoff].location = 2
-        _ambulance = self.next_ambulance_to_dropoff
-        _hospital = self.hospitals[self.amb_patients[self.next_patient_to_dropoff].hospital_number]
-        
-        # update ambulance
-        self.ambulances[_ambulance].patient = None
-        self.ambulances[_ambulance].dropoff_time = BIG
-        self.ambulances[_ambulance].pickup_time = self.clock + self.generate_travel_time(_hospital.distance)
-        
-        # update hospital
-        if self.amb_patients[self.next_patient_to_dropoff].patient_type == IMMEDIATE:
-            self.hospitals[self.amb_patients[self.next_patient_to_dropoff].hospital_number].patients_imm += 1
-            if self.hospitals[self.amb_patients[self.next_patient_to_dropoff].hospital_number].patients_imm <= self.hospitals[self.amb_patients[self.next_patient_to_dropoff].hospital_number].servers_imm:
-                self.amb_patients[self.next_patient_to_dropoff].departure_time = self.clock + self.generate_next_departure(self.amb_patients[self.next_patient_to_dropoff].patient_type)
-                self.amb_patients[self.next_patient_to_dropoff].survival_probability = self.sll_surv_prob(self.clock, self.amb_patients[self.next_patient_to_dropoff].patient_type)
-            self.total_survival_probability += self.amb_patients[self.next_patient_to_dropoff].survival_probability
-        else:
-            self.hospitals[self.amb_patients[self.next_patient_to_dropoff].hospital_number].patients_del += 1
-            if self.hospitals[self.amb_patients[self.next_patient_to_dropoff].hospital_number].patients_del <= self.hospitals[self.amb_patients[self.next_patient_to_dropoff].hospital_number].servers_del:
-                self.amb_patients[self.next_patient_to_dropoff].departure_time = self.clock + self.generate_next_departure(self.amb_patients[self.next_patient_to_dropoff].patient_type)
-                self.amb_patients[self.next_patient_to_dropoff].survival_probability = self.sll_surv_prob(self.clock, self.amb_patients[self.next_patient_to_dropoff].patient_type)
-            self.total_survival_probability += self.amb_patients[self.next_patient_to_dropoff].survival_probability
-        
-        # update patient lists
-        self.hos_patients.append(self.amb_patients[self.next_patient_to_dropoff])
-        self.amb_patients.remove(self.amb_patients[self.next_patient_to_dropoff])
-        # update global variables
-        if len(self.amb_patients) > 0:
-            self.next_patient_to_dropoff = self._argmin([patient.arrival_time for patient in self.amb_patients])
-            self.next_ambulance_to_dropoff = self._argmin([ambulance.dropoff_time for ambulance in self.ambulances])
-            self.next_ambulance_dropoff_time = self.ambulances[_ambulance].dropoff_time
-        else:
-            self.next_patient_to_dropoff = -1
-            self.next_ambulance_to_dropoff = -1
-            self.next_ambulance_dropoff_time = BIG
-        
-        # get the next ambulance pickup time
-        if len(self.scene_patients) > 0:
-            self.next_ambulance_to_pickup = self._argmin([ambulance.pickup_time for ambulance in self.ambulances])
-            self.next_ambulance_pickup_time = self.ambulances[self.next_ambulance_to_pickup].pickup_time
+
+def test(selection="random", registry=None):
+    # assign all variables
+    # mandalay bay test, see batch.py
+    # with a registry database (see registry.py) replications run before are read back
+    import batch
+    if registry is not None:
+        import registry as experiments
+        obs = experiments.run_registered(registry, range(batch.REPLICATIONS), selection, batch.MANDALAY_BAY, workers=1)
+        for tup in obs:
+            print(tup)
+        batch.write_results(obs, selection)
+        return
+    # each replication is printed and written as it finishes, nothing is kept
+    def observations():
+        for record in batch.replications(range(batch.REPLICATIONS), selection, workers=1):
+            tup = record.observation()
+            print(tup)
+            yield tup
+    batch.write_results(observations(), selection)
+    return
+
+"""
+BatchWindow Object
+Runs the Test replications in a worker pool so the main window keeps working
+Keeps track of:
+Progress bar of finished replications
+Replications per second and ETA
+Partial results (running mean survival and each finished replication)
+Cancel button that stops the run
+
+The BatchRun thread hands Records back through its queue, poll() drains it from
+the Tk thread with after() so no Tk calls are made from another thread, and
+writes them to <selection>.csv as they come, so a cancelled run keeps its rows
+"""
+class BatchWindow(object):
+    def __init__(self, root, selection="random", replications=None):
+        import tkinter as tk
+        import tkinter.ttk
+        import batch
+        if replications is None:
+            replications = batch.REPLICATIONS
+        self.selection = selection
+        self.run = batch.BatchRun(range(replications), selection)
+        self.out = open(selection + '.csv', 'w')
+        self.writer = csv.writer(self.out)
         
-        self.next_patient_to_depart = self._argmin([patient.departure_time for patient in self.hos_patients])
-        self.next_patient_departure_time = self.hos_patients[self.next_patient_to_depart].departure_time
+        self.window = tk.Toplevel(root)
+        self.window.winfo_toplevel().title("Test: " + selection + " selection")
+        self.progress = tk.ttk.Progressbar(self.window, length=300, maximum=replications)
+        self.progress.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+        self.status = tk.Label(self.window, text="starting workers", anchor='w')
+        self.status.grid(row=1, column=0, columnspan=2, sticky='w', padx=5)
+        self.mean = tk.Label(self.window, text="", anchor='w')
+        self.mean.grid(row=2, column=0, columnspan=2, sticky='w', padx=5)
+        self.rows = tk.Listbox(self.window, width=50, height=10)
+        self.rows.grid(row=3, column=0, columnspan=2, padx=5, pady=5)
+        self.cancel_button = tk.Button(self.window, text='Cancel', command=self.cancel)
+        self.cancel_button.grid(row=4, column=1, padx=5, pady=5)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
         
-        print(self.total_survival_probability)
-        self.next_time_step = min(self.next_ambulance_dropoff_time, self.next_ambulance_pickup_time, self.next_patient_departure_time)
+        self.run.start()
+        self.window.after(POLL_MS, self.poll)
     
-    def patient_departure_event(self):
-        self.served += 1
-        # update patient
-        self.hos_patients[self.next_patient_to_depart].location = 3
-        
-        # update hospital
-        if self.hos_patients[self.next_patient_to_depart].patient_type == IMMEDIATE:
-            self.hospitals[self.hos_patients[self.next_patient_to_depart].hospital_number].patients_imm -= 1 
-        else:
-            self.hospitals[self.hos_patients[self.next_patient_to_depart].hospital_number].patients_del -= 1
-        
-        # update patient list
-        self.hos_patients.remove(self.hos_patients[self.next_patient_to_depart])
-        
-        if len(self.hos_patients) == 0:
-            self.next_patient_departure_time = BIG
+    def poll(self):
+        import tkinter as tk
+        if self.run.cancelled:
             return
-        
-        # select new next patient to depart
-        self.next_patient_to_depart = self._argmin([patient.departure_time for patient in self.hos_patients])
-        
-        for patient in self.hos_patients:
-            if patient.patient_type == self.hos_patients[self.next_patient_to_depart].patient_type:
-                patient.departure_time = self.clock + self.generate_next_departure(patient.patient_type)
-                patient.survival_probability = self.sll_surv_prob(self.clock, patient.patient_type)
-                if (self.hos_patients[self.next_patient_to_depart].patient_type == IMMEDIATE):
-                    self.hospitals[self.hos_patients[self.next_patient_to_depart].hospital_number].patients_imm += 1
-                else:
-                    self.hospitals[self.hos_patients[self.next_patient_to_depart].hospital_number].patients_del -= 1
-                break
-        
-        # update global variables
-        self.total_survival_probability += self.hos_patients[self.next_patient_to_depart].survival_probability
-        print(self.total_survival_probability)
-        self.next_time_step = min(self.next_ambulance_dropoff_time, self.next_ambulance_pickup_time, self.next_patient_departure_time)
-
-def test():
-    # assign all variables
-    # mandalay bay test
-    # immediate patients: uniform(10-40)% of uniform(200-250) total patients
-    # hospital distances: 5.59, 4.24, 6.95
-    # hospital imm servers: 6, 5, 0
-    # hospital del servers: 15, 12, 8
-    # 30 ambulances
-    num_ams = 30
-    num_hos = 3
-    hospital_distances = [5.59, 4.24, 6.95]
-    imm_arr = [6, 5, 0]
-    del_arr = [15, 12, 8]
-    obs = []
-    for i in range(100):
-        np.random.seed(i)
-        total_patients = np.random.randint(200, 251)
-        perc_imm = np.random.uniform(.1, .4)
-        num_imm = int(round(perc_imm*total_patients))
-        num_del = total_patients - num_imm
-        selection = "random"
-        #selection = "first"
-        #selection = "last"
-        #selection = "myopic"
-        s=Simulation()
-        s.true_init(num_imm, num_del, num_ams, num_hos, hospital_distances, imm_arr, del_arr, selection)
-        for i in range(total_patients*3):
-            s.advance_time()
-            tup = [s.total_survival_probability, s.served, num_imm, num_del]
-        print(tup)
-        obs.append(tup)
-    if (selection == "myopic"):
-        with open('myopic.csv', 'w') as writeFile:
-            writer = csv.writer(writeFile)
-            writer.writerows(obs)
-        writeFile.close()
-    elif (selection == "random"):
-        with open('random.csv', 'w') as writeFile:
-            writer = csv.writer(writeFile)
-            writer.writerows(obs)
-        writeFile.close()
-    elif (selection == "first"):
-        with open('first.csv', 'w') as writeFile:
-            writer = csv.writer(writeFile)
-            writer.writerows(obs)
-        writeFile.close()
-    elif (selection == "last"):
-        with open('last.csv', 'w') as writeFile:
-            writer = csv.writer(writeFile)
-            writer.writerows(obs)
-        writeFile.close()
-    return
+        try:
+            new = self.run.poll()
+        except Exception as error:
+            self.status.config(text="failed: " + str(error))
+            self.cancel_button.config(text='Close', command=self.close)
+            return
+        for record in new:
+            self.writer.writerow(record.observation())
+            self.rows.insert(tk.END, "replication %d: survival %.2f, served %d, %d immediate, %d delayed" % record)
+            self.rows.see(tk.END)
+        self.out.flush()
+        done = self.run.done
+        self.progress['value'] = done
+        if done > 0:
+            self.mean.config(text="mean survival over %d replications: %.3f" % (done, self.run.total_survival/done))
+        if self.run.finished():
+            self.out.close()
+            self.status.config(text="done: %d replications in %.1f s, written to %s.csv" % (done, self.run.elapsed(), self.selection))
+            self.cancel_button.config(text='Close', command=self.close)
+            return
+        eta = self.run.eta()
+        if eta is None:
+            self.status.config(text="%d/%d replications" % (done, len(self.run.seeds)))
+        else:
+            self.status.config(text="%d/%d replications, %.1f per second, ETA %.0f s" % (done, len(self.run.seeds), self.run.rate(), eta))
+        self.window.after(POLL_MS, self.poll)
+    
+    # partial results stay on screen and in the csv
+    def cancel(self):
+        self.run.cancel()
+        self.out.close()
+        self.status.config(text="cancelled after %d/%d replications, written to %s.csv" % (self.run.done, len(self.run.seeds), self.selection))
+        self.cancel_button.config(text='Close', command=self.close)
+    
+    def close(self):
+        self.run.cancel()
+        self.out.close()
+        self.window.destroy()
 
 def instantiate(e, SIM):
     # assign all variables
@@ -654,19 +347,19 @@ def advance(s):
     
     s.is_select()
     #if s.next_time_step == s.next_ambulance_pickup_time:
-        #select = Tk()
+        #select = tk.Tk()
         #select.winfo_toplevel().title("Select Patient to pickup")
-        #l1 = Label(select, text="Choose Patient Type")
+        #l1 = tk.Label(select, text="Choose Patient Type")
         #l1.grid(row=0, column=0)
-        #b1 = Button(select, text='IMMEDIATE',command=(lambda s=s, e=IMMEDIATE: change_patient(s,e)))
+        #b1 = tk.Button(select, text='IMMEDIATE',command=(lambda s=s, e=IMMEDIATE: change_patient(s,e)))
         #b1.grid(row=1, column=0)
-        #b2 = Button(select, text='DELAYED', command=(lambda s=s, e=DELAYED: change_patient(s,e)))
+        #b2 = tk.Button(select, text='DELAYED', command=(lambda s=s, e=DELAYED: change_patient(s,e)))
         #b2.grid(row=1, column=1)
-        #e1 = Entry(select)
+        #e1 = tk.Entry(select)
         #e1.grid(row=2, column=1)
-        #b3 = Button(select, text="Select Hospital", command=(lambda s=s, e=e1: change_hospital(s,e)))
+        #b3 = tk.Button(select, text="Select Hospital", command=(lambda s=s, e=e1: change_hospital(s,e)))
         #b3.grid(row=2, column=0)
-        #b4 = Button(select, text="Select", command=(lambda select=select, s=s: _close(select, s)))
+        #b4 = tk.Button(select, text="Select", command=(lambda select=select, s=s: _close(select, s)))
         #b4.grid(row=3, column=1)
         #s.advance_time()
     #else:
@@ -686,32 +379,37 @@ def show_dict(entries):
         print(key, entries[key])
 
 def makeform(root, fields):
+    import tkinter as tk
     entries = []
     for field in fields:
-        row = Frame(root)
-        lab = Label(row, width=35, text=field, anchor='w')
-        ent = Entry(row, width=35)
-        row.pack(side=TOP, fill=X, padx=5, pady=5)
-        lab.pack(side=LEFT)
-        ent.pack(side=RIGHT, expand=YES, fill=X)
+        row = tk.Frame(root)
+        lab = tk.Label(row, width=35, text=field, anchor='w')
+        ent = tk.Entry(row, width=35)
+        row.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+        lab.pack(side=tk.LEFT)
+        ent.pack(side=tk.RIGHT, expand=tk.YES, fill=tk.X)
         entries.append((field, ent))
     return entries
 
 if __name__ == '__main__':
-    root = Tk()
+    import tkinter as tk
+    root = tk.Tk()
     root.winfo_toplevel().title("Emergency Room Simulator")
     ents = makeform(root, fields)
     SIM = Simulation()#n_imm=20, n_del=12, n_ambs=1, n_hos=3, hos_dists=[1, 3, 6], imm_servers=[2, 2, 1], del_servers=[3, 2, 4])
     root.bind('<Return>', (lambda event, e=SIM.__dict__: show_dict(e)))
-    b1 = Button(root, text='Show',command=(lambda e=ents: fetch(e)))
-    b1.pack(side=LEFT, padx=5, pady=5)
-    b2 = Button(root, text = 'Quit', command=root.quit)
-    b2.pack(side=LEFT, padx=5, pady=5)
-    b3 = Button(root, text = 'Submit', command = (lambda e=ents: instantiate(e, SIM)))
-    b3.pack(side=RIGHT, padx=5, pady=5)
-    b4 = Button(root, text = 'Test', command = (lambda: test()))
-    b4.pack(side=RIGHT, padx=5, pady=5)
-    b5 = Button(root, text = 'Advance', command = (lambda s=SIM: advance(s)))
-    b5.pack(side=RIGHT, padx=5, pady=5)
+    b1 = tk.Button(root, text='Show',command=(lambda e=ents: fetch(e)))
+    b1.pack(side=tk.LEFT, padx=5, pady=5)
+    b2 = tk.Button(root, text = 'Quit', command=root.quit)
+    b2.pack(side=tk.LEFT, padx=5, pady=5)
+    b3 = tk.Button(root, text = 'Submit', command = (lambda e=ents: instantiate(e, SIM)))
+    b3.pack(side=tk.RIGHT, padx=5, pady=5)
+    selection = tk.StringVar(root, SELECTIONS[0])
+    b4 = tk.Button(root, text = 'Test', command = (lambda: BatchWindow(root, selection.get())))
+    b4.pack(side=tk.RIGHT, padx=5, pady=5)
+    o1 = tk.OptionMenu(root, selection, *SELECTIONS)
+    o1.pack(side=tk.RIGHT, padx=5, pady=5)
+    b5 = tk.Button(root, text = 'Advance', command = (lambda s=SIM: advance(s)))
+    b5.pack(side=tk.RIGHT, padx=5, pady=5)
     root.mainloop()
 
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+import numpy as np
+import csv
+import os
+
+"""
+Metamodel
+A Gaussian process fitted to stored replication results that answers what-if
+questions (more servers here, another ambulance, a different patient mix) in
+milliseconds, with the standard deviation of its estimate of the mean survival
+
+Results are stored as csv rows of selection, the scenario features and the survival:
+n_ambs, n_imm, n_del, distance to, immediate servers at, delayed servers at each hospital
+record() appends the replications of a scenario, sweep --record does it for every sweep
+
+One GP per selection, squared exponential kernel on standardized features, the length
+scale and noise picked by marginal likelihood on a small grid. Repeated rows average
+into one point with noise variance/count, more than max_points distinct rows are
+subsampled so a fit stays around a second.
+
+answer() falls back to simulating the scenario when the GP's standard deviation is
+above the tolerance, stores those replications and refits.
+"""
+
+MAX_POINTS = 800
+LENGTH_SCALES = [.25, .5, 1., 2., 4.]    # times sqrt(number of features)
+NOISE_RATIOS = [1e-3, 1e-2, 1e-1, .5]    # noise variance / signal variance
+
+def feature_names(n_hos):
+    return (["n_ambs", "n_imm", "n_del"] + ["distance_%d" % h for h in range(n_hos)] +
+            ["imm_servers_%d" % h for h in range(n_hos)] + ["del_servers_%d" % h for h in range(n_hos)])
+
+# feature vector of a scenario with n_imm immediate and n_del delayed patients
+def features(scenario, n_imm, n_del):
+    return ([scenario["n_ambs"], n_imm, n_del] + list(scenario["hos_dists"]) +
+            list(scenario["imm_servers"]) + list(scenario["del_servers"]))
+
+"""
+record
+appends the observations of replicate() ([survival, served, # immediate, # delayed])
+of scenario and selection to the csv store at path
+"""
+def record(path, selection, scenario, obs):
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='') as outfile:
+        writer = csv.writer(outfile)
+        if new:
+            writer.writerow(["selection"] + feature_names(len(scenario["hos_dists"])) + ["survival"])
+        for tup in obs:
+            writer.writerow([selection] + features(scenario, tup[2], tup[3]) + [tup[0]])
+
+# (features, survival) arrays of one selection from the store
+def load(path, selection):
+    X, y = [], []
+    with open(path, newline='') as infile:
+        reader = csv.reader(infile)
+        next(reader)
+        for row in reader:
+            if row and row[0] == selection:
+                X.append([float(x) for x in row[1:-1]])
+                y.append(float(row[-1]))
+    return np.array(X, dtype=float).reshape(len(X), -1), np.array(y, dtype=float)
+
+"""
+GP Object
+fit(X, y) then predict(X) -> (mean, standard deviation of the mean)
+"""
+class GP(object):
+    def __init__(self, max_points=MAX_POINTS, seed=0):
+        self.max_points = max_points
+        self.seed = seed
+
+    def _kernel(self, A, B):
+        d2 = (A*A).sum(1)[:, None] + (B*B).sum(1)[None, :] - 2*A.dot(B.T)
+        return np.exp(-np.maximum(d2, 0.0)/(2*self.length**2))
+
+    def fit(self, X, y):
+        if len(y) < 2:
+            raise ValueError("need at least two stored replications to fit a metamodel")
+        self.x_mean = X.mean(0)
+        self.x_std = np.where(X.std(0) > 0, X.std(0), 1.0)
+        Z = (X - self.x_mean)/self.x_std
+        # repeated rows become one point, their spread sets that point's noise
+        Z, inverse, counts = np.unique(Z, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        means = np.bincount(inverse, y)/counts
+        spread = np.bincount(inverse, (y - means[inverse])**2)/np.maximum(counts - 1, 1)
+        if len(means) > self.max_points:
+            keep = np.random.default_rng(self.seed).choice(len(means), self.max_points, replace=False)
+            Z, means, spread, counts = Z[keep], means[keep], spread[keep], counts[keep]
+        self.y_mean = means.mean()
+        self.y_std = means.std() if means.std() > 0 else 1.0
+        t = (means - self.y_mean)/self.y_std
+        # pooled within-row variance for rows seen once or without spread
+        pooled = np.mean(spread[counts > 1]) if np.any(counts > 1) else 0.0
+        within = np.where(counts > 1, spread, pooled)/self.y_std**2/counts
+
+        best = None
+        root = np.sqrt(Z.shape[1])
+        for length in LENGTH_SCALES:
+            self.length = length*root
+            K = self._kernel(Z, Z)
+            for ratio in NOISE_RATIOS:
+                try:
+                    L = np.linalg.cholesky(K + np.diag(within + ratio + 1e-8))
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = np.linalg.solve(L.T, np.linalg.solve(L, t))
+                evidence = -.5*t.dot(alpha) - np.log(np.diag(L)).sum()
+                if best is None or evidence > best[0]:
+                    best = (evidence, self.length, L, alpha)
+        self.evidence, self.length, self.L, self.alpha = best
+        self.Z = Z
+        return self
+
+    def predict(self, X):
+        Z = (np.atleast_2d(X) - self.x_mean)/self.x_std
+        k = self._kernel(Z, self.Z)
+        mean = self.y_mean + self.y_std*k.dot(self.alpha)
+        v = np.linalg.solve(self.L, k.T)
+        var = np.maximum(1.0 - (v*v).sum(0), 0.0)
+        return mean, self.y_std*np.sqrt(var)
+
+"""
+Metamodel Object
+What-if answers for one selection from the csv store at path
+Queries leave out n_imm and n_del to use the average stored patient mix
+"""
+class Metamodel(object):
+    def __init__(self, path, selection="random"):
+        self.path = path
+        self.selection = selection
+        self.refit()
+
+    def refit(self):
+        X, y = load(self.path, self.selection)
+        self.X = X
+        self.gp = GP().fit(X, y)
+        self.size = len(y)
+
+    def _features(self, scenario):
+        n_imm = scenario.get("n_imm", self.X[:, 1].mean())
+        n_del = scenario.get("n_del", self.X[:, 2].mean())
+        x = features(scenario, n_imm, n_del)
+        if len(x) != self.X.shape[1]:
+            raise ValueError("the store at %s has %d hospitals" % (self.path, (self.X.shape[1] - 3)//3))
+        return x
+
+    # (mean survival, standard deviation of that estimate)
+    def predict(self, scenario):
+        mean, std = self.gp.predict(self._features(scenario))
+        return float(mean[0]), float(std[0])
+
+    """
+    answer
+    returns (mean survival, standard deviation, "metamodel" or "simulation")
+    simulates replications seeds and stores them when the metamodel's standard deviation
+    is above tolerance
+    """
+    def answer(self, scenario, tolerance=1.0, replications=20, first_seed=0, pool=None):
+        mean, std = self.predict(scenario)
+        if std <= tolerance:
+            return mean, std, "metamodel"
+        import batch
+        obs = batch.run_many([(seed, self.selection, scenario) for seed in range(first_seed, first_seed + replications)], pool)
+        record(self.path, self.selection, scenario, obs)
+        self.refit()
+        survival = np.array([tup[0] for tup in obs])
+        return float(survival.mean()), float(survival.std(ddof=1)/np.sqrt(len(survival))), "simulation"
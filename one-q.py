@@ -1,10 +1,19 @@
 import numpy as np
+import argparse
+import time
 
 BIG = 1.0e30
+ARRIVAL_RATE = 3.       # customers per unit time, interarrival mean 1/3
+SERVICE_RATE = 4.       # services per unit time, service mean 1/4
+CHUNK = 1000000         # customers drawn at a time by lindley()
+BATCHES = 20            # batch means lindley() reports, whatever the chunk size
 
 class Simulation(object):
     # create the initial conditions for the simulation
-    def __init__(self):
+    def __init__(self, seed=None):
+        # its own random numbers, seed is an int or a numpy Generator
+        self.rng = np.random.default_rng(seed)
+
         # initialize the clock and 0 to an empty queue
         self.clock = 0.0
         self.num_in_system = 0
@@ -62,14 +71,107 @@ class Simulation(object):
             self.next_departure_time = BIG
     
     def generate_interarrival(self):
-        return np.random.exponential(1./3)
+        return self.rng.exponential(1./ARRIVAL_RATE)
     
     def generate_service(self):
-        return np.random.exponential(1./4)
+        return self.rng.exponential(1./SERVICE_RATE)
+
+"""
+lindley: the same M/M/1 queue without events
+waiting time in queue of customer n+1 is W(n+1) = max(0, W(n) + S(n) - A(n+1))
+with S service times and A interarrival times, unrolled over a chunk that is
+W(n) = C(n) - min(-W(0), min of C(1..n)), C the running sum of S - A,
+so a chunk is a cumsum and a minimum.accumulate and only the last wait carries over
+
+returns the mean wait in queue, mean time in system, fraction that waited
+and the mean wait of each of batches runs of consecutive customers (batch means,
+for a confidence interval), a batch's sum carries over the chunks it spans
+rng is a numpy Generator or a seed
+"""
+def lindley(n, arrival_rate=ARRIVAL_RATE, service_rate=SERVICE_RATE, chunk=CHUNK, rng=None, batches=BATCHES):
+    rng = np.random.default_rng(rng)
+    wait = 0.0
+    total_wait = 0.0
+    total_service = 0.0
+    waited = 0
+    # customers bounds[b] up to bounds[b + 1] are batch b
+    batches = max(1, min(batches, n))
+    bounds = [b*n//batches for b in range(batches + 1)]
+    batch_sums = np.zeros(batches)
+    b = 0
+    done = 0
+    while done < n:
+        m = min(chunk, n - done)
+        service = rng.exponential(1./service_rate, m)
+        interarrival = rng.exponential(1./arrival_rate, m)
+        c = np.cumsum(service - interarrival)
+        # waits of this chunk's customers, the first one waits what the last chunk left
+        waits = np.empty(m)
+        waits[0] = wait
+        waits[1:] = c[:-1] - np.minimum(np.minimum.accumulate(c[:-1]), -wait)
+        wait = c[-1] - min(c.min(), -wait)
+        total_wait += waits.sum()
+        total_service += service.sum()
+        waited += np.count_nonzero(waits > 0)
+        while b < batches and bounds[b] < done + m:
+            batch_sums[b] += waits[max(bounds[b], done) - done:min(bounds[b + 1], done + m) - done].sum()
+            if bounds[b + 1] > done + m:
+                break
+            b += 1
+        done += m
+    return total_wait/n, (total_wait + total_service)/n, waited/n, batch_sums/np.diff(bounds)
+
+# the analytic M/M/1 values
+def analytic(arrival_rate=ARRIVAL_RATE, service_rate=SERVICE_RATE):
+    rho = arrival_rate/service_rate
+    return {"wait": rho/(service_rate - arrival_rate), "system": 1./(service_rate - arrival_rate),
+            "waited": rho, "number": rho/(1 - rho)}
+
+# event driven estimate of the mean number in system over n departures
+# with the half width of a 95% interval from batches of the run
+def event_driven(n, batches=20, seed=None):
+    s = Simulation(seed)
+    means = []
+    for b in range(batches):
+        area, start = s.total_wait_time, s.clock
+        while s.num_departures < (b + 1)*n//batches:
+            s.advance_time()
+        means.append((s.total_wait_time - area)/(s.clock - start))
+    return s.total_wait_time/s.clock, 1.96*np.std(means, ddof=1)/np.sqrt(batches)
+
+def report(n, chunk=CHUNK, events=0, seed=None):
+    exact = analytic()
+    rng = np.random.default_rng(seed)
+    start = time.time()
+    wait, system, waited, batch_means = lindley(n, chunk=chunk, rng=rng)
+    elapsed = time.time() - start
+    if len(batch_means) > 1:
+        half = 1.96*batch_means.std(ddof=1)/np.sqrt(len(batch_means))
+    else:
+        half = np.nan
+    print("M/M/1 arrival rate %g, service rate %g, %d customers in %.1f s (%.1f million per second)"
+          % (ARRIVAL_RATE, SERVICE_RATE, n, elapsed, n/elapsed/1e6))
+    print("%-28s %10s %10s" % ("", "lindley", "analytic"))
+    print("%-28s %10.4f %10.4f  (+/- %.4f, %d batch means)" % ("mean wait in queue", wait, exact["wait"], half, len(batch_means)))
+    print("%-28s %10.4f %10.4f" % ("mean time in system", system, exact["system"]))
+    print("%-28s %10.4f %10.4f" % ("fraction that waited", waited, exact["waited"]))
+    print("%-28s %10.4f %10.4f" % ("mean number in system", ARRIVAL_RATE*system, exact["number"]))
+    if events:
+        number, half = event_driven(events, seed=rng)
+        print("%-28s %10.4f %10.4f  (+/- %.4f, event driven Simulation, %d departures)" % ("mean number in system", number, exact["number"], half, events))
 
-np.random.seed(0)
-s = Simulation()
-for i in range(1501):
-    s.advance_time()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="M/M/1 queue, event driven or by the Lindley recursion")
+    parser.add_argument('--lindley', type=int, metavar='N', help="simulate N customers with the vectorized Lindley recursion")
+    parser.add_argument('--chunk', type=int, default=CHUNK, help="customers per chunk, sets the memory used, not the batches")
+    parser.add_argument('--events', type=int, default=0, metavar='N', help="also run the event driven Simulation for N departures")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.lindley:
+        report(args.lindley, args.chunk, args.events, args.seed)
+    else:
+        s = Simulation(args.seed)
+        for i in range(1501):
+            s.advance_time()
 
-print (s.__dict__)
\ No newline at end of file
+        print (s.__dict__)
\ No newline at end of file
@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+import numpy as np
+from statistics import NormalDist
+import batch
+from batch import MANDALAY_BAY
+
+"""
+Server allocation search
+Finds how to spread a fixed surge staff (immediate and delayed servers) over the hospitals
+
+An allocation is (imm_servers, del_servers), tuples with one count per hospital.
+Every allocation keeps the scenario's total immediate and delayed servers, a move
+takes one server of a class from one hospital to another.
+
+Local search with common random numbers: every allocation is run on the same seeds
+(the same patient mix and random numbers), all neighbours of the current allocation
+are evaluated at once in the worker pool and the search moves to the neighbour with
+the best mean paired improvement until none improves. Every evaluation is cached by
+allocation so an allocation is never simulated twice.
+
+The confidence statement comes from fresh seeds: the best allocation and its
+neighbours are rerun on confirm_replications new seeds and the paired differences
+give Bonferroni lower bounds on how much better the best is than each neighbour.
+"""
+
+CONFIRM_SEED = 1000000  # confirmation seeds start here so they never overlap the search seeds
+
+def scenario_for(scenario, allocation):
+    s = dict(scenario)
+    s["imm_servers"], s["del_servers"] = list(allocation[0]), list(allocation[1])
+    return s
+
+"""
+AllocationSearch Object
+Input:
+Scenario, in Simulation.true_init parameter names = scenario (its servers are the start)
+Patient selection = selection
+Replications per allocation during the search = replications, on seeds first_seed...
+Fewest servers of a class a hospital keeps = minimum
+Worker processes = workers (1 runs serially)
+
+Keep track of:
+cache: allocation -> survival of every search replication
+path: the allocations the search moved through
+"""
+class AllocationSearch(object):
+    def __init__(self, scenario=MANDALAY_BAY, selection="random", replications=30, first_seed=0,
+                 minimum=0, workers=None):
+        self.scenario = scenario
+        self.selection = selection
+        self.seeds = list(range(first_seed, first_seed + replications))
+        self.minimum = minimum
+        self.workers = workers
+        self.cache = {}
+        self.path = []
+        self.pool = None
+
+    def start_allocation(self):
+        return (tuple(self.scenario["imm_servers"]), tuple(self.scenario["del_servers"]))
+
+    # every allocation one move away
+    def neighbors(self, allocation):
+        found = []
+        for c in range(2):
+            servers = allocation[c]
+            for i in range(len(servers)):
+                if servers[i] <= self.minimum:
+                    continue
+                for j in range(len(servers)):
+                    if i == j:
+                        continue
+                    moved = list(servers)
+                    moved[i] -= 1
+                    moved[j] += 1
+                    if c == 0:
+                        found.append((tuple(moved), allocation[1]))
+                    else:
+                        found.append((allocation[0], tuple(moved)))
+        return found
+
+    # survival per seed of each allocation, simulating only the ones not in cache
+    def evaluate(self, allocations, seeds=None, cache=True):
+        seeds = self.seeds if seeds is None else seeds
+        new = [a for a in dict.fromkeys(allocations) if not (cache and a in self.cache)]
+        tasks = [(seed, self.selection, scenario_for(self.scenario, a)) for a in new for seed in seeds]
+        obs = batch.run_many(tasks, self.pool)
+        results = {}
+        for k, a in enumerate(new):
+            results[a] = np.array([tup[0] for tup in obs[k*len(seeds):(k + 1)*len(seeds)]])
+            if cache:
+                self.cache[a] = results[a]
+        return [results[a] if a in results else self.cache[a] for a in allocations]
+
+    """
+    run
+    local search from start (default the scenario's servers) for at most max_moves moves,
+    then the confirmation run, callback(allocation, mean) is called after every move
+    returns the Result
+    """
+    def run(self, start=None, max_moves=100, confirm_replications=None, confidence=.95, callback=None):
+        current = start if start is not None else self.start_allocation()
+        self.pool = batch.make_pool(self.workers)
+        try:
+            current_obs = self.evaluate([current])[0]
+            self.path = [current]
+            for move in range(max_moves):
+                neighbors = self.neighbors(current)
+                if not neighbors:
+                    break
+                improvement = [np.mean(obs - current_obs) for obs in self.evaluate(neighbors)]
+                best = int(np.argmax(improvement))
+                if improvement[best] <= 0:
+                    break
+                current = neighbors[best]
+                current_obs = self.cache[current]
+                self.path.append(current)
+                if callback is not None:
+                    callback(current, current_obs.mean())
+            result = self.confirm(current, confirm_replications or len(self.seeds), confidence)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+            self.pool = None
+        return result
+
+    # reruns the allocation and its neighbours on fresh seeds
+    def confirm(self, allocation, replications, confidence=.95):
+        seeds = list(range(CONFIRM_SEED, CONFIRM_SEED + replications))
+        neighbors = self.neighbors(allocation)
+        obs = self.evaluate([allocation] + neighbors, seeds, cache=False)
+        return Result(allocation, obs[0], neighbors, obs[1:], confidence, len(self.cache))
+
+"""
+Result Object
+the best allocation, its survival on the confirmation seeds and the comparison to its neighbours
+mean, half_width: mean survival and the confidence interval half width
+lower_bounds: per neighbour, lower confidence bound of (best - neighbour) mean survival,
+jointly at the confidence level (Bonferroni)
+half_width and the lower bounds are None with a single replication
+"""
+class Result(object):
+    def __init__(self, allocation, obs, neighbors, neighbor_obs, confidence, evaluated):
+        self.allocation = allocation
+        self.confidence = confidence
+        self.evaluated = evaluated
+        self.replications = len(obs)
+        self.mean = obs.mean()
+        n = len(obs)
+        # one replication has no spread to bound anything with
+        self.half_width = NormalDist().inv_cdf(.5 + confidence/2)*obs.std(ddof=1)/np.sqrt(n) if n > 1 else None
+        self.neighbors = neighbors
+        z = NormalDist().inv_cdf(1 - (1 - confidence)/max(len(neighbors), 1))
+        self.lower_bounds = []
+        for other in neighbor_obs:
+            diff = obs - other
+            self.lower_bounds.append(diff.mean() - z*diff.std(ddof=1)/np.sqrt(n) if n > 1 else None)
+
+    # neighbours the best allocation is not shown to beat
+    def undecided(self):
+        return [a for a, bound in zip(self.neighbors, self.lower_bounds) if bound is None or bound <= 0]
+
+    def statement(self):
+        spread = " +/- %.2f" % self.half_width if self.half_width is not None else ""
+        text = ("best allocation imm_servers=%s del_servers=%s: mean survival %.2f%s (%d%%, %d replications, %d allocations simulated)"
+                % (list(self.allocation[0]), list(self.allocation[1]), self.mean, spread,
+                   round(100*self.confidence), self.replications, self.evaluated))
+        undecided = self.undecided()
+        if not undecided:
+            text += "\nwith %d%% confidence it beats all %d allocations one move away" % (round(100*self.confidence), len(self.neighbors))
+        else:
+            text += ("\nit beats %d of %d allocations one move away with %d%% confidence, not shown better than: %s"
+                     % (len(self.neighbors) - len(undecided), len(self.neighbors), round(100*self.confidence),
+                        "; ".join("%s %s" % (list(a[0]), list(a[1])) for a in undecided)))
+        return text
@@ -33,16 +33,16 @@ fig = plt.figure()
 myopic = fig.add_subplot(121)
 random = fig.add_subplot(122)
 myopic.scatter(myopic_total_patients, myopic_surv_rates, label="myopic selection")
-myopic.set_xlim(left=200, right=250)
-myopic.set_ylim(bottom=45, top=100)
-myopic.set_xticks(np.arange(200, 250, step=5))
-myopic.set_yticks(np.arange(50, 100, step=5))
+myopic.set_xlim(left=170, right=250)
+myopic.set_ylim(bottom=25, top=60)
+myopic.set_xticks(np.arange(170, 250, step=10))
+myopic.set_yticks(np.arange(25, 60, step=5))
 myopic.set_title("Myopic Selection")
 
 random.scatter(random_total_patients, random_surv_rates)
-random.set_xlim(200, 250)
-random.set_ylim(45, 100)
-random.set_xticks(range(200, 250, 5))
-random.set_yticks(range(45, 100, 5))
+random.set_xlim(170, 250)
+random.set_ylim(25, 60)
+random.set_xticks(range(170, 250, 10))
+random.set_yticks(range(25, 60, 5))
 random.set_title("Random Selection")
 plt.show()
\ No newline at end of file
@@ -0,0 +1,176 @@
+#!/usr/bin/python3
+import numpy as np
+from engine import IMMEDIATE, DELAYED, ALPHAS, sll_surv_prob, sll_surv_probs
+
+"""
+Policy Object
+Decides who the next free ambulance picks up and where it takes them
+
+decide(view) gets the engine's read-only StateView (see engine.py) and returns
+(patient type, hospital number), the patient type must still have someone at the scene
+Policies draw any randomness from view.rng so they follow the simulation's seed
+
+Batch policies set batch = True and implement score(state) instead: state is the
+engine's StateArrays and the result is a (2, n_hos) array of scores, rows
+IMMEDIATE, DELAYED, and the engine picks the best pair with someone at the scene
+score should only use numpy operations on the arrays so it also works on a stack
+of states, every array with extra leading dimensions
+"""
+class Policy(object):
+    batch = False
+
+    def decide(self, view):
+        raise NotImplementedError
+
+    def score(self, state):
+        raise NotImplementedError
+
+    # patient types with someone left at the scene
+    def available(self, view):
+        return [patient_type for patient_type in (IMMEDIATE, DELAYED) if view.scene[patient_type] > 0]
+
+    def random_hospital(self, view):
+        return int(view.rng.random()*view.n_hospitals)
+
+"""
+RandomPolicy
+picks a patient at the scene uniformly at random and a random hospital
+"""
+class RandomPolicy(Policy):
+    def decide(self, view):
+        n_imm, n_del = view.scene
+        if view.rng.random()*(n_imm + n_del) < n_imm:
+            patient_type = IMMEDIATE
+        else:
+            patient_type = DELAYED
+        return patient_type, self.random_hospital(view)
+
+"""
+FirstPolicy
+IMMEDIATE patients first (the front of the scene list), random hospital
+"""
+class FirstPolicy(Policy):
+    def decide(self, view):
+        return self.available(view)[0], self.random_hospital(view)
+
+"""
+LastPolicy
+DELAYED patients first (the back of the scene list), random hospital
+"""
+class LastPolicy(Policy):
+    def decide(self, view):
+        return self.available(view)[-1], self.random_hospital(view)
+
+"""
+MyopicPolicy
+patient selection, myopic approach, as second.py's _myopic
+tau_j * r_j * (mu_j/(mu_j + alpha))(beta_j*mu_j/(beta_j*mu_j+alpha))^(x_j+1-beta_j)
+Tau_ij = travel time from location i to location j, a draw
+R_j = probability of survival
+B_j = # of servers
+Mu_j = clock + a treatment time draw
+Alpha = expected discount rate? Beta_1 in exponential (-.0207 for IMM, -0.0038 for DEL)
+X_j = patients picked up so far
+goes through the hospitals comparing the IMMEDIATE reward at the best hospital so
+far with the DELAYED reward at this one, the class it ends on is picked up and,
+as in second.py, taken to a random hospital
+"""
+class MyopicPolicy(Policy):
+    def reward(self, view, patient_type, hospital):
+        tau = view.travel_time(hospital)
+        x = view.patients_picked_up
+        r = sll_surv_prob(view.clock + tau, patient_type)
+        b = view.servers(hospital, patient_type)
+        mu = view.clock + view.service_time(patient_type, hospital)
+        alpha = ALPHAS[patient_type]
+        return tau * r * (mu/(mu+alpha)) * (b*mu/(b*mu+alpha))**(x+1-b)
+
+    def decide(self, view):
+        n_imm, n_del = view.scene
+        patient_type, best = self.available(view)[0], 0
+        for hospital in range(view.n_hospitals):
+            if self.reward(view, IMMEDIATE, best) < self.reward(view, DELAYED, hospital) and n_del > 0:
+                patient_type, best = DELAYED, hospital
+            elif n_imm > 0:
+                patient_type, best = IMMEDIATE, hospital
+        return patient_type, self.random_hospital(view)
+
+"""
+MyopicScorePolicy
+the myopic reward for every (class, hospital) pair in one go with the mean
+travel time, a treatment time draw and x_j the patients of the class already
+at hospital j, the largest reward wins, class and hospital both
+"""
+class MyopicScorePolicy(Policy):
+    batch = True
+
+    def score(self, state):
+        clock = np.asarray(state.clock, dtype=float)[..., None, None]
+        tau = state.travel[..., None, :]
+        x = state.patients
+        r = sll_surv_probs(clock + tau)
+        b = state.servers
+        mu = clock + state.rng.exponential(state.service_means, size=np.shape(x))
+        alpha = ALPHAS[:, None]
+        return tau * r * (mu/(mu+alpha)) * (b*mu/(b*mu+alpha))**(x+1-b)
+
+"""
+LinearPolicy
+a learned policy, the score of every (class, hospital) pair is a weighted sum of
+features computed from the state arrays
+features, in order: 1, patients/servers, free servers, queue length, distance,
+share of the scene in that class
+weights has shape (2, 6), one row per class, or (6,) for both classes
+"""
+class LinearPolicy(Policy):
+    batch = True
+    n_features = 6
+
+    def __init__(self, weights):
+        self.weights = np.broadcast_to(np.asarray(weights, dtype=float), (2, self.n_features))
+        # one (2, 1) column per feature so it broadcasts over the hospitals
+        self.columns = [self.weights[:, i, None] for i in range(self.n_features)]
+
+    def _features(self, state):
+        load = state.patients/np.maximum(state.servers, 1)
+        free = np.maximum(state.servers - state.busy, 0)
+        distance = state.distances[..., None, :]
+        share = (state.scene/np.maximum(state.scene.sum(axis=-1, keepdims=True), 1))[..., :, None]
+        return [load, free, state.waiting, distance, share]
+
+    # (..., 2, n_hos, 6) feature array, for fitting the weights
+    def features(self, state):
+        load = state.patients/np.maximum(state.servers, 1)
+        return np.stack([np.broadcast_to(f, np.shape(load)) for f in [np.ones(np.shape(load))] + self._features(state)], axis=-1)
+
+    def score(self, state):
+        score = self.columns[0]
+        for column, feature in zip(self.columns[1:], self._features(state)):
+            score = score + column*feature
+        return score
+
+"""
+ManualPolicy
+the decision someone picked by hand (the interactive gui), select() sets it
+"""
+class ManualPolicy(Policy):
+    def __init__(self, patient_type=IMMEDIATE, hospital=0):
+        self.patient_type = patient_type
+        self.hospital = hospital
+
+    def select(self, patient_type=None, hospital=None):
+        if patient_type is not None:
+            self.patient_type = patient_type
+        if hospital is not None:
+            self.hospital = hospital
+
+    def decide(self, view):
+        return self.patient_type, self.hospital
+
+POLICIES = {"random": RandomPolicy, "first": FirstPolicy, "last": LastPolicy, "myopic": MyopicPolicy}
+
+# policy object for a selection name ("random", "first", "last", "myopic")
+def make_policy(selection):
+    if selection not in POLICIES:
+        raise ValueError("unknown selection %r, pick one of %s" % (selection, ", ".join(POLICIES)))
+    return POLICIES[selection]()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+"""
+IndexedHeap Object
+Min heap over the keys 0..n-1 (ambulance or hospital numbers), each with a priority
+update(key, priority) moves a key up or down in O(log n) (decrease and increase key)
+top() is the (priority, key) with the smallest priority in O(1), ties go to the
+smaller key, the same choice as scanning the keys in order for the minimum
+
+heap: keys in heap order
+position: position of each key in heap
+priority: priority of each key
+"""
+class IndexedHeap(object):
+    __slots__ = ('heap', 'position', 'priority')
+
+    def __init__(self, priorities):
+        self.priority = list(priorities)
+        self.heap = sorted(range(len(self.priority)), key=lambda key: (self.priority[key], key))
+        self.position = [0]*len(self.heap)
+        for i, key in enumerate(self.heap):
+            self.position[key] = i
+
+    def __len__(self):
+        return len(self.heap)
+
+    def top(self, empty=None):
+        if not self.heap:
+            return empty
+        key = self.heap[0]
+        return self.priority[key], key
+
+    def update(self, key, priority):
+        old = self.priority[key]
+        self.priority[key] = priority
+        if (priority, key) < (old, key):
+            self._up(self.position[key])
+        elif priority != old:
+            self._down(self.position[key])
+
+    def _less(self, a, b):
+        pa, pb = self.priority[a], self.priority[b]
+        return pa < pb or (pa == pb and a < b)
+
+    def _up(self, i):
+        heap, position = self.heap, self.position
+        key = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            above = heap[parent]
+            if not self._less(key, above):
+                break
+            heap[i] = above
+            position[above] = i
+            i = parent
+        heap[i] = key
+        position[key] = i
+
+    def _down(self, i):
+        heap, position = self.heap, self.position
+        n = len(heap)
+        key = heap[i]
+        while True:
+            child = 2*i + 1
+            if child >= n:
+                break
+            if child + 1 < n and self._less(heap[child + 1], heap[child]):
+                child += 1
+            below = heap[child]
+            if not self._less(below, key):
+                break
+            heap[i] = below
+            position[below] = i
+            i = child
+        heap[i] = key
+        position[key] = i
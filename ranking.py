@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+import numpy as np
+import os
+import batch
+from batch import MANDALAY_BAY
+
+"""
+Ranking and selection of patient selection policies
+Kim and Nelson's fully sequential procedure (KN) with common random numbers
+
+Every surviving policy is run on the same seeds. After n0 first replications
+the variance of each pairwise difference sets how far apart two running means must
+be, a policy falls out as soon as its mean is that far below another survivor's,
+the bound shrinks as replications pile up. When one policy is left it is the best
+with probability at least pcs, provided the best is at least delta (expected
+survivors) ahead of the rest, the indifference zone.
+
+Replications run in rounds of `step` seeds for every survivor in the worker pool,
+eliminations are still checked one replication at a time, a round only means a few
+replications more than KN strictly needs for the policies eliminated mid round.
+"""
+
+"""
+KN Object
+Input:
+Policies to compare = selections
+Scenario, in Simulation.true_init parameter names = scenario
+Probability of correct selection = pcs
+Indifference zone = delta, in expected survivors
+First replications = n0
+Replications per round = step (defaults to the number of workers)
+Most replications per policy = max_replications, the best mean so far wins if it runs out
+Worker processes = workers (1 runs serially)
+
+Keep track of:
+obs: survival per seed of every policy
+alive: policies still in the running
+eliminated: policy -> replications it had when it fell out
+"""
+class KN(object):
+    def __init__(self, selections, scenario=MANDALAY_BAY, pcs=.95, delta=.5, n0=10, step=None,
+                 max_replications=1000, first_seed=0, workers=None):
+        if len(selections) < 2:
+            raise ValueError("need at least two policies to compare")
+        if n0 < 2:
+            raise ValueError("n0 must be at least 2")
+        self.selections = list(selections)
+        self.scenario = scenario
+        self.pcs = pcs
+        self.delta = delta
+        self.n0 = n0
+        self.step = step
+        self.max_replications = max_replications
+        self.first_seed = first_seed
+        self.workers = workers
+        self.obs = {selection: [] for selection in self.selections}
+        self.alive = list(self.selections)
+        self.eliminated = {}
+        self.exhausted = False
+
+        k = len(self.selections)
+        eta = .5*((2*(1 - pcs)/(k - 1))**(-2.0/(n0 - 1)) - 1)
+        self.h2 = 2*eta*(n0 - 1)
+
+    # runs the next replications of every surviving policy
+    def _replicate(self, pool, count):
+        start = self.first_seed + len(self.obs[self.alive[0]])
+        seeds = range(start, start + count)
+        tasks = [(seed, selection, self.scenario) for selection in self.alive for seed in seeds]
+        obs = batch.run_many(tasks, pool)
+        for k, selection in enumerate(self.alive):
+            self.obs[selection].extend(tup[0] for tup in obs[k*count:(k + 1)*count])
+
+    # elimination at replication r, with the first stage variances s2
+    def _screen(self, r, s2):
+        means = {selection: np.mean(self.obs[selection][:r]) for selection in self.alive}
+        out = []
+        for i in self.alive:
+            for l in self.alive:
+                if i == l:
+                    continue
+                w = max(0.0, self.delta/(2*r)*(self.h2*s2[i, l]/self.delta**2 - r))
+                if means[i] < means[l] - w:
+                    out.append(i)
+                    break
+        for selection in out:
+            self.alive.remove(selection)
+            self.eliminated[selection] = r
+
+    """
+    run
+    replicates until one policy is left or max_replications, callback(self) after every round
+    returns the winning selection
+    """
+    def run(self, callback=None):
+        pool = batch.make_pool(self.workers)
+        try:
+            step = self.step or (1 if pool is None else self.workers or os.cpu_count() or 1)
+            self._replicate(pool, self.n0)
+            s2 = {}
+            for i in self.selections:
+                for l in self.selections:
+                    if i != l:
+                        s2[i, l] = np.var(np.subtract(self.obs[i], self.obs[l]), ddof=1)
+            r = self.n0
+            self._screen(r, s2)
+            if callback is not None:
+                callback(self)
+            while len(self.alive) > 1:
+                count = min(step, self.max_replications - r)
+                if count <= 0:
+                    self.exhausted = True
+                    break
+                self._replicate(pool, count)
+                for r in range(r + 1, r + count + 1):
+                    self._screen(r, s2)
+                    if len(self.alive) == 1:
+                        break
+                r = len(self.obs[self.alive[0]])
+                if callback is not None:
+                    callback(self)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return self.winner()
+
+    def winner(self):
+        return max(self.alive, key=lambda selection: np.mean(self.obs[selection]))
+
+    def means(self):
+        return {selection: np.mean(self.obs[selection]) for selection in self.selections}
+
+    def replications(self):
+        return sum(len(obs) for obs in self.obs.values())
+
+    def statement(self):
+        winner = self.winner()
+        means = self.means()
+        lines = []
+        if self.exhausted:
+            lines.append("no single winner after %d replications, best mean so far: %s (still in: %s)"
+                         % (self.max_replications, winner, ", ".join(self.alive)))
+        else:
+            lines.append("%s is the best policy with probability >= %.2f (indifference zone %.2f survivors)"
+                         % (winner, self.pcs, self.delta))
+        for selection in sorted(self.selections, key=lambda s: -means[s]):
+            n = len(self.obs[selection])
+            note = "eliminated after %d" % self.eliminated[selection] if selection in self.eliminated else "kept"
+            lines.append("  %-8s mean survival %.2f, %d replications, %s" % (selection, means[selection], n, note))
+        lines.append("%d replications in total" % self.replications())
+        return "\n".join(lines)
@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+import asyncio
+import time
+from engine import PICKUP
+
+"""
+Real time runs
+Paces a Simulation against the wall clock for live exercises: scale simulated
+minutes go by per real minute (60: an hour of incident per minute) and every event
+happens when its scaled time comes round
+
+The runner is the pacer of Simulation.decisions() (see engine.py) and sleeps
+until each event's wall time on asyncio, so other coroutines
+(operators, a web front end, more runners) share the loop. An event that fires late
+(a busy loop, a slow client) by more than max_drift seconds moves the schedule back
+by the lateness instead of rushing the events after it, so the drift from the
+schedule stays under max_drift and the moves are counted in rebased.
+
+With operator=True pickups wait for a person: next_request() returns the pickup
+waiting for a decision and decide(patient type, hospital) makes it. The incident
+goes on meanwhile, dropoffs, departures and scene arrivals keep happening at their
+times and the ambulance leaves when the decision comes in. Otherwise the
+simulation's policy decides as usual.
+
+runner = RealTimeRunner(sim, scale=60, operator=True)
+task = asyncio.ensure_future(runner.run())
+request = await runner.next_request()
+await runner.decide(IMMEDIATE, 0)
+"""
+
+SCALE = 60.0            # simulated minutes per real minute
+MAX_DRIFT = 1.0         # seconds an event may fire late before the schedule moves
+
+"""
+RealTimeRunner Object
+Input:
+Simulation = sim, set up and not yet run
+Simulated minutes per real minute = scale
+Seconds an event may run late before the schedule moves = max_drift
+Pickups decided by a person = operator
+Called with (kind, sim) after every event = on_event (optional)
+
+pause(), resume() and set_scale(scale) take effect at once, run() returns the
+total survival probability when the incident is over
+"""
+class RealTimeRunner(object):
+    def __init__(self, sim, scale=SCALE, max_drift=MAX_DRIFT, operator=False, on_event=None, clock=time.monotonic):
+        if scale <= 0:
+            raise ValueError("scale must be positive")
+        self.sim = sim
+        self.scale = float(scale)
+        self.max_drift = max_drift
+        self.operator = operator
+        self.on_event = on_event
+        self.clock = clock
+        self.paused = False
+        self.rebased = 0
+        self.worst_drift = 0.0
+        # wall time of simulated time anchor_sim, the schedule is a line through it
+        self.anchor_wall = None
+        self.anchor_sim = sim.clock
+        self.request = None
+        self._requested = None
+        self._wake = None
+
+    # wall time of simulated time t and simulated time of the wall clock
+    def wall_time(self, t):
+        return self.anchor_wall + (t - self.anchor_sim)*60.0/self.scale
+
+    def sim_time(self):
+        if self.paused:
+            return self.anchor_sim
+        return self.anchor_sim + (self.clock() - self.anchor_wall)*self.scale/60.0
+
+    def _rebase(self):
+        self.anchor_sim = self.sim_time()
+        self.anchor_wall = self.clock()
+        self._wake.set()
+
+    def set_scale(self, scale):
+        if scale <= 0:
+            raise ValueError("scale must be positive")
+        if self.anchor_wall is not None:
+            self._rebase()
+        self.scale = float(scale)
+
+    def pause(self):
+        if not self.paused and self.anchor_wall is not None:
+            self._rebase()
+        self.paused = True
+
+    def resume(self):
+        if self.paused:
+            self.paused = False
+            if self.anchor_wall is not None:
+                self.anchor_wall = self.clock()
+                self._wake.set()
+
+    """
+    The pacer Simulation.decisions() runs with
+    until(t, request) sleeps until simulated time t is due and returns True, or False
+    as soon as the request waiting for a decision (if any) is answered
+    """
+    async def until(self, t, request=None):
+        answered = None
+        try:
+            while True:
+                if request is not None and request.answered():
+                    return False
+                late = None
+                if not self.paused and t is not None:
+                    late = self.clock() - self.wall_time(t)
+                    if late >= 0:
+                        if late > self.max_drift:
+                            # running late, move the schedule instead of rushing what comes next
+                            self.anchor_wall += late
+                            self.rebased += 1
+                        self.worst_drift = max(self.worst_drift, min(late, self.max_drift))
+                        return True
+                self._wake.clear()
+                waits = [asyncio.ensure_future(self._wake.wait())]
+                if request is not None:
+                    if answered is None:
+                        answered = asyncio.ensure_future(request.wait())
+                    waits.append(answered)
+                timeout = None if late is None else -late
+                await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                waits[0].cancel()
+        finally:
+            if answered is not None:
+                answered.cancel()
+
+    def now(self):
+        return self.sim_time()
+
+    def done(self, kind):
+        if kind == PICKUP:
+            self.request = None
+            if self._requested is not None and self._requested.done():
+                self._requested = asyncio.get_running_loop().create_future()
+        if self.on_event is not None:
+            self.on_event(kind, self.sim)
+
+    async def run(self):
+        sim = self.sim
+        self._wake = asyncio.Event()
+        if self._requested is None:
+            self._requested = asyncio.get_running_loop().create_future()
+        self.anchor_wall = self.clock()
+        self.anchor_sim = sim.clock
+        async for request in sim.decisions(self):
+            if not self.operator:
+                request.answer(sim.decide())
+                continue
+            # the incident goes on until an operator answers
+            self.request = request
+            if not self._requested.done():
+                self._requested.set_result(request)
+        self.request = None
+        if not self._requested.done():
+            self._requested.set_result(None)
+        return sim.total_survival_probability
+
+    """
+    Operator coroutines
+    next_request() waits for a pickup that needs a decision (None once the run is over)
+    decide(patient type, hospital) makes the decision for the waiting pickup and
+    returns the patient picked up, a ValueError (nobody of that class at the scene,
+    no such hospital) leaves the pickup waiting
+    """
+    async def next_request(self):
+        if self._requested is None:
+            self._requested = asyncio.get_running_loop().create_future()
+        return await asyncio.shield(self._requested)
+
+    async def decide(self, patient_type, hospital):
+        request = await self.next_request()
+        if request is None:
+            raise ValueError("the incident is over")
+        request.answer((patient_type, hospital))
+        return await request.picked_up()
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+import sqlite3
+import hashlib
+import json
+import os
+import time
+from engine import ENGINE_VERSION, load_params
+
+"""
+Experiment registry
+Replication results kept in a SQLite database so a scenario, selection and seed
+that was already run is read back instead of simulated again, and a sweep that
+crashed picks up where it stopped
+
+Every replication is keyed by a hash of the scenario, selection, seed and
+engine.ENGINE_VERSION, so changing any of them (or the engine) runs it again.
+The scenario is hashed as it runs: the fitted parameters it loads and the contents
+of its arrival log, not the file names (see scenario_hash).
+
+Workers write their own results: run_registered hands each worker a chunk of seeds
+and the worker stores the whole chunk in one transaction. The database is in WAL
+mode with a busy timeout, so workers writing at the same time wait for each other
+instead of failing, and a chunk is either stored completely or not at all.
+"""
+
+CHUNK = 50              # seeds a worker runs and stores in one transaction
+TIMEOUT = 60.0          # seconds a writer waits for the database lock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    key TEXT PRIMARY KEY,
+    scenario TEXT NOT NULL,
+    selection TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    engine TEXT NOT NULL,
+    survival REAL NOT NULL,
+    served INTEGER NOT NULL,
+    n_imm INTEGER NOT NULL,
+    n_del INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_scenario ON runs (scenario, selection, engine);
+"""
+
+# sha256 of a file's contents, read a block at a time, kept per path, size and modification time
+_file_hashes = {}
+def file_hash(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as infile:
+            for block in iter(lambda: infile.read(1 << 20), b''):
+                digest.update(block)
+        _file_hashes[key] = digest.hexdigest()
+    return _file_hashes[key]
+
+"""
+scenario_hash
+hash of the scenario as it runs: the parameters engine.load_params resolves for it
+(its params file or dict, or $HOSPITAL_QUEUE_PARAMS) instead of the file name, and
+the contents of its arrival_log
+"""
+def scenario_hash(scenario):
+    resolved = dict(scenario)
+    params = load_params(scenario.get("params"))
+    resolved.pop("params", None)
+    if params:
+        resolved["params"] = params
+    if "arrival_log" in scenario:
+        resolved["arrival_log"] = file_hash(scenario["arrival_log"])
+    text = json.dumps(resolved, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def run_key(scenario_id, selection, seed, engine=ENGINE_VERSION):
+    return hashlib.sha256(("%s|%s|%d|%s" % (scenario_id, selection, seed, engine)).encode()).hexdigest()
+
+"""
+Registry Object
+one connection to the database at path, created if needed
+lookup(scenario, selection, seeds) -> {seed: observation} of the stored ones
+store(scenario, selection, results) stores [(seed, observation), ...] in one transaction
+"""
+class Registry(object):
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=TIMEOUT)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def lookup(self, scenario, selection, seeds):
+        scenario_id = scenario_hash(scenario)
+        keys = {run_key(scenario_id, selection, seed): seed for seed in seeds}
+        found = {}
+        cursor = self.connection.cursor()
+        # a few hundred keys per query stays under sqlite's variable limit
+        batch = list(keys)
+        for i in range(0, len(batch), 500):
+            part = batch[i:i + 500]
+            cursor.execute("SELECT key, survival, served, n_imm, n_del FROM runs WHERE key IN (%s)" % ",".join("?"*len(part)), part)
+            for key, survival, served, n_imm, n_del in cursor:
+                found[keys[key]] = [survival, served, n_imm, n_del]
+        return found
+
+    def store(self, scenario, selection, results):
+        scenario_id = scenario_hash(scenario)
+        now = time.time()
+        rows = [(run_key(scenario_id, selection, seed), scenario_id, selection, seed, ENGINE_VERSION,
+                 float(tup[0]), int(tup[1]), int(tup[2]), int(tup[3]), now) for seed, tup in results]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?,?,?,?,?)", rows)
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+# worker side: runs a chunk of seeds and stores them together
+def _run_chunk(path, seeds, selection, scenario):
+    import batch
+    results = [(seed, batch.replicate(seed, selection, scenario)) for seed in seeds]
+    registry = Registry(path)
+    try:
+        registry.store(scenario, selection, results)
+    finally:
+        registry.close()
+    return results
+
+"""
+run_registered
+the observations of seeds in seed order, only the seeds missing from the registry at
+path are simulated (serially when workers == 1), in chunks of CHUNK stored as they finish
+callback(done, total) after every chunk
+"""
+def run_registered(path, seeds, selection, scenario, workers=None, chunk=CHUNK, callback=None):
+    import batch
+    seeds = list(seeds)
+    registry = Registry(path)
+    try:
+        obs = registry.lookup(scenario, selection, seeds)
+    finally:
+        registry.close()
+    missing = [seed for seed in seeds if seed not in obs]
+    chunks = [missing[i:i + chunk] for i in range(0, len(missing), chunk)]
+    done = len(obs)
+    if callback is not None:
+        callback(done, len(seeds))
+    pool = batch.make_pool(workers) if chunks else None
+    try:
+        if pool is None:
+            finished = (_run_chunk(path, part, selection, scenario) for part in chunks)
+        else:
+            from concurrent.futures import as_completed
+            finished = (future.result() for future in as_completed(
+                [pool.submit(_run_chunk, path, part, selection, scenario) for part in chunks]))
+        for results in finished:
+            obs.update(results)
+            done += len(results)
+            if callback is not None:
+                callback(done, len(seeds))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return [obs[seed] for seed in seeds]
@@ -0,0 +1,512 @@
+#!/usr/bin/python3
+import asyncio
+import json
+import math
+import secrets
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+import numpy as np
+import batch
+from concurrent.futures import ThreadPoolExecutor
+from engine import ENGINE_VERSION, Stepper
+from policies import POLICIES
+from registry import scenario_hash
+
+"""
+Simulation service
+A small local HTTP/JSON front end to the replications, standard library only:
+asyncio serves the clients and a persistent process pool, spawned like
+batch.make_pool's, does the simulating, so the event loop never runs a replication itself
+
+POST /jobs              submit a job, the body is a JSON object of Simulation.true_init
+                        parameters plus "replications" (see parse_job), answers 202
+                        with the job, or 200 with the finished job if it is cached
+GET /jobs/<id>          the job: status, progress and, once done, its summary
+GET /jobs/<id>/events   progress as it happens, one JSON line per update (ndjson),
+                        the last line is the finished job
+GET /health             workers, jobs queued and running, cached results, sessions
+
+POST /sessions          start an incident decided by the client, the body is a job
+                        without "replications" (see parse_session), answers 201 with
+                        the session at its first pickup
+GET /sessions/<id>      the session: the incident so far and the pickup waiting
+POST /sessions/<id>/decide  {"patient_type": 0 or 1, "hospital": h} or {"policy": true}
+                        (the session's selection decides) makes the waiting pickup's
+                        decision and answers with the session at the next pickup
+
+Sessions step Simulation.decisions() with engine.Stepper on a few threads
+(SESSION_THREADS), setting up and simulating off the event loop, and cost nothing
+while they wait for a client; a session is at most MAX_SESSION_PATIENTS patients
+and MAX_SESSION_AMBULANCES ambulances, and the oldest finished or idle ones go once
+there are more than MAX_SESSIONS.
+
+A job's id is a hash of the request (scenario with the fitted parameters it
+resolves to, selection, seeds and engine version), so the same request submitted
+twice, even while the first is still running, is one job, and finished jobs are
+kept in a result cache of CACHE_SIZE.
+Jobs run in chunks of CHUNK seeds and at most 2 chunks per worker are in the pool
+at a time. Each job has a few lanes that queue for a pool slot one chunk at a time,
+so the jobs take turns and a long job doesn't hold up the short ones.
+
+python -m hospital_queue serve --port 8080
+curl -d '{"n_ambs": 30, "hos_dists": [5.59, 4.24, 6.95], "imm_servers": [6, 5, 0],
+          "del_servers": [15, 12, 8], "selection": "myopic", "replications": 200}' localhost:8080/jobs
+curl localhost:8080/jobs/<id>/events
+"""
+
+CHUNK = 10                  # seeds per pool task, the unit of progress
+CACHE_SIZE = 256            # finished jobs kept
+MAX_REPLICATIONS = 100000   # largest job accepted
+MAX_PATIENTS = 100000       # most immediate, and most delayed, patients at the scene in a job
+MAX_AMBULANCES = 10000      # most ambulances in a job
+MAX_BODY = 1024*1024        # bytes of request body accepted
+MAX_SESSIONS = 1000         # sessions kept
+MAX_SESSION_PATIENTS = 10000    # patients at the scene plus those expected to arrive, per session
+MAX_SESSION_AMBULANCES = 1000   # ambulances per session
+SESSION_THREADS = 4         # threads the sessions simulate on
+
+# true_init parameters and batch.py scenario keys a request may give
+SCENARIO_KEYS = ["n_imm", "n_del", "n_ambs", "hos_dists", "imm_servers", "del_servers",
+                 "arrival_rate", "arrival_imm", "arrival_horizon", "params"]
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+"""
+parse_job
+checks a request body and returns (scenario, selection, seeds)
+n_ambs, hos_dists, imm_servers and del_servers are needed; n_hos, if given, must
+match them; n_imm and n_del default to the mandalay bay draw; arrival_rate needs
+arrival_horizon unless the rate ends at 0, so every job finishes; seed (default 0) is
+the first of replications (default 100) seeds; params must be the fitted
+parameters themselves, the service doesn't read files for a client
+Distances are numbers >= 0, server counts whole numbers >= 0, and n_imm, n_del and
+n_ambs at most MAX_PATIENTS, MAX_PATIENTS and MAX_AMBULANCES
+"""
+def parse_job(body):
+    if not isinstance(body, dict):
+        raise RequestError(400, "the request must be a JSON object")
+    known = set(SCENARIO_KEYS) | {"n_hos", "selection", "seed", "replications"}
+    unknown = sorted(set(body) - known)
+    if unknown:
+        raise RequestError(400, "unknown parameters: %s" % ", ".join(unknown))
+    for key in ("n_ambs", "hos_dists", "imm_servers", "del_servers"):
+        if key not in body:
+            raise RequestError(400, "missing %s" % key)
+    scenario = {key: body[key] for key in SCENARIO_KEYS if key in body}
+    if not isinstance(scenario["hos_dists"], list) or not all(_number(x) and x >= 0 for x in scenario["hos_dists"]):
+        raise RequestError(400, "hos_dists must be a list of numbers >= 0")
+    for key in ("imm_servers", "del_servers"):
+        if not isinstance(scenario[key], list) or not all(_whole(x) for x in scenario[key]):
+            raise RequestError(400, "%s must be a list of whole numbers >= 0" % key)
+    for key, most in (("n_imm", MAX_PATIENTS), ("n_del", MAX_PATIENTS), ("n_ambs", MAX_AMBULANCES)):
+        if key in scenario and not (_whole(scenario[key]) and scenario[key] <= most):
+            raise RequestError(400, "%s must be a whole number from 0 to %d" % (key, most))
+    n_hos = len(scenario["hos_dists"])
+    if len(scenario["imm_servers"]) != n_hos or len(scenario["del_servers"]) != n_hos or body.get("n_hos", n_hos) != n_hos:
+        raise RequestError(400, "need one distance, immediate server and delayed server count per hospital")
+    if "params" in scenario and not isinstance(scenario["params"], dict):
+        raise RequestError(400, "params must be an object of fitted parameters")
+    if "arrival_rate" in scenario:
+        points = scenario["arrival_rate"]
+        if (not isinstance(points, list) or not points or
+                not all(isinstance(p, list) and len(p) == 2 and all(_number(x) and x >= 0 for x in p) for p in points)):
+            raise RequestError(400, "arrival_rate must be a list of [start time, patients per minute] pairs, numbers >= 0")
+        if "arrival_horizon" in scenario and not (_number(scenario["arrival_horizon"]) and scenario["arrival_horizon"] >= 0):
+            raise RequestError(400, "arrival_horizon must be a number of minutes >= 0")
+        if "arrival_imm" in scenario and not (_number(scenario["arrival_imm"]) and 0 <= scenario["arrival_imm"] <= 1):
+            raise RequestError(400, "arrival_imm must be a share from 0 to 1")
+        try:
+            batch.arrival_horizon(scenario)
+        except ValueError as e:
+            raise RequestError(400, str(e))
+    elif "arrival_horizon" in scenario or "arrival_imm" in scenario:
+        raise RequestError(400, "arrival_horizon and arrival_imm go with arrival_rate")
+    selection = body.get("selection", "random")
+    if selection not in POLICIES:
+        raise RequestError(400, "unknown selection %r, pick one of %s" % (selection, ", ".join(POLICIES)))
+    replications = body.get("replications", batch.REPLICATIONS)
+    seed = body.get("seed", 0)
+    if not _whole(replications) or not 0 < replications <= MAX_REPLICATIONS:
+        raise RequestError(400, "replications must be 1 to %d" % MAX_REPLICATIONS)
+    if not _whole(seed):
+        raise RequestError(400, "seed must be a whole number >= 0")
+    return scenario, selection, range(seed, seed + replications)
+
+# a job's id, the scenario hashed as it runs, with the parameters the workers will load (see registry.scenario_hash)
+def job_key(scenario, selection, seeds):
+    return scenario_hash({"scenario": scenario_hash(scenario), "selection": selection, "first_seed": seeds.start,
+                          "replications": len(seeds), "engine": ENGINE_VERSION})
+
+# a finite int or float, JSON true/false are not numbers here
+def _number(x):
+    return isinstance(x, (int, float)) and not isinstance(x, bool) and math.isfinite(x)
+
+# an int >= 0, JSON true/false are not numbers here
+def _whole(x):
+    return isinstance(x, int) and not isinstance(x, bool) and x >= 0
+
+# parse_job for a session, (scenario, selection, seed), no bigger than a client can step through
+def parse_session(body):
+    if isinstance(body, dict) and "replications" in body:
+        raise RequestError(400, "unknown parameters: replications")
+    scenario, selection, seeds = parse_job(dict(body, replications=1) if isinstance(body, dict) else body)
+    if scenario["n_ambs"] > MAX_SESSION_AMBULANCES:
+        raise RequestError(400, "a session has at most %d ambulances" % MAX_SESSION_AMBULANCES)
+    if _expected_patients(scenario) > MAX_SESSION_PATIENTS:
+        raise RequestError(400, "a session has at most %d patients, at the scene and expected to arrive"
+                           % MAX_SESSION_PATIENTS)
+    return scenario, selection, seeds.start
+
+# patients at the scene (at most 250 from the mandalay bay draw, none with arrivals) plus
+# the arrival rate's integral up to its horizon
+def _expected_patients(scenario):
+    drawn = 0 if "arrival_rate" in scenario else 250
+    patients = scenario.get("n_imm", drawn) + scenario.get("n_del", drawn)
+    if "arrival_rate" in scenario:
+        horizon = batch.arrival_horizon(scenario)
+        points = sorted(scenario["arrival_rate"]) + [[horizon, 0]]
+        for (start, rate), (end, _) in zip(points, points[1:]):
+            patients += rate*max(0, min(end, horizon) - start)
+    return patients
+
+def _replicate_chunk(task):
+    seeds, selection, scenario = task
+    return [batch.replicate(seed, selection, scenario) for seed in seeds]
+
+"""
+summarize
+summary of the observations [survival, served, # immediate, # delayed]
+"""
+def summarize(obs):
+    obs = np.array(obs, dtype=float)
+    survival = obs[:, 0]
+    half = 1.96*survival.std(ddof=1)/np.sqrt(len(obs)) if len(obs) > 1 else None
+    return {"replications": len(obs),
+            "mean_survival": float(survival.mean()), "half_width": None if half is None else float(half),
+            "survival_quantiles": {"p5": float(np.percentile(survival, 5)), "p50": float(np.median(survival)),
+                                   "p95": float(np.percentile(survival, 95))},
+            "mean_served": float(obs[:, 1].mean()),
+            "mean_immediate": float(obs[:, 2].mean()), "mean_delayed": float(obs[:, 3].mean())}
+
+"""
+Job Object
+one request's replications, status queued, running, done or failed
+progress subscribers wait on changed, which is replaced by a fresh event on every update
+"""
+class Job(object):
+    def __init__(self, key, scenario, selection, seeds):
+        self.key = key
+        self.scenario = scenario
+        self.selection = selection
+        self.seeds = list(seeds)
+        self.status = "queued"
+        self.done = 0
+        self.obs = [None]*len(self.seeds)
+        self.summary = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def describe(self):
+        job = {"id": self.key, "status": self.status, "selection": self.selection,
+               "done": self.done, "total": len(self.seeds), "scenario": self.scenario}
+        if self.summary is not None:
+            job["summary"] = self.summary
+            job["seconds"] = self.finished - self.submitted
+        if self.error is not None:
+            job["error"] = self.error
+        return job
+
+    # the job after every change, ending with the finished job
+    async def updates(self):
+        while True:
+            changed = self.changed
+            yield self.describe()
+            if self.status in ("done", "failed"):
+                return
+            await changed.wait()
+
+"""
+Session Object
+one incident decided a pickup at a time by a client, request is the pickup
+waiting for a decision, None once the incident is over
+The simulation runs on the executor's threads, one step of the session at a time
+under lock, which describe's callers hold too
+"""
+class Session(object):
+    def __init__(self, key, sim, selection, executor):
+        self.key = key
+        self.sim = sim
+        self.selection = selection
+        self.request = None
+        self.finished = False
+        self.touched = time.time()
+        self.lock = asyncio.Lock()
+        self._executor = executor
+        self._stepper = Stepper(sim)
+
+    # on to the next pickup, on an executor thread
+    def _advance(self, decision=None):
+        if decision is not None:
+            self._stepper.answer(decision)
+        while not self._stepper.finished:
+            request = self._stepper.step()
+            if request is not None:
+                return request
+        return None
+
+    # answers the waiting pickup, if a decision is given, and steps to the next one
+    async def advance(self, decision=None):
+        loop = asyncio.get_running_loop()
+        self.request = await loop.run_in_executor(self._executor, self._advance, decision)
+        self.finished = self._stepper.finished
+        self.touched = time.time()
+
+    async def decide(self, body):
+        if not isinstance(body, dict):
+            raise RequestError(400, "the request must be a JSON object")
+        if body.get("policy"):
+            decision = None
+        elif isinstance(body.get("patient_type"), int) and isinstance(body.get("hospital"), int):
+            decision = (body["patient_type"], body["hospital"])
+        else:
+            raise RequestError(400, "give patient_type and hospital, or policy")
+        async with self.lock:
+            if self.request is None:
+                raise RequestError(409, "the incident is over")
+            if decision is None:
+                # the policy draws from the simulation's generator, so it decides on the thread too
+                decision = await asyncio.get_running_loop().run_in_executor(self._executor, self.sim.decide)
+            try:
+                await self.advance(decision)
+            except ValueError as error:
+                raise RequestError(409, str(error))
+
+    def describe(self):
+        sim = self.sim
+        session = {"id": self.key, "status": "done" if self.finished else "waiting", "selection": self.selection,
+                   "clock": sim.clock, "survival": sim.total_survival_probability, "served": sim.served,
+                   "picked_up": sim.patients_picked_up, "scene": list(sim.scene),
+                   "hospitals": [{"distance": h.distance, "servers": list(h.servers), "busy": list(h.busy),
+                                  "waiting": [len(queue) for queue in h.queues]} for h in sim.hospitals]}
+        if self.request is not None:
+            session["request"] = {"ambulance": self.request.ambulance, "since": self.request.since}
+        return session
+
+"""
+Service Object
+the jobs by id (running ones and the cache of finished ones), the pool and the
+asyncio server; run() serves until cancelled
+"""
+class Service(object):
+    def __init__(self, workers=None, host="127.0.0.1", port=8080):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.pool = None
+        self.jobs = OrderedDict()
+        self.sessions = OrderedDict()
+        self.lanes = 1
+        self.slots = None
+        self.threads = ThreadPoolExecutor(SESSION_THREADS, thread_name_prefix="session")
+
+    async def run(self):
+        import os
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn like batch.make_pool, but a pool even for one worker so the loop never simulates
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.lanes = 2*(self.workers or os.cpu_count() or 1)
+        self.slots = asyncio.Semaphore(self.lanes)
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            self.threads.shutdown(cancel_futures=True)
+
+    def submit(self, scenario, selection, seeds):
+        key = job_key(scenario, selection, seeds)
+        job = self.jobs.get(key)
+        if job is not None and job.status != "failed":
+            self.jobs.move_to_end(key)
+            return job, True
+        job = Job(key, scenario, selection, seeds)
+        self.jobs[key] = job
+        asyncio.get_running_loop().create_task(self.execute(job))
+        self._evict()
+        return job, False
+
+    # oldest finished jobs go once there are more than CACHE_SIZE
+    def _evict(self):
+        finished = [key for key, job in self.jobs.items() if job.status in ("done", "failed")]
+        for key in finished[:max(0, len(finished) - CACHE_SIZE)]:
+            del self.jobs[key]
+
+    async def execute(self, job):
+        loop = asyncio.get_running_loop()
+        chunks = iter([(i, job.seeds[i:i + CHUNK]) for i in range(0, len(job.seeds), CHUNK)])
+
+        # a lane takes the job's chunks one at a time, queueing behind the other jobs' lanes for each
+        async def lane():
+            for i, seeds in chunks:
+                async with self.slots:
+                    if job.status == "queued":
+                        job.status = "running"
+                        job.notify()
+                    obs = await loop.run_in_executor(self.pool, _replicate_chunk, (seeds, job.selection, job.scenario))
+                job.obs[i:i + len(seeds)] = obs
+                job.done += len(seeds)
+                job.notify()
+
+        try:
+            lanes = min(self.lanes, (len(job.seeds) + CHUNK - 1)//CHUNK)
+            await asyncio.gather(*[lane() for _ in range(lanes)])
+            # summarizing a big job is a few numpy calls, fine on the loop
+            job.summary = summarize(job.obs)
+            job.status = "done"
+        except Exception as error:
+            job.status = "failed"
+            job.error = "%s: %s" % (type(error).__name__, error)
+        job.finished = time.time()
+        job.notify()
+        self._evict()
+
+    async def start_session(self, scenario, selection, seed):
+        loop = asyncio.get_running_loop()
+        sim = (await loop.run_in_executor(self.threads, batch.setup, seed, selection, scenario))[0]
+        session = Session(secrets.token_hex(8), sim, selection, self.threads)
+        async with session.lock:
+            await session.advance()
+        self.sessions[session.key] = session
+        # the least recently used go first, finished ones before those still waiting
+        while len(self.sessions) > MAX_SESSIONS:
+            finished = [key for key, old in self.sessions.items() if old.finished]
+            del self.sessions[finished[0] if finished else next(iter(self.sessions))]
+        return session
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, body = await read_request(reader)
+            await self.route(method, path, body, writer)
+        except RequestError as error:
+            await respond(writer, error.status, {"error": str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as error:
+            await respond(writer, 500, {"error": "%s: %s" % (type(error).__name__, error)})
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body, writer):
+        parts = [part for part in urlsplit(path).path.split('/') if part]
+        if parts == ["health"] and method == "GET":
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            await respond(writer, 200, {"workers": self.workers, "engine": ENGINE_VERSION, "jobs": counts,
+                                        "sessions": len(self.sessions)})
+        elif parts == ["jobs"] and method == "POST":
+            job, cached = self.submit(*parse_job(parse_body(body)))
+            described = job.describe()
+            described["cached"] = cached
+            await respond(writer, 200 if job.status == "done" else 202, described)
+        elif len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise RequestError(404, "no job %s" % parts[1])
+            if len(parts) == 2:
+                await respond(writer, 200, job.describe())
+            elif parts[2] == "events":
+                await stream(writer, job.updates())
+            else:
+                raise RequestError(404, "not found")
+        elif parts == ["sessions"] and method == "POST":
+            session = await self.start_session(*parse_session(parse_body(body)))
+            async with session.lock:
+                described = session.describe()
+            await respond(writer, 201, described)
+        elif len(parts) in (2, 3) and parts[0] == "sessions":
+            session = self.sessions.get(parts[1])
+            if session is None:
+                raise RequestError(404, "no session %s" % parts[1])
+            self.sessions.move_to_end(parts[1])
+            if len(parts) == 2 and method == "GET":
+                async with session.lock:
+                    described = session.describe()
+                await respond(writer, 200, described)
+            elif len(parts) == 3 and parts[2] == "decide" and method == "POST":
+                await session.decide(parse_body(body))
+                async with session.lock:
+                    described = session.describe()
+                await respond(writer, 200, described)
+            else:
+                raise RequestError(404, "not found")
+        elif method not in ("GET", "POST"):
+            raise RequestError(405, "method %s not allowed" % method)
+        else:
+            raise RequestError(404, "not found")
+
+"""
+HTTP helpers
+just enough HTTP/1.1 for JSON clients, one request per connection
+"""
+REASONS = {200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+def parse_body(body):
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        raise RequestError(400, "the body is not JSON")
+
+async def read_request(reader):
+    line = await reader.readline()
+    try:
+        method, path, version = line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(400, "bad request line")
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        if name.strip().lower() == "content-length":
+            try:
+                length = int(value)
+            except ValueError:
+                raise RequestError(400, "bad content-length")
+    if length > MAX_BODY:
+        raise RequestError(413, "the body is over %d bytes" % MAX_BODY)
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, body
+
+async def respond(writer, status, payload):
+    body = (json.dumps(payload) + "\n").encode()
+    writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                  % (status, REASONS.get(status, ""), len(body))).encode() + body)
+    await writer.drain()
+
+# one JSON line per item, the end of the response is the connection closing
+async def stream(writer, items):
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+    async for item in items:
+        writer.write((json.dumps(item) + "\n").encode())
+        await writer.drain()
+
+def serve(workers=None, host="127.0.0.1", port=8080):
+    try:
+        asyncio.run(Service(workers, host, port).run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+import numpy as np
+
+"""
+Running statistics
+Kept by the engine as events happen, O(1) per event and no per patient history
+
+TimeAverages: per class and hospital time integrals of the queue length and the
+busy servers, and the summed wait before treatment and time in the ambulance
+Every Simulation keeps one as sim.stats, report(sim) turns it into averages
+"""
+
+"""
+TimeAverages Object
+Lists indexed [class][hospital], python floats so an update is a few additions
+
+update(c, h, clock, waiting, busy) must be called just before the queue length or
+busy servers of class c at hospital h change, waiting and busy being the values
+before the change, it adds them times the time since the last change
+"""
+class TimeAverages(object):
+    __slots__ = ('last', 'queue_area', 'busy_area', 'wait_sum', 'wait_count', 'ride_sum', 'ride_count')
+
+    def __init__(self, n_hos):
+        self.last = [[0.0]*n_hos, [0.0]*n_hos]
+        self.queue_area = [[0.0]*n_hos, [0.0]*n_hos]
+        self.busy_area = [[0.0]*n_hos, [0.0]*n_hos]
+        self.wait_sum = [[0.0]*n_hos, [0.0]*n_hos]
+        self.wait_count = [[0]*n_hos, [0]*n_hos]
+        self.ride_sum = [[0.0]*n_hos, [0.0]*n_hos]
+        self.ride_count = [[0]*n_hos, [0]*n_hos]
+
+    def update(self, c, h, clock, waiting, busy):
+        dt = clock - self.last[c][h]
+        if dt:
+            self.queue_area[c][h] += waiting*dt
+            self.busy_area[c][h] += busy*dt
+            self.last[c][h] = clock
+
+    # a patient of class c started treatment at hospital h after waiting minutes
+    def wait(self, c, h, minutes):
+        self.wait_sum[c][h] += minutes
+        self.wait_count[c][h] += 1
+
+    # a patient of class c reached hospital h after minutes in the ambulance
+    def ride(self, c, h, minutes):
+        self.ride_sum[c][h] += minutes
+        self.ride_count[c][h] += 1
+
+"""
+report
+averages of sim.stats up to the simulation clock, (2, n_hos) arrays, rows IMMEDIATE, DELAYED
+queue_length: time averaged number waiting
+utilization: time averaged busy servers / servers (nan without servers)
+wait: mean minutes from hospital arrival to treatment (nan if nobody started)
+ride: mean minutes from pickup to hospital arrival (nan if nobody arrived)
+"""
+def report(sim):
+    stats = sim.stats
+    clock = sim.clock
+    queue_area = np.array(stats.queue_area)
+    busy_area = np.array(stats.busy_area)
+    # close every integral at the current clock
+    since = clock - np.array(stats.last)
+    waiting = np.array([[len(hospital.queues[c]) for hospital in sim.hospitals] for c in range(2)], dtype=float)
+    busy = np.array([[hospital.busy[c] for hospital in sim.hospitals] for c in range(2)], dtype=float)
+    queue_area += waiting*since
+    busy_area += busy*since
+    servers = np.array([[hospital.servers[c] for hospital in sim.hospitals] for c in range(2)], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        duration = clock if clock > 0 else np.nan
+        return {"queue_length": queue_area/duration,
+                "utilization": np.where(servers > 0, busy_area/(servers*duration), np.nan),
+                "wait": np.array(stats.wait_sum)/np.array(stats.wait_count),
+                "ride": np.array(stats.ride_sum)/np.array(stats.ride_count)}
+
+# report as printable lines, one per class and hospital
+def format_report(averages):
+    lines = ["class      hospital  queue length  utilization  wait (min)  ambulance (min)"]
+    for c, name in enumerate(["IMMEDIATE", "DELAYED"]):
+        for h in range(averages["queue_length"].shape[1]):
+            lines.append("%-10s %8d  %12.2f  %11.3f  %10.1f  %15.1f" % (
+                name, h, averages["queue_length"][c, h], averages["utilization"][c, h],
+                averages["wait"][c, h], averages["ride"][c, h]))
+    return "\n".join(lines)
+
+"""
+TDigest Object
+Streaming quantile estimate in bounded memory (Dunning's t-digest, merging variant)
+
+Values are buffered and then folded into weighted centroids, small near the
+tails and large in the middle (the k1 scale function), so the extreme quantiles
+stay accurate. compression bounds the number of centroids (about compression/2),
+the default keeps p50 to p99 within about half a percent.
+Two digests merge by pooling their centroids, so workers can each keep one and
+the parent adds them up.
+
+add(x), add_many(values), merge(other), quantile(q) for q in [0, 1]
+"""
+class TDigest(object):
+    def __init__(self, compression=300, buffer_size=1000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.buffer = []
+        self.total = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    # values added so far
+    @property
+    def count(self):
+        return self.total + len(self.buffer)
+
+    def add(self, x):
+        self.buffer.append(x)
+        if len(self.buffer) >= self.buffer_size:
+            self._compress()
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        self._compress(values, np.ones(len(values)))
+
+    def merge(self, other):
+        other._compress()
+        self._compress(other.means, other.weights)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def _compress(self, means=None, weights=None):
+        parts_m = [self.means, np.array(self.buffer, dtype=float)]
+        parts_w = [self.weights, np.ones(len(self.buffer))]
+        if means is not None:
+            parts_m.append(means)
+            parts_w.append(weights)
+        self.buffer = []
+        new = np.concatenate(parts_m[1:])
+        if len(new) == 0:
+            return
+        self.min = min(self.min, new.min())
+        self.max = max(self.max, new.max())
+        m = np.concatenate(parts_m)
+        w = np.concatenate(parts_w)
+        self.total = w.sum()
+        order = np.argsort(m, kind='mergesort')
+        m, w = m[order], w[order]
+        # bucket every point by the k1 scale of the weight up to its middle
+        q = (np.cumsum(w) - w/2)/self.total
+        k = self.compression/(2*np.pi)*np.arcsin(2*q - 1)
+        bucket = np.floor(k - k[0]).astype(np.intp)
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        self.weights = np.add.reduceat(w, starts)
+        self.means = np.add.reduceat(m*w, starts)/self.weights
+
+    # value at quantile q, interpolated between centroid middles
+    def quantile(self, q):
+        self._compress()
+        if self.total == 0:
+            return np.nan
+        if len(self.means) == 1:
+            return float(self.means[0])
+        centers = (np.cumsum(self.weights) - self.weights/2)/self.total
+        xs = np.r_[self.min, self.means, self.max]
+        ps = np.r_[0.0, centers, 1.0]
+        return float(np.interp(q, ps, xs))
+
+    def quantiles(self, qs):
+        return [self.quantile(q) for q in qs]
+
+"""
+QuantileSketches Object
+TDigests per class and hospital ([class][hospital]) of the time to treatment
+(minutes from the incident to the start of treatment) and the survival probability
+Simulation(sketches=...) adds every patient that starts treatment, one object can
+collect many replications and merge() adds another one's digests
+"""
+class QuantileSketches(object):
+    def __init__(self, n_hos, compression=300):
+        self.n_hos = n_hos
+        self.treatment = [[TDigest(compression) for h in range(n_hos)] for c in range(2)]
+        self.survival = [[TDigest(compression) for h in range(n_hos)] for c in range(2)]
+
+    def add(self, c, h, time_to_treatment, survival):
+        self.treatment[c][h].add(time_to_treatment)
+        self.survival[c][h].add(survival)
+
+    def merge(self, other):
+        if other.n_hos != self.n_hos:
+            raise ValueError("can't merge sketches of %d and %d hospitals" % (self.n_hos, other.n_hos))
+        for c in range(2):
+            for h in range(self.n_hos):
+                self.treatment[c][h].merge(other.treatment[c][h])
+                self.survival[c][h].merge(other.survival[c][h])
+        return self
+
+    # the digest of class c over every hospital, for the whole class's quantiles
+    def pooled(self, which, c):
+        digests = self.treatment if which == "treatment" else self.survival
+        total = TDigest(digests[c][0].compression)
+        for digest in digests[c]:
+            total.merge(digest)
+        return total
+
+# sketch quantiles as printable lines, per class over all hospitals then per hospital
+def format_quantiles(sketches, qs=(.5, .9, .99)):
+    header = "class      hospital  patients  " + "  ".join("ttt p%-4g" % (100*q) for q in qs) + "  " + "  ".join("surv p%-3g" % (100*q) for q in qs)
+    lines = [header]
+    for c, name in enumerate(["IMMEDIATE", "DELAYED"]):
+        rows = [("all", sketches.pooled("treatment", c), sketches.pooled("survival", c))]
+        rows += [(h, sketches.treatment[c][h], sketches.survival[c][h]) for h in range(sketches.n_hos)]
+        for h, treatment, survival in rows:
+            lines.append("%-10s %8s  %8d  " % (name, h, treatment.count) +
+                         "  ".join("%8.1f" % x for x in treatment.quantiles(qs)) + "  " +
+                         "  ".join("%8.3f" % x for x in survival.quantiles(qs)))
+    return "\n".join(lines)
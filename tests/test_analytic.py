@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import analytic
+import batch
+import hospital_queue
+
+def test_erlang_c_known_values():
+    # M/M/1 waits with probability rho, M/M/2 at load 1 with 1/3
+    assert analytic.erlang_c(1, 0.5) == pytest.approx(0.5)
+    assert analytic.erlang_c(2, 1.0) == pytest.approx(1/3)
+    assert analytic.erlang_c(3, 2.0) == pytest.approx(4/9)
+    # overloaded or without servers everyone waits
+    assert np.all(analytic.erlang_c([2, 0], [2.0, 1.0]) == 1)
+
+def test_mix_weights():
+    n_imm, n_del, weight = analytic.mandalay_mixes()
+    assert weight.sum() == pytest.approx(1)
+    assert np.all((n_imm + n_del >= 200) & (n_imm + n_del <= 250))
+
+def test_mix_mean_with_a_fixed_class():
+    approx = analytic.Approximation(batch.MANDALAY_BAY, "first")
+    n_imm, n_del, weight = analytic.mandalay_mixes()
+    assert analytic.mix_mean(approx, n_imm=80) == pytest.approx((weight*approx.survival(np.full(n_imm.shape, 80), n_del)).sum())
+    assert analytic.mix_mean(approx, n_imm=80) != pytest.approx(analytic.mix_mean(approx))
+
+def test_control_variate_with_a_fixed_class_is_unbiased():
+    # only n_imm fixed, the delayed count still comes from the draw
+    scenario = dict(batch.MANDALAY_BAY, n_imm=80)
+    obs = np.array([batch.replicate(seed, "first", scenario) for seed in range(60)])
+    approx = analytic.Approximation(scenario, "first")
+    cv = analytic.control_variate(obs[:, 0], obs[:, 2], obs[:, 3], approx, analytic.mix_mean(approx, n_imm=80))
+    (plain, plain_half), (controlled, controlled_half) = cv["plain"], cv["controlled"]
+    assert abs(plain - controlled) < plain_half + controlled_half
+    assert cv["ratio"] < 1
+
+@pytest.mark.parametrize("argv", [["--imm", "80", "--del", "100"], ["--arrival-rate", "0:3,60:0"]])
+def test_control_variate_refused(argv):
+    with pytest.raises(SystemExit):
+        hospital_queue.main(["analytic", "--selection", "first", "--replications", "10", "--workers", "1"] + argv)
@@ -0,0 +1,47 @@
+import argparse
+import pytest
+import arrivals
+import batch
+import hospital_queue
+
+def scenario(**keys):
+    s = dict(batch.MANDALAY_BAY)
+    s.update(keys)
+    return s
+
+def test_rate_end():
+    assert arrivals.rate_end([[0, 3], [60, 0]]) == 60
+    assert arrivals.rate_end([[60, 0], [0, 3]]) == 60
+    assert arrivals.rate_end([[0, 2]]) == arrivals.BIG
+
+def test_rate_ending_at_zero_stops():
+    found = list(batch.scenario_arrivals(scenario(arrival_rate=[[0, 3], [60, 0]]), 0))
+    assert 0 < len(found)
+    assert all(time <= 60 for time, patient_type in found)
+
+def test_horizon_stops_constant_rate():
+    found = list(batch.scenario_arrivals(scenario(arrival_rate=[[0, 2]], arrival_horizon=30), 0))
+    assert all(time <= 30 for time, patient_type in found)
+    assert batch.arrival_horizon(scenario(arrival_rate=[[0, 3], [60, 0]], arrival_horizon=90)) == 60
+
+@pytest.mark.parametrize("keys", [{"arrival_rate": [[0, 2]]}, {"arrival_rate": [[0, 3], [60, 1]]},
+                                  {"arrival_rate": []}, {"arrival_rate": [[0, -1], [60, 0]]}])
+def test_unbounded_or_bad_rate_refused(keys):
+    with pytest.raises(ValueError):
+        batch.arrival_horizon(scenario(**keys))
+    with pytest.raises(ValueError):
+        batch.scenario_arrivals(scenario(**keys), 0)
+
+def test_cli_needs_a_horizon():
+    parser = argparse.ArgumentParser()
+    hospital_queue.add_scenario_arguments(parser)
+    with pytest.raises(SystemExit):
+        hospital_queue.scenario(parser.parse_args(["--arrival-rate", "2"]))
+    s = hospital_queue.scenario(parser.parse_args(["--arrival-rate", "0:3,60:0"]))
+    assert s["arrival_rate"] == [[0.0, 3.0], [60.0, 0.0]]
+
+def test_run_with_rate_ending_at_zero_finishes():
+    sim, row = batch.simulate(0, "first", scenario(arrival_rate=[[0, 1], [30, 0]]))
+    assert sim.next_scene_arrival_time == arrivals.BIG
+    assert sim.patients_found[0] + sim.patients_found[1] == row[2] + row[3]
+    assert row[1] <= row[2] + row[3]
@@ -0,0 +1,144 @@
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import batch
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=10, n_del=20, n_ambs=4)
+
+# a thread pool that keeps every future it hands out
+class RecordingPool(ThreadPoolExecutor):
+    def __init__(self, workers):
+        ThreadPoolExecutor.__init__(self, workers)
+        self.futures = []
+
+    def submit(self, *args):
+        future = ThreadPoolExecutor.submit(self, *args)
+        self.futures.append(future)
+        return future
+
+def serial(seeds):
+    return [batch.replicate(seed, "first", SCENARIO) for seed in seeds]
+
+def test_seed_order_matches_replicate():
+    records = list(batch.replications(range(10), "first", SCENARIO, workers=2, order="seed", chunk=3))
+    assert [record.seed for record in records] == list(range(10))
+    assert [record.observation() for record in records] == serial(range(10))
+
+def test_workers_1_runs_in_this_process(monkeypatch):
+    def no_pool(workers=None):
+        raise AssertionError("workers=1 made a pool")
+    monkeypatch.setattr(batch, "make_pool", no_pool)
+    records = list(batch.replications(range(5), "first", SCENARIO, workers=1))
+    assert [record.observation() for record in records] == serial(range(5))
+
+def test_completion_order(monkeypatch):
+    record_chunk = batch._record_chunk
+    def slow_first(task):
+        if task[0][0] == 0:
+            time.sleep(0.2)
+        return record_chunk(task)
+    monkeypatch.setattr(batch, "_record_chunk", slow_first)
+    with RecordingPool(2) as pool:
+        completion = [record.seed for record in batch.replications(range(4), "first", SCENARIO, order="completion", chunk=1, pool=pool)]
+        in_order = [record.seed for record in batch.replications(range(4), "first", SCENARIO, order="seed", chunk=1, pool=pool)]
+    assert completion[-1] == 0 and sorted(completion) == in_order == [0, 1, 2, 3]
+
+def test_window_bounded_and_close_cancels(monkeypatch):
+    import threading
+    gate = threading.Event()
+    started = []
+    record_chunk = batch._record_chunk
+    # the first chunk finishes, the ones after it wait for the gate
+    def gated(task):
+        started.append(task[0][0])
+        if task[0][0] > 0:
+            gate.wait()
+        return record_chunk(task)
+    monkeypatch.setattr(batch, "_record_chunk", gated)
+    with RecordingPool(1) as pool:
+        # endless seeds, only the window is ever submitted
+        run = batch.replications(itertools.count(), "first", SCENARIO, workers=1, chunk=2, pool=pool)
+        assert next(run).seed == 0
+        assert len(pool.futures) == batch.IN_FLIGHT
+        run.close()
+        cancelled = [future.cancelled() for future in pool.futures]
+        gate.set()
+    # the finished chunk and at most the one running when it closed
+    assert sum(cancelled) >= batch.IN_FLIGHT - 2 and set(started) <= {0, 2}
+
+def test_shared_rows_match_replicate():
+    with batch.shared_replications(range(7), "first", SCENARIO, workers=2, chunk=3) as shared:
+        assert shared.rows['seed'].tolist() == list(range(7))
+        assert shared.observations() == serial(range(7))
+        summary = shared.summary()
+    assert summary["replications"] == 7
+    assert summary["mean_survival"] == pytest.approx(sum(obs[0] for obs in serial(range(7)))/7)
+
+def test_summary_of_a_partly_filled_block():
+    with batch.SharedRows(4) as shared:
+        assert shared.summary()["replications"] == 0 and shared.summary()["mean_survival"] is None
+        shared.rows[2] = (2, 30.0, 50, 10, 40, True)
+        one = shared.summary()
+        shared.rows[0] = (0, 20.0, 40, 12, 38, True)
+        two = shared.summary()
+        assert shared.observations() == [[20.0, 40, 12, 38], [30.0, 50, 10, 40]]
+    assert one["replications"] == 1 and one["mean_survival"] == 30.0 and one["half_width"] is None
+    assert two["replications"] == 2 and two["mean_survival"] == 25.0 and two["mean_served"] == 45.0
+    assert two["half_width"] == pytest.approx(1.96*(50**.5)/2**.5)
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_block_unlinked_when_a_worker_raises(monkeypatch, workers):
+    from multiprocessing import shared_memory
+    made = []
+    rows = batch.SharedRows
+    def recording(n, name=None):
+        made.append(rows(n, name))
+        return made[-1]
+    monkeypatch.setattr(batch, "SharedRows", recording)
+    with ThreadPoolExecutor(workers) as pool:
+        with pytest.raises(ValueError):
+            batch.shared_replications(range(6), "nonsense", SCENARIO, workers=workers,
+                                      pool=pool if workers > 1 else None, chunk=2)
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=made[0].name)
+
+# polls the BatchRun like the gui's after() loop until it is finished
+def poll_until_finished(run, timeout=30):
+    records = []
+    deadline = time.time() + timeout
+    while not run.finished() and time.time() < deadline:
+        records += run.poll()
+        time.sleep(0.01)
+    return records
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_run_streams_records_in_seed_order(workers):
+    run = batch.BatchRun(range(6), "first", SCENARIO, workers)
+    assert run.eta() is None and run.rate() == 0.0
+    run.start()
+    records = poll_until_finished(run)
+    assert [record.seed for record in records] == list(range(6))
+    assert [record.observation() for record in records] == serial(range(6))
+    assert run.done == 6 and run.total_survival == pytest.approx(sum(obs[0] for obs in serial(range(6))))
+    assert run.eta() == 0 and run.rate() > 0
+    run.thread.join(5)
+    assert not run.thread.is_alive()
+
+def test_batch_run_cancel_stops_the_thread():
+    run = batch.BatchRun(range(100000), "first", SCENARIO, workers=1)
+    run.start()
+    while run.done == 0:
+        run.poll()
+        time.sleep(0.01)
+    run.cancel()
+    run.thread.join(5)
+    assert not run.thread.is_alive() and run.poll() == [] and not run.finished()
+
+def test_batch_run_hands_back_a_failure():
+    run = batch.BatchRun(range(3), "nonsense", SCENARIO, workers=1)
+    run.start()
+    run.thread.join(5)
+    with pytest.raises(ValueError):
+        run.poll()
+    assert run.cancelled and run.done == 0
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+import calibration
+from engine import SERVICE_MEANS
+
+def test_fit_service_means_per_hospital_and_class():
+    hospital = [0, 0, 0, 0, 1, 1, 1]
+    patient_type = [0, 0, 1, 1, 0, 0, 1]
+    minutes = [80, 100, 170, 190, 60, 80, 200]
+    pooled, means, counts = calibration.fit_service(hospital, patient_type, minutes, n_hos=3)
+    assert pooled.tolist() == [80, 560/3]
+    assert counts.tolist() == [[2, 2], [2, 1], [0, 0]]
+    # too few records keep the pooled mean
+    assert means.tolist() == [[90, 180], [70, 560/3], [80, 560/3]]
+
+def test_fit_service_without_a_class_keeps_the_default():
+    pooled, means, counts = calibration.fit_service([0, 0], [0, 0], [50, 70])
+    assert pooled.tolist() == [60, SERVICE_MEANS[1]] and means.shape == (1, 2)
+
+@pytest.mark.parametrize("hospital, patient_type, n_hos", [([0, 3], [0, 1], 3),
+                                                            ([0, -1], [0, 1], None),
+                                                            ([0, 1], [0, 2], None),
+                                                            ([0, 1], [-1, 1], None)])
+def test_fit_service_refuses_bad_records(hospital, patient_type, n_hos):
+    with pytest.raises(ValueError):
+        calibration.fit_service(hospital, patient_type, [90, 180], n_hos)
+
+def test_fit_travel_recovers_the_lognormal():
+    rng = np.random.default_rng(1)
+    distance = rng.uniform(2, 8, 20000)
+    minutes = 60*rng.lognormal(0.03*distance, 0.01*distance)
+    hospital = rng.integers(0, 2, len(distance))
+    (mu, sigma), mus, sigmas, counts = calibration.fit_travel(hospital, distance, minutes)
+    assert mu == pytest.approx(0.03, abs=1e-3) and sigma == pytest.approx(0.01, abs=1e-3)
+    assert counts.sum() == len(distance) and mus == pytest.approx([0.03, 0.03], abs=1e-3)
+    with pytest.raises(ValueError):
+        calibration.fit_travel(hospital, distance, minutes, n_hos=1)
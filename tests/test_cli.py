@@ -0,0 +1,46 @@
+import csv
+import os
+import subprocess
+import sys
+import pytest
+import batch
+import hospital_queue
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SMALL = ["--imm", "5", "--del", "10", "--ambulances", "3"]
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=5, n_del=10, n_ambs=3)
+
+def python(code, stream="stdout"):
+    return getattr(subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True), stream)
+
+def test_start_up_imports_no_gui_and_no_numpy():
+    loaded = python("import sys, hospital_queue\nhospital_queue.make_parser()\nprint(' '.join(sys.modules))").split()
+    assert not {"numpy", "tkinter", "matplotlib"} & set(loaded)
+
+def test_run_imports_no_gui():
+    modules = python("import sys, hospital_queue\nhospital_queue.main(['run', '--seed', '3'])\n"
+                     "print(' '.join(sys.modules), file=sys.stderr)", stream="stderr").split()
+    assert "numpy" in modules and not {"tkinter", "matplotlib"} & set(modules)
+
+def test_run_prints_the_replication():
+    out = subprocess.run([sys.executable, "-m", "hospital_queue", "run", "--seed", "3", "--selection", "first"] + SMALL,
+                         cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    assert [float(x) for x in out.strip().split(',')] == batch.replicate(3, "first", SCENARIO)
+
+def test_scenario_from_arguments():
+    args = hospital_queue.make_parser().parse_args(["run", "--distances", "1,2", "--imm-servers", "1,1",
+                                                    "--del-servers", "2,2", "--arrival-rate", "0:2,60:0"] + SMALL)
+    assert hospital_queue.scenario(args) == dict(SCENARIO, hos_dists=[1.0, 2.0], imm_servers=[1, 1],
+                                                 del_servers=[2, 2], arrival_rate=[[0.0, 2.0], [60.0, 0.0]])
+    for bad in (["--distances", "1,2"], ["--arrival-rate", "2"]):
+        with pytest.raises(SystemExit):
+            hospital_queue.scenario(hospital_queue.make_parser().parse_args(["run"] + bad))
+
+def test_sweep_writes_the_replications(tmp_path):
+    out = str(tmp_path/"{selection}.csv")
+    hospital_queue.main(["sweep", "--selection", "first", "last", "--replications", "4", "--first-seed", "2",
+                         "--workers", "1", "--quiet", "--out", out] + SMALL)
+    for selection in ("first", "last"):
+        with open(out.replace("{selection}", selection)) as infile:
+            rows = [[float(x) for x in row] for row in csv.reader(infile)]
+        assert rows == [batch.replicate(seed, selection, SCENARIO) for seed in range(2, 6)]
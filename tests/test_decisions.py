@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+import batch
+import engine
+from policies import POLICIES
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=20, n_del=40, n_ambs=4)
+
+@pytest.mark.parametrize("selection", sorted(POLICIES))
+def test_stepper_decisions_and_run_agree(selection):
+    survival = batch.setup(3, selection, SCENARIO)[0].run()
+    sim = batch.setup(3, selection, SCENARIO)[0]
+    assert asyncio.run(sim.run_async()) == survival
+    sim = batch.setup(3, selection, SCENARIO)[0]
+    stepper = engine.Stepper(sim)
+    while not stepper.finished:
+        if stepper.step() is not None:
+            stepper.answer(sim.decide())
+    assert sim.total_survival_probability == survival
+
+def test_wrong_answer_refused():
+    sim = batch.setup(3, "first", dict(SCENARIO, n_imm=0))[0]
+    stepper = engine.Stepper(sim)
+    request = stepper.step()
+    for wrong in [(engine.IMMEDIATE, 0), (engine.DELAYED, 3), (2, 0)]:
+        with pytest.raises(ValueError):
+            stepper.answer(wrong)
+        assert stepper.request is request and not request.answered()
+    assert stepper.answer((engine.DELAYED, 0)).patient_type == engine.DELAYED
+
+def test_wrong_answer_sent_in_sets_error():
+    async def first_two():
+        run = batch.setup(3, "first", dict(SCENARIO, n_imm=0))[0].decisions()
+        request = await run.__anext__()
+        again = await run.asend((engine.IMMEDIATE, 0))
+        assert again is request and isinstance(request.error, ValueError)
+        following = await run.asend((engine.DELAYED, 0))
+        await run.aclose()
+        return request, following
+    request, following = asyncio.run(first_two())
+    assert request.decision == (engine.DELAYED, 0) and request.error is None and following is not request
+
+# every event waits for nothing, and a pickup is answered by the policy after two other events
+class WaitingPacer(object):
+    def __init__(self, sim):
+        self.sim = sim
+        self.events = []
+        self.others = 0
+
+    async def until(self, time, request=None):
+        if request is None:
+            return True
+        if time is None or self.others == 2:
+            request.answer(self.sim.decide())
+            return False
+        self.others += 1
+        return True
+
+    def now(self):
+        return self.sim.clock
+
+    def done(self, kind):
+        self.events.append((kind, self.sim.clock))
+
+def test_waiting_pickup_lets_other_events_go_on():
+    async def run(sim, pacer):
+        waiting = None
+        async for request in sim.decisions(pacer):
+            # leave the first pickup with something else due to the pacer
+            if waiting is None and sim._next_other()[1] is not None:
+                waiting = request
+                seen = len(pacer.events)
+                continue
+            request.answer(sim.decide())
+        return waiting, seen
+
+    sim = batch.setup(3, "first", SCENARIO)[0]
+    pacer = WaitingPacer(sim)
+    waiting, seen = asyncio.run(run(sim, pacer))
+    kinds = [kind for kind, time in pacer.events[seen:]]
+    picked = seen + kinds.index(engine.PICKUP)
+    meanwhile = pacer.events[seen:picked]
+    assert len(meanwhile) == pacer.others > 0
+    assert meanwhile[0][1] > waiting.since and pacer.events[picked][1] >= meanwhile[-1][1]
+    assert waiting.answered() and sim.patients_picked_up == 60
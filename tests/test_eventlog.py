@@ -0,0 +1,43 @@
+import numpy as np
+import batch
+import engine
+import eventlog
+
+def fill(log, n):
+    for i in range(n):
+        log.record(float(i), i % 4, i, -1, i % 3, i, 2*i, 100 - i, 0)
+
+def test_columns_stay_under_the_memory_cap(tmp_path):
+    path = str(tmp_path/"events.bin")
+    log = eventlog.EventLog(path, capacity=4, memory_cap=8*eventlog.EVENT_DTYPE.itemsize)
+    largest = 0
+    for i in range(100):
+        log.record(float(i), i % 4, i, -1, i % 3, i, 2*i, 100 - i, 0)
+        largest = max(largest, log.capacity)
+    assert largest == 8 and log.flushed > 0 and len(log) == 100
+    events = log.events()
+    assert events['time'].tolist() == list(range(100)) and events['queue_del'][-1] == 198
+    log.close()
+    assert log.size == 0 and (eventlog.load(path) == events).all()
+    assert (eventlog.load(path, mmap=True) == events).all()
+
+def test_without_a_path_the_columns_grow():
+    log = eventlog.EventLog(capacity=4, memory_cap=1)
+    fill(log, 50)
+    assert log.flushed == 0 and log.capacity == 64 and log.events()['ambulance'].tolist() == list(range(50))
+
+def test_empty_log_loads(tmp_path):
+    path = str(tmp_path/"events.bin")
+    eventlog.EventLog(path).close()
+    assert len(eventlog.load(path)) == 0 and len(eventlog.load(path, mmap=True)) == 0
+
+def test_a_run_logs_every_event():
+    scenario = dict(batch.MANDALAY_BAY, n_imm=10, n_del=20, n_ambs=4)
+    log = eventlog.EventLog()
+    sim, obs = batch.simulate(3, "first", scenario, log=log)
+    events = log.events()
+    assert obs == batch.replicate(3, "first", scenario)
+    assert (np.diff(events['time']) >= 0).all()
+    assert (events['kind'] == engine.PICKUP).sum() == sim.patients_picked_up == 30
+    assert events['scene_imm'][-1] + events['scene_del'][-1] == 0
+    assert "pickup event" in eventlog.format_events(events[:3])
@@ -0,0 +1,15 @@
+import batch
+import fluid
+import hospital_queue
+
+def test_one_fixed_class_averages_over_the_other():
+    scenario = dict(batch.MANDALAY_BAY, n_imm=80)
+    mean = fluid.expected_survival(scenario, "first")
+    # the delayed count still comes from the draw, so it lies between the fewest and most delayed
+    f = fluid.Fluid(scenario, "first")
+    few, many = f.run(80, 200*.6), f.run(80, 250*.9)
+    assert min(few, many) <= mean <= max(few, many)
+
+def test_cli_with_only_imm(capsys):
+    hospital_queue.main(["fluid", "--selection", "first", "--imm", "80"])
+    assert "fluid survival" in capsys.readouterr().out
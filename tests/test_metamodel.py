@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+import batch
+import metamodel
+
+def test_gp_fits_a_smooth_surface():
+    rng = np.random.default_rng(2)
+    X = rng.uniform(0, 10, (200, 2))
+    y = 3*X[:, 0] - X[:, 1] + rng.normal(0, .1, 200)
+    gp = metamodel.GP().fit(X, y)
+    mean, std = gp.predict([[5, 5], [2, 8]])
+    assert mean == pytest.approx([10, -2], abs=.3) and (std < .3).all()
+
+def test_repeated_rows_become_one_point():
+    X = np.repeat([[0.], [1.], [2.]], 5, axis=0)
+    y = np.repeat([1., 2., 3.], 5) + np.tile([-.2, -.1, 0, .1, .2], 3)
+    gp = metamodel.GP().fit(X, y)
+    assert len(gp.Z) == 3
+    assert gp.predict([[1.]])[0][0] == pytest.approx(2, abs=.1)
+
+def test_subsample_follows_the_seed():
+    X = np.arange(50, dtype=float)[:, None]
+    y = np.sin(X[:, 0]/10)
+    first = metamodel.GP(max_points=20, seed=4).fit(X, y)
+    assert len(first.Z) == 20
+    assert (metamodel.GP(max_points=20, seed=4).fit(X, y).Z == first.Z).all()
+    assert not (metamodel.GP(max_points=20, seed=5).fit(X, y).Z == first.Z).all()
+
+def test_record_and_load(tmp_path):
+    path = str(tmp_path/"store.csv")
+    scenario = dict(batch.MANDALAY_BAY)
+    metamodel.record(path, "first", scenario, [[40.0, 200, 50, 150], [42.0, 210, 55, 155]])
+    metamodel.record(path, "last", scenario, [[30.0, 180, 60, 140]])
+    X, y = metamodel.load(path, "first")
+    assert y.tolist() == [40.0, 42.0]
+    assert X[0].tolist() == metamodel.features(scenario, 50, 150)
+    assert X.shape == (2, len(metamodel.feature_names(3)))
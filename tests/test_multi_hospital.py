@@ -0,0 +1,39 @@
+import numpy as np
+import engine
+import multi_hospital
+
+def scan(hospitals):
+    departures = [hospital.next_departure for hospital in hospitals]
+    first = min(range(len(departures)), key=lambda h: (departures[h], h))
+    return departures[first], first
+
+def test_departures_follow_every_event():
+    n_hos = 200
+    distances = np.random.default_rng(0).uniform(1, 10, n_hos).tolist()
+    sim = multi_hospital.Simulation(300, 500, 40, n_hos, distances, seed=5)
+    departed, hospitals = [], set()
+    while True:
+        upcoming = sim.next_hospital_to_depart
+        kind = engine.Simulation.advance_time(sim)
+        if kind is None:
+            break
+        time, hospital = scan(sim.hospitals)
+        assert sim.departures.top() == (time, hospital)
+        assert sim.next_patient_departure_time == time
+        if time < engine.BIG:
+            assert sim.next_hospital_to_depart == hospital
+        if kind == engine.DEPARTURE:
+            departed.append(sim.clock)
+            hospitals.add(upcoming)
+    assert len(departed) == 800 and departed == sorted(departed) and len(hospitals) > n_hos//2
+
+def test_departure_ties_go_to_the_lowest_hospital():
+    sim = multi_hospital.Simulation(0, 0, 1, 4, [1, 1, 1, 1], seed=1)
+    for number in (3, 1, 2):
+        hospital = sim.hospitals[number]
+        hospital.in_service.append((7.0, number, None))
+        sim._update_departure_time(hospital)
+    assert (sim.next_patient_departure_time, sim.next_hospital_to_depart) == (7.0, 1)
+    sim.hospitals[1].in_service.clear()
+    sim._update_departure_time(sim.hospitals[1])
+    assert sim.next_hospital_to_depart == 2
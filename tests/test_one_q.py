@@ -0,0 +1,40 @@
+import importlib.util
+import os
+import numpy as np
+import pytest
+
+# one-q.py is a script, its name isn't importable
+spec = importlib.util.spec_from_file_location("one_q", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "one-q.py"))
+one_q = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(one_q)
+
+# the recursion one customer at a time on the same draws as lindley(chunk=chunk)
+def loop(n, chunk, seed):
+    rng = np.random.default_rng(seed)
+    waits = []
+    wait = 0.0
+    while len(waits) < n:
+        m = min(chunk, n - len(waits))
+        service = rng.exponential(1./one_q.SERVICE_RATE, m)
+        interarrival = rng.exponential(1./one_q.ARRIVAL_RATE, m)
+        for s, a in zip(service, interarrival):
+            waits.append(wait)
+            wait = max(0.0, wait + s - a)
+    return np.array(waits)
+
+@pytest.mark.parametrize("chunk", [1000, 337, 5000])
+def test_lindley_matches_the_loop(chunk):
+    waits = loop(5000, chunk, 3)
+    wait, system, waited, batch_means = one_q.lindley(5000, chunk=chunk, rng=3)
+    assert wait == pytest.approx(waits.mean())
+    assert waited == np.count_nonzero(waits > 0)/5000
+    assert batch_means == pytest.approx(waits.reshape(one_q.BATCHES, -1).mean(axis=1))
+
+def test_batches_do_not_depend_on_the_chunk():
+    for chunk in (100, 1000, 100000):
+        assert len(one_q.lindley(10001, chunk=chunk, rng=0)[3]) == one_q.BATCHES
+    assert len(one_q.lindley(7, rng=0)[3]) == 7
+
+def test_lindley_near_the_analytic_wait():
+    wait = one_q.lindley(200000, rng=1)[0]
+    assert wait == pytest.approx(one_q.analytic()["wait"], rel=0.1)
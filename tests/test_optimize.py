@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+import batch
+import optimize
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=6, n_del=10, n_ambs=3, imm_servers=[1, 1, 0], del_servers=[1, 1, 1])
+
+def test_neighbors_keep_the_totals():
+    search = optimize.AllocationSearch(SCENARIO, minimum=0)
+    start = search.start_allocation()
+    neighbors = search.neighbors(start)
+    assert len(neighbors) == 2*2 + 3*2
+    assert all(sum(a[0]) == 2 and sum(a[1]) == 3 and min(a[0] + a[1]) >= 0 for a in neighbors)
+    assert optimize.AllocationSearch(SCENARIO, minimum=1).neighbors(start) == []
+
+def test_result_bounds():
+    obs = np.array([40., 42., 44.])
+    result = optimize.Result("a", obs, ["b", "c"], [obs - 1, obs + np.array([1., -3., 1.])], .95, 3)
+    assert result.mean == 42 and result.half_width == pytest.approx(1.959964*2/np.sqrt(3), rel=1e-5)
+    assert result.lower_bounds[0] == pytest.approx(1) and result.lower_bounds[1] < 0
+    assert result.undecided() == ["c"]
+
+def test_one_replication_has_no_half_width():
+    result = optimize.Result(((1,), (1,)), np.array([40.]), [((2,), (0,))], [np.array([39.])], .95, 2)
+    assert result.half_width is None and result.lower_bounds == [None]
+    assert result.undecided() == [((2,), (0,))]
+    assert "+/-" not in result.statement()
+
+def test_search_uses_common_seeds_and_caches():
+    search = optimize.AllocationSearch(SCENARIO, "first", replications=3, workers=1)
+    result = search.run(max_moves=2, confirm_replications=2)
+    assert search.path[0] == search.start_allocation() and search.path[-1] == result.allocation
+    assert len(search.cache[result.allocation]) == 3 and result.replications == 2
+    scenario = optimize.scenario_for(SCENARIO, result.allocation)
+    assert search.cache[result.allocation].tolist() == [batch.replicate(seed, "first", scenario)[0] for seed in range(3)]
@@ -0,0 +1,133 @@
+import csv
+import os
+import pytest
+import batch
+import fluid
+from engine import IMMEDIATE, DELAYED
+import numpy as np
+import engine
+from policies import MyopicPolicy, FirstPolicy, LastPolicy, LinearPolicy, MyopicScorePolicy, make_policy
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+"""
+a StateView with fixed travel and treatment times and a recorded rng
+"""
+class View(object):
+    def __init__(self, scene, servers, travel=(60., 60., 60.), service=(90., 180.)):
+        self.scene = scene
+        self.n_hospitals = len(travel)
+        self.clock = 0.0
+        self.patients_picked_up = 0
+        self.rng = self
+        self._servers = servers
+        self._travel = travel
+        self._service = service
+
+    def random(self):
+        return 0.5
+
+    def servers(self, hospital, patient_type):
+        return self._servers[patient_type][hospital]
+
+    def travel_time(self, hospital):
+        return self._travel[hospital]
+
+    def service_time(self, patient_type, hospital=None):
+        return self._service[patient_type]
+
+def test_simple_policies():
+    view = View((2, 3), [[1, 1, 1], [1, 1, 1]])
+    assert FirstPolicy().decide(view) == (IMMEDIATE, 1)
+    assert LastPolicy().decide(view) == (DELAYED, 1)
+    view.scene = (0, 3)
+    assert FirstPolicy().decide(view) == (DELAYED, 1)
+
+def test_myopic_picks_a_class_at_the_scene():
+    policy = MyopicPolicy()
+    # the delayed reward wins with these times, but only if someone delayed is there
+    assert policy.decide(View((2, 3), [[1, 1, 1], [1, 1, 1]]))[0] == DELAYED
+    assert policy.decide(View((2, 0), [[1, 1, 1], [1, 1, 1]]))[0] == IMMEDIATE
+    assert policy.decide(View((0, 3), [[1, 1, 1], [1, 1, 1]]))[0] == DELAYED
+    # like second.py the hospital is random, not the loop's
+    assert policy.decide(View((2, 3), [[1, 1, 1], [1, 1, 1]]))[1] == 1
+
+def test_myopic_ends_on_the_last_hospital_compared():
+    policy = MyopicPolicy()
+    view = View((2, 3), [[1, 1, 1], [1, 1, 1]])
+    # DELAYED is best at hospital 0, but the later hospitals compare IMMEDIATE at the
+    # best hospital so far with DELAYED there and the last comparison decides
+    rewards = {(IMMEDIATE, 0): 1.0, (IMMEDIATE, 1): 1.0, (IMMEDIATE, 2): 1.0,
+               (DELAYED, 0): 2.0, (DELAYED, 1): 0.5, (DELAYED, 2): 0.5}
+    policy.reward = lambda view, patient_type, hospital: rewards[patient_type, hospital]
+    assert policy.decide(view)[0] == IMMEDIATE
+    rewards[DELAYED, 2] = 3.0
+    assert policy.decide(view)[0] == DELAYED
+
+def test_checked_in_csvs_match_the_engine():
+    for selection in ("random", "first", "last", "myopic"):
+        with open(os.path.join(ROOT, selection + ".csv")) as infile:
+            rows = [row for row in csv.reader(infile) if row]
+        assert len(rows) == batch.REPLICATIONS
+        for seed in range(3):
+            survival, served, n_imm, n_del = batch.replicate(seed, selection)
+            assert float(rows[seed][0]) == pytest.approx(survival)
+            assert [int(x) for x in rows[seed][1:]] == [served, n_imm, n_del]
+
+def test_myopic_ranks_with_last():
+    # the loop ends on the delayed class nearly every time on mandalay bay
+    assert fluid.expected_survival(batch.MANDALAY_BAY, "myopic") == pytest.approx(
+        fluid.expected_survival(batch.MANDALAY_BAY, "last"), rel=0.05)
+    assert isinstance(make_policy("myopic"), MyopicPolicy)
+
+def test_state_arrays_follow_the_run():
+    sim = engine.Simulation(15, 30, 4, 3, [5, 10, 20], [1, 2, 3], [2, 2, 2],
+                            policy=LinearPolicy([[0, -1, 0, 0, -.1, 0], [0, -1, 0, 0, -.1, 1]]), seed=2)
+    while sim.advance_time() is not None:
+        state = sim.state
+        assert state.scene.tolist() == list(sim.scene)
+        for hospital in sim.hospitals:
+            for c in (IMMEDIATE, DELAYED):
+                assert state.busy[c, hospital.number] == hospital.busy[c]
+                assert state.waiting[c, hospital.number] == len(hospital.queues[c])
+                assert state.patients[c, hospital.number] == hospital.busy[c] + len(hospital.queues[c])
+    assert sim.patients_picked_up == 45
+
+def test_batch_decision_needs_someone_at_the_scene():
+    # IMMEDIATE at the farthest hospital scores best, DELAYED at the nearest once nobody immediate is left
+    sim = engine.Simulation(1, 5, 1, 3, [5, 10, 20], [1, 1, 1], [1, 1, 1],
+                            policy=LinearPolicy([[5, 0, 0, 0, .1, 0], [0, 0, 0, 0, -.1, 0]]), seed=0)
+    assert sim.decide() == (IMMEDIATE, 2)
+    sim.pickup_event((IMMEDIATE, 2))
+    assert sim.state.scene.tolist() == [0, 5]
+    assert sim.decide() == (DELAYED, 0)
+
+"""
+StateArrays fields copied out of a running simulation, or stacked along a new first
+dimension, with an rng whose treatment times are the means
+"""
+class Arrays(object):
+    names = ("scene", "patients", "waiting", "busy", "servers", "distances", "service_means", "travel", "clock")
+
+    def __init__(self, states, stack=False):
+        for name in self.names:
+            values = [np.array(getattr(state, name), dtype=float) for state in states]
+            setattr(self, name, np.stack(values) if stack else values[0])
+        self.rng = self
+
+    def exponential(self, means, size):
+        return np.broadcast_to(means, size)
+
+def test_scores_work_on_a_stack_of_states():
+    states = []
+    for seed in range(4):
+        sim = engine.Simulation(10, 20, 3, 3, [5, 10, 20], [1, 2, 3], [2, 2, 2], seed=seed)
+        for i in range(10 + 5*seed):
+            sim.advance_time()
+        states.append(Arrays([sim.state]))
+    stacked = Arrays(states, stack=True)
+    for policy in (LinearPolicy(np.arange(12).reshape(2, 6)/10), MyopicScorePolicy()):
+        scores = policy.score(stacked)
+        assert scores.shape == (4, 2, 3)
+        for state, score in zip(states, scores):
+            assert score == pytest.approx(policy.score(state))
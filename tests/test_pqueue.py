@@ -0,0 +1,26 @@
+import random
+from pqueue import IndexedHeap
+
+# what a scan of the keys in order picks
+def scan(priorities):
+    key = min(range(len(priorities)), key=lambda k: (priorities[k], k))
+    return priorities[key], key
+
+def test_top_follows_every_update():
+    rng = random.Random(0)
+    priorities = [rng.choice([1.0, 2.0, 5.0, 1e30]) for i in range(17)]
+    heap = IndexedHeap(priorities)
+    assert heap.top() == scan(priorities)
+    for i in range(2000):
+        key = rng.randrange(len(priorities))
+        # few distinct values so ties between keys are common
+        priorities[key] = rng.choice([0.5, 1.0, 2.0, 3.0, 1e30])
+        heap.update(key, priorities[key])
+        assert heap.top() == scan(priorities)
+        assert all(heap.position[k] == i for i, k in enumerate(heap.heap))
+
+def test_empty_heap():
+    heap = IndexedHeap([])
+    assert len(heap) == 0
+    assert heap.top() is None
+    assert heap.top((1e30, None)) == (1e30, None)
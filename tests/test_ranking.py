@@ -0,0 +1,25 @@
+import pytest
+import batch
+import ranking
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=30, n_del=90)
+
+def test_kn_constants():
+    # eta = ((2*alpha/(k - 1))**(-2/(n0 - 1)) - 1)/2 and h^2 = 2*eta*(n0 - 1)
+    kn = ranking.KN(["first", "last"], pcs=.95, n0=10)
+    assert kn.h2 == pytest.approx(2*.5*(0.1**(-2/9) - 1)*9)
+    assert kn.h2 == pytest.approx(6.0129, abs=1e-4)
+    kn = ranking.KN(["random", "first", "last", "myopic"], pcs=.9, n0=20)
+    assert kn.h2 == pytest.approx(19*((2*.1/3)**(-2/19) - 1))
+
+def test_kn_arguments():
+    with pytest.raises(ValueError):
+        ranking.KN(["first"])
+    with pytest.raises(ValueError):
+        ranking.KN(["first", "last"], n0=1)
+
+def test_kn_picks_the_clear_winner():
+    kn = ranking.KN(["first", "last"], SCENARIO, n0=5, max_replications=50, workers=1)
+    assert kn.run() == "last"
+    assert kn.eliminated.keys() == {"first"}
+    assert len(kn.obs["first"]) == len(kn.obs["last"])
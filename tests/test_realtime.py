@@ -0,0 +1,108 @@
+import asyncio
+import time
+import pytest
+import batch
+import hospital_queue
+import realtime
+from engine import IMMEDIATE, DELAYED
+
+def last_line(capsys):
+    return capsys.readouterr().out.strip().splitlines()[-1]
+
+@pytest.mark.parametrize("argv", [["--selection", "myopic"], ["--selection", "first", "--arrival-rate", "0:2,60:0"]])
+def test_live_runs_the_same_replication_as_run(argv, capsys):
+    hospital_queue.main(["run", "--seed", "3"] + argv)
+    survival, served = last_line(capsys).split(",")[:2]
+    hospital_queue.main(["live", "--seed", "3", "--scale", "1e12"] + argv)
+    assert last_line(capsys).startswith("total survival %.2f, %s served" % (float(survival), served))
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=3, n_del=4, n_ambs=3)
+
+class Clock(object):
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+"""
+a run where the fake clock is at each event's wall time as it comes due, plus
+late[i] seconds for the i-th event, so nothing ever sleeps
+"""
+def paced_run(late, max_drift=1.0):
+    sim = batch.setup(3, "first", SCENARIO)[0]
+    clock = Clock()
+    events = []
+    def on_event(kind, sim):
+        events.append(kind)
+        t, next_kind = sim.next_event()
+        if next_kind is not None:
+            clock.now = runner.wall_time(t) + late.get(len(events), 0.0)
+    runner = realtime.RealTimeRunner(sim, scale=60, max_drift=max_drift, on_event=on_event, clock=clock)
+    survival = asyncio.run(runner.run())
+    return runner, survival, events
+
+def test_paced_run_is_the_plain_run():
+    runner, survival, events = paced_run({})
+    assert survival == batch.simulate(3, "first", SCENARIO)[0].total_survival_probability
+    assert runner.rebased == 0 and runner.worst_drift == 0
+
+def test_late_event_moves_the_schedule():
+    runner, survival, events = paced_run({5: 0.5})
+    assert runner.rebased == 0 and runner.worst_drift == pytest.approx(0.5)
+    runner, survival, events = paced_run({5: 30.0, 9: 2.0})
+    assert runner.rebased == 2 and runner.worst_drift == 1.0
+    # the schedule moved by the lateness, so the events after are on time again
+    assert survival == batch.simulate(3, "first", SCENARIO)[0].total_survival_probability
+
+"""
+an operator run on a clock that stays put, so after the first pickups nothing is due
+and the runner waits on the operator, test(runner, clock) runs meanwhile
+"""
+def with_operator(test, scenario=SCENARIO):
+    sim = batch.setup(3, "first", scenario)[0]
+    clock = Clock(100.0)
+    runner = realtime.RealTimeRunner(sim, scale=60, operator=True, clock=clock)
+    async def main():
+        task = asyncio.ensure_future(runner.run())
+        try:
+            return await test(runner, clock)
+        finally:
+            task.cancel()
+    return asyncio.run(main())
+
+def test_pause_resume_and_scale():
+    async def test(runner, clock):
+        await runner.next_request()
+        assert runner.sim_time() == 0
+        clock.now = 130.0
+        assert runner.sim_time() == pytest.approx(30)
+        runner.pause()
+        clock.now = 500.0
+        assert runner.sim_time() == pytest.approx(30)
+        runner.resume()
+        clock.now = 510.0
+        assert runner.sim_time() == pytest.approx(40)
+        runner.set_scale(120)
+        assert runner.sim_time() == pytest.approx(40)
+        clock.now = 520.0
+        assert runner.sim_time() == pytest.approx(60)
+        with pytest.raises(ValueError):
+            runner.set_scale(0)
+    with_operator(test)
+
+def test_operator_decides():
+    async def test(runner, clock):
+        request = await runner.next_request()
+        assert request.scene == [0, 4]
+        # nobody immediate at the scene and no hospital 7, the pickup keeps waiting
+        for patient_type, hospital in [(IMMEDIATE, 0), (DELAYED, 7)]:
+            with pytest.raises(ValueError):
+                await runner.decide(patient_type, hospital)
+        assert await runner.next_request() is request and not request.answered()
+        patient = await runner.decide(DELAYED, 2)
+        assert (patient.patient_type, patient.hospital_number) == (DELAYED, 2)
+        assert request.patient is patient and runner.sim.scene == [0, 3]
+        # the next ambulance's pickup is the next request
+        assert await runner.next_request() is not request
+    with_operator(test, dict(SCENARIO, n_imm=0))
@@ -0,0 +1,55 @@
+import json
+import batch
+import engine
+import registry
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=10, n_del=20)
+
+def write(path, text):
+    with open(path, 'w') as outfile:
+        outfile.write(text)
+    return str(path)
+
+def test_second_run_reads_back(tmp_path, monkeypatch):
+    path = str(tmp_path/"runs.db")
+    first = registry.run_registered(path, range(3), "first", SCENARIO, workers=1)
+    assert first == [batch.replicate(seed, "first", SCENARIO) for seed in range(3)]
+    def fail(*args):
+        raise AssertionError("simulated a stored replication")
+    monkeypatch.setattr(batch, "replicate", fail)
+    assert registry.run_registered(path, range(3), "first", SCENARIO, workers=1) == first
+
+def test_miss_on_other_selection_or_seed(tmp_path):
+    store = registry.Registry(str(tmp_path/"runs.db"))
+    store.store(SCENARIO, "first", [(0, [1.0, 2, 3, 4])])
+    assert store.lookup(SCENARIO, "first", [0, 1]) == {0: [1.0, 2, 3, 4]}
+    assert store.lookup(SCENARIO, "last", [0]) == {}
+    assert store.lookup(dict(SCENARIO, n_ambs=29), "first", [0]) == {}
+    store.close()
+
+def test_hash_follows_params_contents(tmp_path, monkeypatch):
+    monkeypatch.delenv(engine.PARAMS_ENV, raising=False)
+    params = write(tmp_path/"params.json", json.dumps({"travel_scale": 60}))
+    scenario = dict(SCENARIO, params=params)
+    before = registry.scenario_hash(scenario)
+    # the same parameters under another name or given as a dict are the same scenario
+    other = write(tmp_path/"other.json", json.dumps({"travel_scale": 60}))
+    assert registry.scenario_hash(dict(SCENARIO, params=other)) == before
+    assert registry.scenario_hash(dict(SCENARIO, params={"travel_scale": 60})) == before
+    write(params, json.dumps({"travel_scale": 50, "pad": "changes the size"}))
+    assert registry.scenario_hash(scenario) != before
+
+def test_hash_follows_params_environment(tmp_path, monkeypatch):
+    monkeypatch.delenv(engine.PARAMS_ENV, raising=False)
+    plain = registry.scenario_hash(SCENARIO)
+    monkeypatch.setenv(engine.PARAMS_ENV, write(tmp_path/"params.json", json.dumps({"travel_scale": 50})))
+    assert registry.scenario_hash(SCENARIO) != plain
+    assert registry.scenario_hash(SCENARIO) == registry.scenario_hash(dict(SCENARIO, params={"travel_scale": 50}))
+
+def test_hash_follows_arrival_log_contents(tmp_path):
+    log = write(tmp_path/"incident.csv", "time,type\n1.0,0\n2.0,1\n")
+    scenario = dict(SCENARIO, arrival_log=log)
+    before = registry.scenario_hash(scenario)
+    assert registry.scenario_hash(dict(SCENARIO, arrival_log=write(tmp_path/"copy.csv", "time,type\n1.0,0\n2.0,1\n"))) == before
+    write(log, "time,type\n1.0,0\n2.0,1\n3.0,1\n")
+    assert registry.scenario_hash(scenario) != before
@@ -0,0 +1,31 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import batch
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=20, n_del=40, n_ambs=5)
+TASKS = [(seed, selection) for seed in range(12) for selection in ("random", "myopic")]
+
+def test_threads_reproduce_the_serial_runs():
+    serial = [batch.replicate(seed, selection, SCENARIO) for seed, selection in TASKS]
+    with ThreadPoolExecutor(8) as pool:
+        for attempt in range(3):
+            threaded = list(pool.map(lambda task: batch.replicate(task[0], task[1], SCENARIO), TASKS))
+            assert threaded == serial
+
+def test_a_run_leaves_the_global_generators_alone():
+    np.random.seed(7)
+    random.seed(7)
+    expected = np.random.random(), random.random()
+    np.random.seed(7)
+    random.seed(7)
+    batch.replicate(3, "random", SCENARIO)
+    batch.replicate(3, "myopic", batch.MANDALAY_BAY)
+    assert (np.random.random(), random.random()) == expected
+
+def test_seed_or_generator():
+    assert batch.replicate(4, "random") == batch.replicate(4, "random")
+    assert batch.replicate(4, "random") != batch.replicate(5, "random")
+    num_imm, num_del = batch.mandalay_bay(np.random.default_rng(4))
+    assert (num_imm, num_del) == batch.mandalay_bay(4) and type(num_imm) is int and type(num_del) is int
+    assert 200 <= num_imm + num_del <= 250
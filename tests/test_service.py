@@ -0,0 +1,115 @@
+import json
+import pytest
+import engine
+import service
+
+JOB = {"n_ambs": 30, "hos_dists": [5.59, 4.24, 6.95], "imm_servers": [6, 5, 0], "del_servers": [15, 12, 8]}
+
+def test_parse_job():
+    scenario, selection, seeds = service.parse_job(dict(JOB, selection="first", seed=5, replications=3))
+    assert scenario == JOB and selection == "first" and seeds == range(5, 8)
+
+@pytest.mark.parametrize("keys", [{"arrival_rate": [[0, 2]]},
+                                  {"arrival_rate": [[0, 3], [60, 1]]},
+                                  {"arrival_rate": [[0, 2]], "arrival_horizon": float("inf")},
+                                  {"arrival_rate": [[0, 2]], "arrival_horizon": -1},
+                                  {"arrival_rate": [[0, 2]], "arrival_horizon": "60"},
+                                  {"arrival_rate": [[0, 2]], "arrival_horizon": True},
+                                  {"arrival_rate": [[0, -2], [60, 0]]},
+                                  {"arrival_rate": [[0, float("nan")], [60, 0]]},
+                                  {"arrival_rate": [[0, 2, 3], [60, 0]]},
+                                  {"arrival_rate": []},
+                                  {"arrival_rate": 2, "arrival_horizon": 60},
+                                  {"arrival_rate": [[0, 3], [60, 0]], "arrival_imm": 1.5},
+                                  {"arrival_horizon": 60}])
+def test_unbounded_or_bad_arrivals_refused(keys):
+    with pytest.raises(service.RequestError) as error:
+        service.parse_job(dict(JOB, **keys))
+    assert error.value.status == 400
+
+@pytest.mark.parametrize("keys", [{"arrival_rate": [[0, 2]], "arrival_horizon": 60},
+                                  {"arrival_rate": [[0, 3], [60, 0]], "arrival_imm": 0.5}])
+def test_bounded_arrivals_accepted(keys):
+    scenario, selection, seeds = service.parse_job(dict(JOB, **keys))
+    assert scenario == dict(JOB, **keys)
+
+def test_job_key_follows_params_environment(tmp_path, monkeypatch):
+    monkeypatch.delenv(engine.PARAMS_ENV, raising=False)
+    plain = service.job_key(JOB, "first", range(10))
+    assert service.job_key(JOB, "first", range(10)) == plain
+    assert service.job_key(JOB, "last", range(10)) != plain
+    path = tmp_path/"params.json"
+    path.write_text(json.dumps({"travel_scale": 50}))
+    monkeypatch.setenv(engine.PARAMS_ENV, str(path))
+    assert service.job_key(JOB, "first", range(10)) != plain
+
+SESSION = dict(JOB, n_imm=3, n_del=4, n_ambs=3)
+
+def test_session_runs_off_the_loop_and_matches_replicate(monkeypatch):
+    import asyncio
+    import threading
+    import batch
+    threads = []
+    setup = batch.setup
+    def recording_setup(*args):
+        threads.append(threading.get_ident())
+        return setup(*args)
+    monkeypatch.setattr(batch, "setup", recording_setup)
+
+    async def incident():
+        svc = service.Service()
+        session = await svc.start_session(SESSION, "first", 3)
+        picked = 0
+        while not session.finished:
+            assert session.describe()["status"] == "waiting"
+            await session.decide({"policy": True})
+            picked += 1
+        svc.threads.shutdown()
+        return session.describe(), picked, threading.get_ident()
+
+    described, picked, loop_thread = asyncio.run(incident())
+    assert threads and loop_thread not in threads
+    assert described["status"] == "done" and picked == described["picked_up"] == 7
+    assert described["survival"] == batch.replicate(3, "first", SESSION)[0]
+
+def test_session_refuses_a_wrong_decision():
+    import asyncio
+
+    async def incident():
+        svc = service.Service()
+        session = await svc.start_session(dict(SESSION, n_imm=0), "first", 3)
+        with pytest.raises(service.RequestError) as error:
+            await session.decide({"patient_type": engine.IMMEDIATE, "hospital": 0})
+        waiting = session.request
+        await session.decide({"patient_type": engine.DELAYED, "hospital": 0})
+        svc.threads.shutdown()
+        return error.value.status, waiting, session.request
+
+    status, waiting, after = asyncio.run(incident())
+    assert status == 409 and waiting is not None and after is not waiting
+
+@pytest.mark.parametrize("keys", [{"n_ambs": service.MAX_SESSION_AMBULANCES + 1},
+                                  {"n_imm": service.MAX_SESSION_PATIENTS, "n_del": 1},
+                                  {"arrival_rate": [[0, 100], [200, 0]]}])
+def test_session_size_capped(keys):
+    with pytest.raises(service.RequestError) as error:
+        service.parse_session(dict(SESSION, **keys))
+    assert error.value.status == 400
+    service.parse_job(dict(SESSION, **keys))
+
+@pytest.mark.parametrize("keys", [{"hos_dists": [5.59, -1, 6.95]},
+                                  {"hos_dists": [5.59, float("inf"), 6.95]},
+                                  {"hos_dists": [5.59, True, 6.95]},
+                                  {"imm_servers": [6, 5.5, 0]},
+                                  {"imm_servers": [6, -1, 0]},
+                                  {"del_servers": [15, True, 8]},
+                                  {"n_ambs": True},
+                                  {"n_ambs": service.MAX_AMBULANCES + 1},
+                                  {"n_imm": service.MAX_PATIENTS + 1},
+                                  {"n_del": -1},
+                                  {"seed": True},
+                                  {"replications": service.MAX_REPLICATIONS + 1}])
+def test_bad_scenario_refused(keys):
+    with pytest.raises(service.RequestError) as error:
+        service.parse_job(dict(JOB, **keys))
+    assert error.value.status == 400
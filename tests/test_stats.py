@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import batch
+import stats
+
+def test_time_averages_integrate_between_changes():
+    averages = stats.TimeAverages(2)
+    # queue of class 0 at hospital 1: 0 until 10, 3 until 15, 1 until 25
+    averages.update(0, 1, 10.0, 0, 0)
+    averages.update(0, 1, 15.0, 3, 1)
+    averages.update(0, 1, 25.0, 1, 2)
+    assert averages.queue_area[0][1] == pytest.approx(3*5 + 1*10)
+    assert averages.busy_area[0][1] == pytest.approx(1*5 + 2*10)
+    assert averages.queue_area[1] == [0.0, 0.0]
+
+def test_queue_area_is_the_summed_wait():
+    sim, obs = batch.simulate(2, "random", dict(batch.MANDALAY_BAY, n_imm=40, n_del=120))
+    report = stats.report(sim)
+    areas = np.array(sim.stats.queue_area)
+    waits = np.array(sim.stats.wait_sum)
+    servers = np.array([[hospital.servers[c] for hospital in sim.hospitals] for c in range(2)])
+    # everyone who queued where there are servers was treated, so the time integral
+    # of the queue length is the total of their waits
+    assert areas[servers > 0] == pytest.approx(waits[servers > 0])
+    utilization = report["utilization"][servers > 0]
+    assert np.all((0 <= utilization) & (utilization <= 1))
+    assert np.all(np.isnan(report["utilization"][servers == 0]))
+
+def test_tdigest_quantiles():
+    values = np.random.default_rng(0).exponential(90, 200000)
+    digest = stats.TDigest()
+    digest.add_many(values)
+    assert digest.count == len(values)
+    for q in (.01, .5, .9, .99):
+        assert digest.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.01)
+    assert digest.quantile(0) == values.min() and digest.quantile(1) == values.max()
+
+def test_tdigest_merge_matches_one_digest():
+    values = np.random.default_rng(1).normal(100, 15, 50000)
+    whole = stats.TDigest()
+    whole.add_many(values)
+    parts = [stats.TDigest() for i in range(4)]
+    for part, chunk in zip(parts, np.array_split(values, 4)):
+        for x in chunk[:500]:
+            part.add(x)
+        part.add_many(chunk[500:])
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    assert merged.count == whole.count
+    for q in (.05, .5, .95):
+        assert merged.quantile(q) == pytest.approx(whole.quantile(q), abs=0.2)
+
+def test_empty_tdigest():
+    assert np.isnan(stats.TDigest().quantile(.5))
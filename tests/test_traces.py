@@ -0,0 +1,25 @@
+import batch
+import traces
+
+SCENARIO = dict(batch.MANDALAY_BAY, n_imm=30, n_del=60)
+
+def test_replay_reproduces_the_run(tmp_path):
+    with traces.TraceRecorder(str(tmp_path)) as recorder:
+        recorded = batch.replicate(4, "random", SCENARIO, recorder)
+    assert recorder.counts[traces.TRAVEL] > 0 and recorder.counts[traces.SERVICE] > 0
+    assert batch.replicate(4, "random", SCENARIO, traces.TraceReplay(str(tmp_path))) == recorded
+
+def test_replay_under_another_policy_scales_to_its_hospitals(tmp_path):
+    with traces.TraceRecorder(str(tmp_path)) as recorder:
+        batch.replicate(4, "random", SCENARIO, recorder)
+    sim, num_imm, num_del = batch.setup(4, "first", SCENARIO, traces.TraceReplay(str(tmp_path), decisions=False))
+    times = []
+    generate = sim.generate_travel_time
+    def travel(distance, hospital_number=None):
+        times.append(generate(distance, hospital_number))
+        return times[-1]
+    sim.generate_travel_time = travel
+    sim.run()
+    assert sim.served > 0
+    # 60*lognormal(.025*distance, .01*distance) for distances 4.24 to 6.95 stays well inside this
+    assert 40 < min(times) and max(times) < 120
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+import numpy as np
+import os
+from array import array
+
+"""
+Variate traces
+Recorded random variates behind the travel and treatment times that drive the engine
+instead of its random numbers
+
+A trace is a directory with one file per stream, raw float64 values (machine byte order)
+in the order the engine asked for them:
+travel.f8: the standard normal of every lognormal generate_travel_time (to the hospital
+and back to the scene)
+service.f8: the standard exponential of every exponential generate_next_departure
+decision.f8: every pickup, patient type*n_hos + hospital number
+
+TraceRecorder writes the streams while a simulation samples them as usual,
+TraceReplay memory maps them and hands the values back without copying, so
+a replay is exactly reproducible and two engine versions can be compared on
+byte identical inputs. The engine scales each variate to the hospital and class
+it is used for (Simulation.scale_travel, scale_service), so the pickup decisions
+can change: they are replayed too unless TraceReplay(path, decisions=False), which
+lets the policy decide again on the same variates (common random numbers for
+comparing policies; the policy's own draws, a random hospital say, are not in the
+trace and come from the simulation's rng).
+
+Simulation(trace=TraceRecorder(path)) records, Simulation(trace=TraceReplay(path)) replays
+"""
+
+TRAVEL = "travel"
+SERVICE = "service"
+DECISION = "decision"
+STREAMS = [TRAVEL, SERVICE, DECISION]
+CHUNK = 65536           # values buffered per stream before they are written
+
+def stream_path(directory, stream):
+    return os.path.join(directory, stream + ".f8")
+
+"""
+TraceRecorder Object
+appends every value to its stream file, CHUNK values at a time
+close() (or leaving a with block) writes what is left
+"""
+class TraceRecorder(object):
+    replaying = False
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.files = {stream: open(stream_path(directory, stream), 'wb') for stream in STREAMS}
+        self.buffers = {stream: array('d') for stream in STREAMS}
+        self.counts = dict.fromkeys(STREAMS, 0)
+
+    def record(self, stream, value):
+        buffer = self.buffers[stream]
+        buffer.append(value)
+        if len(buffer) == CHUNK:
+            self._flush(stream)
+
+    def _flush(self, stream):
+        buffer = self.buffers[stream]
+        buffer.tofile(self.files[stream])
+        self.counts[stream] += len(buffer)
+        del buffer[:]
+
+    def close(self):
+        for stream in STREAMS:
+            self._flush(stream)
+            self.files[stream].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+"""
+TraceReplay Object
+memory maps every stream and returns the values in order, next(stream) is a
+python float read straight from the mapped file
+raises ValueError when a stream runs out
+decisions: replay the recorded pickups instead of asking the policy
+"""
+class TraceReplay(object):
+    replaying = True
+
+    def __init__(self, directory, decisions=True):
+        self.directory = directory
+        self.decisions = decisions and os.path.exists(stream_path(directory, DECISION))
+        self.arrays = {}
+        self.views = {}
+        self.positions = dict.fromkeys(STREAMS, 0)
+        for stream in STREAMS:
+            path = stream_path(directory, stream)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                self.arrays[stream] = np.zeros(0)
+            else:
+                self.arrays[stream] = np.memmap(path, dtype=float, mode='r')
+            # a memoryview indexes to python floats without making numpy scalars
+            self.views[stream] = memoryview(self.arrays[stream])
+
+    def next(self, stream):
+        i = self.positions[stream]
+        try:
+            value = self.views[stream][i]
+        except IndexError:
+            raise ValueError("the %s trace in %s ran out after %d values" % (stream, self.directory, i))
+        self.positions[stream] = i + 1
+        return value
+
+    def __len__(self):
+        return sum(len(array) for array in self.arrays.values())